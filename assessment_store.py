@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Stored verdicts for incremental re-assessment. Each agent-team result is saved
+# with content hashes of the blueprint chunks search_blueprint returned while it
+# was being evaluated, and of the chunks the criterion's own text retrieves. A
+# later run reuses the stored verdict unless the criterion is new, its text
+# changed (it is keyed on the text), any of that evidence changed, or the
+# criterion now retrieves a chunk that wasn't there before - e.g. a new blueprint
+# that adds a setting whose absence made the verdict RED.
+DB_PATH = os.getenv("ASSESSMENT_DB_PATH", os.path.join(os.getcwd(), ".cache", "assessments.db"))
+# Bump when prompts or the agent pipeline change so old verdicts are not reused
+PIPELINE_VERSION = "1"
+
+# Evidence gathered by search_blueprint for the criterion currently being evaluated.
+# Each evaluation runs in its own asyncio task/context, so concurrent criteria don't mix.
+evidence_var = ContextVar("blueprint_evidence", default=None)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def criterion_key(criterion: str) -> str:
+    return content_hash(" ".join(criterion.split()))
+
+
+@contextmanager
+def collect_evidence():
+    evidence = {}
+    token = evidence_var.set(evidence)
+    try:
+        yield evidence
+    finally:
+        evidence_var.reset(token)
+
+
+def record_evidence(chunks):
+    evidence = evidence_var.get()
+    if evidence is None:
+        return
+    for chunk in chunks:
+        evidence[chunk.chunk_id] = content_hash(chunk.text)
+
+
+# Per-file content hashes, keyed on (blueprint id, mtime/size stamp), so a changed
+# blueprint re-hashes only itself; and corpus hashes by store version, since jobs
+# pinned to different versions can be running at once
+_doc_hashes = {}
+_corpus_hashes = {}
+_hash_lock = threading.Lock()
+
+
+def corpus_hash(store):
+    # Used for verdicts that cited no search results at all
+    with _hash_lock:
+        value = _corpus_hashes.get(store.version)
+        if value is not None:
+            return value
+        digest = hashlib.sha256()
+        keys = []
+        for doc_id in store.ids():
+            key = (doc_id, store.stamp(doc_id))
+            if key not in _doc_hashes:
+                _doc_hashes[key] = content_hash(store.get(doc_id))
+            keys.append(key)
+            digest.update(doc_id.encode("utf-8"))
+            digest.update(_doc_hashes[key].encode("ascii"))
+        if len(_doc_hashes) > 2 * len(keys) + 64:
+            for key in set(_doc_hashes) - set(keys):
+                del _doc_hashes[key]
+        if len(_corpus_hashes) >= 8:
+            _corpus_hashes.pop(min(_corpus_hashes))
+        value = _corpus_hashes[store.version] = digest.hexdigest()
+        return value
+
+
+class AssessmentStore:
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS assessments (
+                    criterion_key TEXT PRIMARY KEY,
+                    criterion TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    evidence TEXT NOT NULL,
+                    corpus_hash TEXT NOT NULL,
+                    pipeline_version TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, criterion, index, current_corpus_hash, current_hits=()):
+        """
+        Stored result for the criterion if none of its evidence has changed and
+        every chunk in `current_hits` (its retrieval hits now) was part of it, else None.
+        """
+        row = self._connect().execute(
+            "SELECT result, evidence, corpus_hash, pipeline_version FROM assessments WHERE criterion_key = ?",
+            (criterion_key(criterion),),
+        ).fetchone()
+        if row is None:
+            return None
+        result, evidence, stored_corpus_hash, pipeline_version = row
+        if pipeline_version != PIPELINE_VERSION:
+            return None
+        evidence = json.loads(evidence)
+        for chunk in current_hits:
+            if evidence.get(chunk.chunk_id) != content_hash(chunk.text):
+                return None
+        if not evidence:
+            return result if stored_corpus_hash == current_corpus_hash else None
+        for chunk_id, digest in evidence.items():
+            chunk = index.chunks.get(chunk_id)
+            if chunk is None or content_hash(chunk.text) != digest:
+                return None
+        return result
+
+    def save(self, criterion, result, evidence, current_corpus_hash):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO assessments VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (criterion_key(criterion), criterion, result, json.dumps(evidence, sort_keys=True),
+                 current_corpus_hash, PIPELINE_VERSION, time.time()),
+            )
+
+
+_assessment_store = None
+_assessment_store_lock = threading.Lock()
+
+
+def get_assessment_store() -> AssessmentStore:
+    global _assessment_store
+    with _assessment_store_lock:
+        if _assessment_store is None:
+            _assessment_store = AssessmentStore()
+        return _assessment_store
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# A local stand-in for the Azure OpenAI chat completions endpoint that throttles
+# like the real one: requests draw from a token bucket refilled at `rate` per
+# second (up to `burst`), and once it is empty the reply is a 429 carrying
+# retry-after-ms / retry-after for when the next request would be let through.
+# Point AzureOpenAIChatCompletionClient (or client_pool.PooledClient) at
+# http://127.0.0.1:<port> to exercise retry and adaptive concurrency offline.
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """0 when the request may proceed, otherwise seconds until it could."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+def create_app(rate=20.0, burst=10, latency=0.05):
+    app = FastAPI()
+    bucket = TokenBucket(rate, burst)
+    app.state.counts = {"ok": 0, "throttled": 0}
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        body = await request.json()
+        wait = bucket.take()
+        if wait:
+            app.state.counts["throttled"] += 1
+            headers = {"retry-after-ms": str(int(wait * 1000)), "retry-after": str(max(1, round(wait)))}
+            return JSONResponse({"error": {"code": "429", "message": "Rate limit is exceeded."}}, status_code=429, headers=headers)
+        await asyncio.sleep(latency)
+        app.state.counts["ok"] += 1
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4 + 1
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model") or deployment,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "GREEN"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 1, "total_tokens": prompt_tokens + 1},
+        }
+
+    return app
+
+
+def serve(port=8765, **kwargs):
+    """Run the fake endpoint on a daemon thread; returns the app (for its counts)."""
+    app = create_app(**kwargs)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return app
@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+from collections import defaultdict
+from typing import Any, AsyncGenerator, Mapping, Optional, Sequence, Union
+
+from autogen_core import FunctionCall
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    FunctionExecutionResultMessage,
+    ModelInfo,
+    RequestUsage,
+    SystemMessage,
+)
+
+from blueprint_index import named_identifiers
+
+# Deterministic local stand-in for AzureOpenAIChatCompletionClient. It works out
+# which agent (or the speaker selector) is calling from the prompt, and answers
+# the way the real team converses: plan -> lookup_identifier or search_blueprint
+# call -> analysis -> (remediation when RED) -> summary ending in GREEN/RED and
+# TERMINATE. Latency and token counts are configurable and seeded, so two runs
+# see the same conversation.
+#
+# A recorded transcript can replace the synthetic answers for any role. It is a
+# JSON object mapping role name to a list of responses, replayed in order and then
+# cycled; a response is either a string or {"function": name, "arguments": {...}}.
+
+MODEL_INFO = ModelInfo(vision=False, function_calling=True, json_output=False, family="unknown", structured_output=False)
+ROLES = ("PlanningAgent", "SearchBlueprintAgent", "DataAnalystAgent", "RemediationAgent")
+# The criterion ends its line; prefetched evidence may follow it
+TASK_RE = re.compile(r"satisfied with the current setup scripts: '(.*)'$", re.MULTILINE)
+# Batched tasks (criteria_groups.batch_task) list one numbered criterion per line
+BATCH_RE = re.compile(r"^Criterion (\d+): '(.*)'$", re.MULTILINE)
+STOPWORDS = {"the", "and", "for", "are", "with", "that", "this", "from", "have", "been", "should", "must", "only", "when", "where", "which"}
+
+
+def load_transcript(path):
+    with open(path, "r", encoding="utf-8") as f:
+        transcript = json.load(f)
+    unknown = set(transcript) - set(ROLES) - {"Selector"}
+    if unknown:
+        raise ValueError(f"Unknown roles in transcript: {', '.join(sorted(unknown))}")
+    return transcript
+
+
+def _text(message) -> str:
+    content = getattr(message, "content", "")
+    return content if isinstance(content, str) else str(content)
+
+
+def classify(messages) -> str:
+    first = _text(messages[0]) if messages else ""
+    if "Select an agent to perform task" in first:
+        return "Selector"
+    system = next((_text(m) for m in messages if isinstance(m, SystemMessage)), "")
+    if "planning agent" in system:
+        return "PlanningAgent"
+    if "search agent" in system:
+        return "SearchBlueprintAgent"
+    if "provide a strategy for remediation" in system:
+        return "RemediationAgent"
+    return "DataAnalystAgent"
+
+
+def verdict_for(criterion: str) -> str:
+    # Roughly a third of criteria come back RED, the same ones every run
+    return "RED" if int(hashlib.sha256(criterion.encode("utf-8")).hexdigest(), 16) % 3 == 0 else "GREEN"
+
+
+def unsure_for(criterion: str, fraction: float) -> bool:
+    # The same criteria come out unsure every run, independently of the verdict
+    return int(hashlib.sha256(f"unsure:{criterion}".encode("utf-8")).hexdigest(), 16) % 1000 < fraction * 1000
+
+
+def _tool_name(tool) -> str:
+    # Tools arrive as Tool objects or as ToolSchema dicts
+    return tool.get("name", "") if isinstance(tool, Mapping) else getattr(tool, "name", "")
+
+
+def _sections(batch, verdicts, write):
+    # One "### Criterion <n>" section per batched criterion, or the plain answer for a single one
+    if not batch:
+        return write(verdicts[0])
+    return "\n\n".join(f"### Criterion {n}\n{write(v)}" for n, v in enumerate(verdicts, 1))
+
+
+class SyntheticChatCompletionClient(ChatCompletionClient):
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        completion_tokens: Optional[int] = None,
+        seed: int = 0,
+        transcript: Optional[Mapping[str, list]] = None,
+        uncertain: float = 0.0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.completion_tokens = completion_tokens
+        self._rng = random.Random(seed)
+        self._transcript = dict(transcript or {})
+        # Fraction of analyses answered with low confidence, like a small model on a hard row
+        self.uncertain = uncertain
+        self._positions = defaultdict(int)
+        self._total = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self._last = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self.calls = defaultdict(int)
+
+    async def create(self, messages: Sequence[Any], *, tools: Sequence[Any] = [], **kwargs: Any) -> CreateResult:
+        role = classify(messages)
+        self.calls[role] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self._rng.gauss(self.latency, self.jitter)))
+        content = self._replay(role) if role in self._transcript else self._synthesize(role, messages, tools)
+        prompt_tokens = sum(len(_text(m)) for m in messages) // 4 + 1
+        completion_tokens = self.completion_tokens or len(str(content)) // 4 + 1
+        usage = RequestUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        self._last = usage
+        self._total = RequestUsage(
+            prompt_tokens=self._total.prompt_tokens + prompt_tokens,
+            completion_tokens=self._total.completion_tokens + completion_tokens,
+        )
+        finish_reason = "function_calls" if isinstance(content, list) else "stop"
+        return CreateResult(finish_reason=finish_reason, content=content, usage=usage, cached=False)
+
+    async def create_stream(self, messages: Sequence[Any], **kwargs: Any) -> AsyncGenerator[Union[str, CreateResult], None]:
+        result = await self.create(messages, **kwargs)
+        if isinstance(result.content, str):
+            yield result.content
+        yield result
+
+    def _replay(self, role):
+        responses = self._transcript[role]
+        response = responses[self._positions[role] % len(responses)]
+        self._positions[role] += 1
+        if isinstance(response, dict):
+            call_id = f"call_{role}_{self._positions[role]}"
+            return [FunctionCall(id=call_id, name=response["function"], arguments=json.dumps(response.get("arguments", {})))]
+        return response
+
+    def _synthesize(self, role, messages, tools):
+        history = "\n".join(_text(m) for m in messages)
+        batch = [criterion for _, criterion in BATCH_RE.findall(history)]
+        match = TASK_RE.search(history)
+        criterion = " ".join(batch) if batch else match.group(1) if match else history[:200]
+        verdicts = [verdict_for(c) for c in batch] if batch else [verdict_for(criterion)]
+        verdict = "RED" if "RED" in verdicts else "GREEN"
+        sources = {getattr(m, "source", "") for m in messages}
+        if role == "Selector":
+            # The history sits before the closing instructions, which list every participant
+            conversation = history.split("Read the above conversation")[0]
+            positions = {name: conversation.rfind(f"{name}:") for name in ROLES[1:]}
+            named = max(positions, key=positions.get)
+            return named if positions[named] >= 0 else "SearchBlueprintAgent"
+        if role == "SearchBlueprintAgent":
+            # Like the real agent: exact identifiers are looked up first, keywords searched
+            # otherwise, and a search follows a lookup that found nothing
+            results = [_text(m) for m in messages if isinstance(m, FunctionExecutionResultMessage)]
+            names = {_tool_name(tool) for tool in tools}
+            identifiers = named_identifiers(criterion)
+            if "lookup_identifier" in names and identifiers and not results:
+                return [FunctionCall(id=f"call_{self.calls[role]}", name="lookup_identifier", arguments=json.dumps({"identifiers": ", ".join(identifiers)}))]
+            if "search_blueprint" in names and (not results or (len(results) == 1 and "No blueprint lines match" in results[0])):
+                words = [w for w in re.findall(r"[A-Za-z][A-Za-z0-9]{3,}", criterion) if w.lower() not in STOPWORDS]
+                query = " ".join(words[:6]) or criterion[:60]
+                return [FunctionCall(id=f"call_{self.calls[role]}", name="search_blueprint", arguments=json.dumps({"query": query}))]
+            return "Search complete; the relevant blueprint sections are above."
+        if role == "DataAnalystAgent":
+            confidence = ""
+            if any("Confidence: low" in _text(m) for m in messages if isinstance(m, SystemMessage)):
+                # Asked for by a cascading route
+                unsure = any(unsure_for(c, self.uncertain) for c in (batch or [criterion]))
+                confidence = f"\nConfidence: {'low' if unsure else 'high'}\n"
+            return _sections(batch, verdicts, lambda v: "ANALYSIS: The criterion " + ("is met by" if v == "GREEN" else "is not met by") + f" the retrieved blueprint settings.{confidence or ' '}{v}")
+        if role == "RemediationAgent":
+            remediation = "Remediation: set the required value.\n```powershell\nNew-ItemProperty -Path \"HKLM:\\SOFTWARE\\Example\" -Name Setting -Value 1 -PropertyType DWORD -Force\n```"
+            return _sections(batch, verdicts, lambda v: remediation if v == "RED" else "No remediation needed.")
+        # PlanningAgent: delegate until the analysis (and, for RED, the remediation) is in
+        if "DataAnalystAgent" in sources and (verdict == "GREEN" or "RemediationAgent" in sources):
+            if batch:
+                return _sections(batch, verdicts, lambda v: f"Summary: the blueprints were searched and analysed.\n{v}") + "\nTERMINATE"
+            return f"Summary: the blueprints were searched and analysed for '{criterion[:80]}'.\n{verdict}\nTERMINATE"
+        if "DataAnalystAgent" in sources:
+            return "1. RemediationAgent: provide remediation for the gap identified."
+        if "SearchBlueprintAgent" in sources:
+            return "1. DataAnalystAgent: analyse the retrieved blueprint settings."
+        return "1. SearchBlueprintAgent: search the blueprints for the settings this criterion covers."
+
+    async def close(self) -> None:
+        pass
+
+    def actual_usage(self) -> RequestUsage:
+        return self._last
+
+    def total_usage(self) -> RequestUsage:
+        return self._total
+
+    def count_tokens(self, messages: Sequence[Any], **kwargs: Any) -> int:
+        return sum(len(_text(m)) for m in messages) // 4 + 1
+
+    def remaining_tokens(self, messages: Sequence[Any], **kwargs: Any) -> int:
+        return 128000 - self.count_tokens(messages)
+
+    @property
+    def capabilities(self):
+        return self.model_info
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return MODEL_INFO
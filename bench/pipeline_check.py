@@ -0,0 +1,71 @@
+"""
+Offline check that the default pipeline reaches the search agent's tools - no
+Azure calls.
+
+Runs criteria that name exact identifiers through main.run_batch with
+bench.mock_client and the default settings (prefetched evidence, pipeline
+speaker selection), and exits non-zero unless every one of them called
+lookup_identifier, and the one naming a setting no blueprint has went on to
+search_blueprint (the bounded empty-search retry):
+
+    python -m bench.pipeline_check
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import re
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOOL_CALLS_RE = re.compile(r'^assessor_tool_calls_total\{tool="(\w+)"\} (\S+)$', re.MULTILINE)
+FOUND = [
+    "The RequireSignOrSeal registry value is set to 1.",
+    "The EveryoneIncludesAnonymous registry value is set to 0.",
+]
+MISSING = "The ZqxNotARealSetting registry value is set to 1."
+
+
+def tool_calls(metrics):
+    return {tool: float(value) for tool, value in TOOL_CALLS_RE.findall(metrics.render())}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="pipeline-check-")
+    os.environ["ASSESSMENT_DB_PATH"] = os.path.join(workdir, "assessments.db")
+    os.environ["COMPLETION_CACHE"] = "0"
+    # Only the team path is checked here
+    os.environ["RULES_FAST_PATH"] = "0"
+    for name, value in (("API_KEY", "bench"), ("AZURE_ENDPOINT", "https://bench.invalid"), ("AZURE_DEPLOYMENT", "bench")):
+        os.environ.setdefault(name, value)
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(REPO_ROOT)
+
+    import main as app
+    import metrics
+    from bench.mock_client import SyntheticChatCompletionClient
+
+    app.model_client = app.azure_model_client = SyntheticChatCompletionClient()
+    app.small_model_client = app.small_azure_model_client = None
+    failures = []
+    before = tool_calls(metrics.REGISTRY)
+    for criteria, expected in ((FOUND, {"lookup_identifier": len(FOUND)}), ([MISSING], {"lookup_identifier": 1, "search_blueprint": 1})):
+        checkpoint = app.Checkpoint(os.path.join(workdir, f"{len(failures)}-{criteria[0][:12]}.jsonl"))
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            asyncio.run(app.run_batch(list(enumerate(criteria)), checkpoint, concurrency=2, use_cache=False))
+        after = tool_calls(metrics.REGISTRY)
+        made = {tool: after.get(tool, 0) - before.get(tool, 0) for tool in after}
+        before = after
+        for tool, count in expected.items():
+            status = "ok" if made.get(tool, 0) >= count else "FAIL"
+            print(f"{status:4} {tool}: {made.get(tool, 0):g} calls (expected at least {count}) for {len(criteria)} criteria naming {criteria[0].split()[1]}...")
+            if status != "ok":
+                failures.append(tool)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
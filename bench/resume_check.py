@@ -0,0 +1,120 @@
+"""
+Offline check that resuming a job lists and counts each criterion once - no
+Azure calls.
+
+Starts jobs that already have an ERROR and a STOPPED result among finished
+ones, as a failed or stopped run leaves them, resumes them through
+webserver_ajax.run_team with bench.mock_client (one sequential and one
+parallel), and exits non-zero unless every criterion ends up with a single
+result in spreadsheet order, and the verdict counts, /results totals and the
+CSV/JSON report agree with those results:
+
+    python -m bench.resume_check
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import os
+import sys
+import tempfile
+import uuid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CRITERIA = 6
+ERROR_INDEX = 1
+STOPPED_INDEX = 3
+
+
+def seed_job(w, criteria, concurrency):
+    """A job as a stopped run leaves it: some results, an error, and the criterion it stopped at."""
+    from result_records import ResultRecord
+
+    task_id = str(uuid.uuid4())
+    w.jobs.create(task_id, criteria, concurrency, False)
+    for index, criterion in enumerate(criteria[:STOPPED_INDEX + 1]):
+        if index == ERROR_INDEX:
+            record = ResultRecord.error(criterion, "Error: model call timed out")
+        elif index == STOPPED_INDEX:
+            record = ResultRecord.stopped(criterion)
+        else:
+            record = ResultRecord.create(criterion, "The setting is configured as required. GREEN")
+        w.append_result(task_id, record, index)
+    w.jobs.request_stop(task_id)
+    w.jobs.finish(task_id, "Stopped by user.")
+    return task_id
+
+
+def check_job(w, task_id, criteria):
+    from result_records import verdict_counts
+
+    failures = []
+    rows = w.jobs.rows(task_id)
+    indices = [index for _position, index, _record, _html in rows]
+    if indices != list(range(len(criteria))):
+        failures.append(f"criterion indices {indices}")
+    leftover = [record.verdict.value for _position, _index, record, _html in rows if record.kind != "result"]
+    if leftover:
+        failures.append(f"unfinished results {leftover}")
+    counts = w.jobs.counts(task_id)
+    if counts != verdict_counts(record for _position, _index, record, _html in rows):
+        failures.append(f"verdict counts {counts}")
+    _page, total = w.jobs.query(task_id, limit=0)
+    if total != len(criteria):
+        failures.append(f"/results total {total}")
+    report = w.report_cache.get(task_id)
+    report.catch_up(w.jobs)
+    with open(report.jsonl_path, encoding="utf-8") as f:
+        reported = [json.loads(line) for line in f]
+    if [(row["criterion_index"], row["verdict"]) for row in reported] != \
+            [(index, record.verdict.value) for _position, index, record, _html in rows]:
+        failures.append(f"JSON report {[(row['criterion_index'], row['verdict']) for row in reported]}")
+    with open(report.csv_path, encoding="utf-8", newline="") as f:
+        csv_rows = len(list(csv.reader(f))) - 1
+    if csv_rows != len(criteria):
+        failures.append(f"{csv_rows} CSV rows")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="resume-check-")
+    os.environ["JOB_DB_PATH"] = os.path.join(workdir, "jobs.db")
+    os.environ["ASSESSMENT_DB_PATH"] = os.path.join(workdir, "assessments.db")
+    os.environ["REPORT_DIR"] = os.path.join(workdir, "reports")
+    os.environ["COMPLETION_CACHE"] = "0"
+    os.environ["RESUME_JOBS"] = "0"
+    for name, value in (("API_KEY", "bench"), ("AZURE_ENDPOINT", "https://bench.invalid"), ("AZURE_DEPLOYMENT", "bench")):
+        os.environ.setdefault(name, value)
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(REPO_ROOT)
+
+    import main as app
+    import webserver_ajax as w
+    from bench.mock_client import SyntheticChatCompletionClient
+    from bench.synthetic import synthetic_criteria
+
+    app.model_client = app.azure_model_client = SyntheticChatCompletionClient()
+    app.small_model_client = app.small_azure_model_client = None
+    criteria = synthetic_criteria(CRITERIA, seed=7)
+    failed = False
+    for concurrency in (1, 3):
+        task_id = seed_job(w, criteria, concurrency)
+        if not w.jobs.claim(task_id):
+            print(f"FAIL concurrency {concurrency}: the stopped job could not be claimed")
+            failed = True
+            continue
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            asyncio.run(w.run_team(task_id))
+        failures = check_job(w, task_id, criteria)
+        status = "FAIL" if failures else "ok"
+        print(f"{status:4} concurrency {concurrency}: {len(criteria)} criteria resumed after an ERROR and a STOPPED result"
+              + (f" - {'; '.join(failures)}" if failures else ""))
+        failed = failed or bool(failures)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+"""
+Offline benchmark for the assessment pipeline - no Azure calls.
+
+Runs a whole job (spreadsheet ingestion, rules, agent team, search_blueprint,
+result rendering and the job store) against bench.mock_client, then times
+search_blueprint, render_result_item and /download-docx on their own. Every
+size runs in a fresh process so peak memory is per size, and each result is
+appended as a JSON line tagged with the git commit, so runs can be compared
+between commits:
+
+    python -m bench.run_bench --sizes 10,100,1000 --latency 0.02
+    python -m bench.run_bench --sizes 10,100,1000 --latency 0.02 --baseline old.txt
+
+With --baseline the run exits non-zero when throughput, p95 latency, event-loop
+blocking or peak memory regressed by more than --tolerance against the matching
+baseline entry.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_PREFIX = "BENCH_RESULT "
+# metric -> True when higher is better
+COMPARED = {
+    "criteria_per_sec": True,
+    "criterion_p95_ms": False,
+    "loop_blocked_ms": False,
+    "prompt_tokens_per_criterion": False,
+    "peak_rss_mb": False,
+    "search_per_sec": True,
+    "render_per_sec": True,
+}
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+class LoopMonitor:
+    """Measures how long the event loop was blocked: the lateness of a short periodic sleep."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self._task = None
+
+    async def _watch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - start - self.interval
+            if lag > self.interval:
+                self.blocked += lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def start(self):
+        self._task = asyncio.create_task(self._watch())
+
+    def stop(self):
+        self._task.cancel()
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, dirty
+
+
+def configure_environment(args, workdir):
+    # Isolated stores, so benchmark verdicts never leak into real runs (and vice versa)
+    os.environ["JOB_DB_PATH"] = os.path.join(workdir, "jobs.db")
+    os.environ["ASSESSMENT_DB_PATH"] = os.path.join(workdir, "assessments.db")
+    os.environ["REPORT_DIR"] = os.path.join(workdir, "reports")
+    os.environ["COMPLETION_CACHE"] = "0"
+    os.environ["RESUME_JOBS"] = "0"
+    os.environ["RULES_FAST_PATH"] = "0" if args.no_rules else "1"
+    os.environ["CONTEXT_COMPACTION"] = "0" if args.no_compaction else "1"
+    for name, value in (("API_KEY", "bench"), ("AZURE_ENDPOINT", "https://bench.invalid"), ("AZURE_DEPLOYMENT", "bench")):
+        os.environ.setdefault(name, value)
+
+
+async def bench_job(w, metrics, path, args):
+    samples = []
+    record_criterion = metrics.record_criterion
+
+    def sample(path_name, seconds):
+        samples.append(seconds)
+        record_criterion(path_name, seconds)
+
+    metrics.record_criterion = sample
+    task_id = str(uuid.uuid4())
+    w.jobs.create(task_id, [], args.concurrency, False, source=path, criteria_column="O")
+    monitor = LoopMonitor()
+    monitor.start()
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            await w.run_team(task_id)
+    finally:
+        elapsed = time.perf_counter() - start
+        monitor.stop()
+        metrics.record_criterion = record_criterion
+    job = w.jobs.get(task_id)
+    return task_id, {
+        "status": job.status,
+        "criteria": len(samples),
+        "job_seconds": round(elapsed, 3),
+        "criteria_per_sec": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "criterion_p50_ms": round(percentile(samples, 0.5) * 1000, 2),
+        "criterion_p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+        "loop_blocked_ms": round(monitor.blocked * 1000, 1),
+        "loop_max_lag_ms": round(monitor.max_lag * 1000, 1),
+        "model_calls": job.summary.get("model_calls", 0),
+        "small_model_calls": job.summary.get("small_model_calls", 0),
+        "model_escalations": job.summary.get("model_escalations", 0),
+        "tool_calls": job.summary.get("tool_calls", 0),
+        "prompt_tokens_per_criterion": round(job.summary.get("prompt_tokens", 0) / len(samples), 1) if samples else 0.0,
+    }
+
+
+async def bench_search(main, criteria, count):
+    queries = [criteria[n % len(criteria)] for n in range(count)]
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for query in queries:
+            await main.search_blueprint(query)
+    elapsed = time.perf_counter() - start
+    return {"search_per_sec": round(count / elapsed, 1), "search_mean_ms": round(elapsed / count * 1000, 3)}
+
+
+def bench_render(w, records, count):
+    from result_records import ResultRecord
+
+    records = records or [ResultRecord.create("Criterion", "summary GREEN")]
+    start = time.perf_counter()
+    for n in range(count):
+        w.render_result_item(records[n % len(records)])
+    elapsed = time.perf_counter() - start
+    return {"render_per_sec": round(count / elapsed, 1)}
+
+
+def bench_docx(w, task_id):
+    from fastapi.testclient import TestClient
+
+    client = TestClient(w.app)
+    start = time.perf_counter()
+    response = client.get(f"/download-docx/{task_id}")
+    elapsed = time.perf_counter() - start
+    return {"docx_ms": round(elapsed * 1000, 1), "docx_kb": round(len(response.content) / 1024, 1)}
+
+
+def run_size(args):
+    """One benchmark size, in this process. Returns the result record."""
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    configure_environment(args, workdir)
+
+    from bench.mock_client import SyntheticChatCompletionClient, load_transcript
+    from bench.synthetic import synthetic_criteria, write_annex
+
+    criteria = synthetic_criteria(args.size, seed=args.seed)
+    path = write_annex(os.path.join(workdir, f"annex-{args.size}.xlsx"), criteria)
+
+    import_start = time.perf_counter()
+    import main
+    import metrics
+    import webserver_ajax as w
+    # As the web app's startup hook does, so the first team run doesn't pay for it
+    main.warm_up()
+    import_seconds = time.perf_counter() - import_start
+
+    client = SyntheticChatCompletionClient(
+        latency=args.latency,
+        jitter=args.jitter,
+        completion_tokens=args.completion_tokens,
+        seed=args.seed,
+        transcript=load_transcript(args.transcript) if args.transcript else None,
+    )
+    # The runner picks one of these depending on the job's cache setting
+    main.model_client = main.azure_model_client = client
+    small_client = None
+    if args.cascade is not None:
+        # A faster stand-in for the small deployment, unsure of --cascade of its analyses
+        small_client = SyntheticChatCompletionClient(
+            latency=args.latency / 3, jitter=args.jitter / 3, completion_tokens=args.completion_tokens,
+            seed=args.seed + 1, uncertain=args.cascade,
+        )
+    main.small_model_client = main.small_azure_model_client = small_client
+
+    async def run():
+        task_id, job = await bench_job(w, metrics, path, args)
+        search = await bench_search(main, criteria, min(args.size, 200))
+        return task_id, job, search
+
+    task_id, job, search = asyncio.run(run())
+    record = {"size": args.size, "import_seconds": round(import_seconds, 3)}
+    record.update(job)
+    record.update(search)
+    record.update(bench_render(w, w.jobs.records(task_id), max(args.size, 1000)))
+    record.update(bench_docx(w, task_id))
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    record["peak_rss_mb"] = round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    return record
+
+
+def params(args):
+    run_params = {
+        "concurrency": args.concurrency,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "completion_tokens": args.completion_tokens,
+        "rules": not args.no_rules,
+        "compaction": not args.no_compaction,
+        "transcript": os.path.basename(args.transcript) if args.transcript else None,
+        "seed": args.seed,
+    }
+    if args.cascade is not None:
+        # Only when set, so earlier baselines still match
+        run_params["cascade"] = args.cascade
+    return run_params
+
+
+def spawn(args, size):
+    command = [
+        sys.executable, "-m", "bench.run_bench", "--worker", "--size", str(size),
+        "--concurrency", str(args.concurrency), "--latency", str(args.latency),
+        "--jitter", str(args.jitter), "--seed", str(args.seed),
+    ]
+    if args.completion_tokens:
+        command += ["--completion-tokens", str(args.completion_tokens)]
+    if args.no_rules:
+        command.append("--no-rules")
+    if args.no_compaction:
+        command.append("--no-compaction")
+    if args.transcript:
+        command += ["--transcript", os.path.abspath(args.transcript)]
+    if args.cascade is not None:
+        command += ["--cascade", str(args.cascade)]
+    process = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+    for line in reversed(process.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f"Benchmark for {size} criteria failed:\n{process.stderr[-4000:]}")
+
+
+def load_baseline(path, run_params):
+    baseline = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("params") == run_params:
+                baseline[record["size"]] = record  # the latest matching entry wins
+    return baseline
+
+
+def compare(record, base, tolerance):
+    regressions = []
+    for metric, higher_is_better in COMPARED.items():
+        old, new = base.get(metric), record.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (change < -tolerance) if higher_is_better else (change > tolerance):
+            regressions.append(f"{metric} {old:g} -> {new:g} ({change:+.0%})")
+    return regressions
+
+
+def print_table(records):
+    columns = ["size", "criteria_per_sec", "criterion_p50_ms", "criterion_p95_ms", "loop_blocked_ms", "peak_rss_mb", "search_per_sec", "render_per_sec", "docx_ms"]
+    print("  ".join(f"{c:>16}" for c in columns))
+    for record in records:
+        print("  ".join(f"{record.get(c, ''):>16}" for c in columns))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the assessment pipeline with a mock model client.")
+    parser.add_argument("--sizes", default="10,100,1000", help="comma-separated criteria counts (10 to 5000)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02, help="mean mock completion latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.005, help="standard deviation of the latency, seconds")
+    parser.add_argument("--completion-tokens", type=int, default=None, help="fixed completion token count per call")
+    parser.add_argument("--transcript", default=None, help="JSON transcript to replay instead of synthetic answers")
+    parser.add_argument("--cascade", type=float, default=None, metavar="UNSURE",
+                        help="route roles to a faster small-model stub (MODEL_ROUTES), unsure of this fraction of analyses")
+    parser.add_argument("--no-rules", action="store_true", help="disable the rule-based fast path")
+    parser.add_argument("--no-compaction", action="store_true", help="disable history compaction")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(REPO_ROOT, "bench_output.txt"), help="JSON lines file results are appended to")
+    parser.add_argument("--baseline", default=None, help="earlier output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression before failing")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        print(RESULT_PREFIX + json.dumps(run_size(args)))
+        return 0
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    if any(not 10 <= size <= 5000 for size in sizes):
+        print("Sizes must be between 10 and 5000 criteria", file=sys.stderr)
+        return 2
+    commit, dirty = git_commit()
+    run_params = params(args)
+    baseline = load_baseline(args.baseline, run_params) if args.baseline else {}
+    records = []
+    failed = False
+    for size in sizes:
+        record = spawn(args, size)
+        record.update({
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "params": run_params,
+        })
+        records.append(record)
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        if size in baseline:
+            regressions = compare(record, baseline[size], args.tolerance)
+            for regression in regressions:
+                print(f"REGRESSION [{size} criteria, vs {baseline[size].get('commit')}]: {regression}")
+            failed = failed or bool(regressions)
+    print_table(records)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Cold-start check for the web app - no Azure calls.
+
+Starts `uvicorn webserver_ajax:app` in a fresh process --runs times and measures
+how long each takes to answer its first request (to /metrics), and how long the
+background warm-up (blueprint index, model clients, agents) takes after that. With
+--max-seconds it exits non-zero when the median time to first response is over
+budget, so it can gate a build:
+
+    python -m bench.startup_bench --runs 5 --max-seconds 3
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METRIC_RE = re.compile(r"^(app_startup_seconds|app_warmup_seconds) (\S+)$", re.MULTILINE)
+
+
+def get(url, timeout=1.0):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read().decode("utf-8")
+
+
+def one_start(port, timeout):
+    """(seconds to first response, startup and warm-up seconds reported by the app)"""
+    workdir = tempfile.mkdtemp(prefix="startup-")
+    env = dict(
+        os.environ,
+        JOB_DB_PATH=os.path.join(workdir, "jobs.db"),
+        ASSESSMENT_DB_PATH=os.path.join(workdir, "assessments.db"),
+        REPORT_DIR=os.path.join(workdir, "reports"),
+        RESUME_JOBS="0",
+    )
+    for name, value in (("API_KEY", "bench"), ("AZURE_ENDPOINT", "https://bench.invalid"), ("AZURE_DEPLOYMENT", "bench")):
+        env.setdefault(name, value)
+    command = [sys.executable, "-m", "uvicorn", "webserver_ajax:app", "--port", str(port), "--log-level", "warning"]
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError(f"No response within {timeout:g}s")
+            try:
+                reported = dict(METRIC_RE.findall(get(f"http://127.0.0.1:{port}/metrics")))
+                break
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.02)
+        first_response = time.perf_counter() - start
+        # The warm-up gauge appears once the background warm-up has finished
+        while "app_warmup_seconds" not in reported and time.perf_counter() - start < timeout:
+            time.sleep(0.05)
+            reported = dict(METRIC_RE.findall(get(f"http://127.0.0.1:{port}/metrics")))
+        return first_response, float(reported.get("app_startup_seconds", "nan")), float(reported.get("app_warmup_seconds", "nan"))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--max-seconds", type=float, default=None, help="fail if the median time to first response is higher")
+    args = parser.parse_args(argv)
+
+    samples = []
+    for run in range(args.runs):
+        first_response, startup, warmup = one_start(args.port, args.timeout)
+        samples.append(first_response)
+        print(f"Run {run + 1}: first response after {first_response:.2f}s (app reports startup {startup:.2f}s, warm-up {warmup:.2f}s)")
+    median = statistics.median(samples)
+    print(f"Median time to first response: {median:.2f}s")
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"Over the {args.max_seconds:g}s budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import os
+import random
+
+import openpyxl
+
+from spreadsheet import iter_criteria
+
+# Synthetic annexes for benchmarking: real criteria from the bundled annex,
+# varied so every row is unique, written to column O like the ISM annex.
+DEFAULT_ANNEX = os.path.join("input_spreadsheet", "remediation_annex.xlsx")
+FALLBACK_CRITERIA = [
+    "SMB sessions are disconnected after 15 minutes of idle time.",
+    "LDAP client signing is required.",
+    "Macros in Microsoft Office files originating from the internet are blocked.",
+    "Sessions are locked after 15 minutes of user inactivity.",
+    "Passwords and credentials for network authentication are not stored.",
+    "The Netlogon secure channel requires a strong session key.",
+]
+QUALIFIERS = ["on all workstations", "on all servers", "for privileged users", "for all users", "within the corporate tenant", "on domain controllers"]
+
+
+def template_criteria(annex=DEFAULT_ANNEX):
+    try:
+        return list(iter_criteria(annex)) or FALLBACK_CRITERIA
+    except (OSError, ValueError):
+        return FALLBACK_CRITERIA
+
+
+def synthetic_criteria(count, seed=0, templates=None):
+    rng = random.Random(seed)
+    templates = templates or template_criteria()
+    criteria = []
+    for n in range(count):
+        base = templates[n % len(templates)]
+        if n < len(templates):
+            criteria.append(base)
+        else:
+            criteria.append(f"{base.rstrip('.')} {rng.choice(QUALIFIERS)} (control {n}).")
+    return criteria
+
+
+def write_annex(path, criteria, column=15):
+    """Workbook with a header row and one criterion per row in the given (1-based) column."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    header = [None] * column
+    header[column - 1] = "Requirement"
+    ws.append(header)
+    for n, criterion in enumerate(criteria):
+        row = [None] * column
+        row[0] = f"ISM-{n:04d}"
+        row[column - 1] = criterion
+        ws.append(row)
+    wb.save(path)
+    return path
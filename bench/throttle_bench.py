@@ -0,0 +1,79 @@
+"""
+Throttling benchmark for the pooled model client - no Azure calls.
+
+Starts bench.fake_azure on a local port and sends --requests completions through
+client_pool.PooledClient from --loops event loops at once (each in its own
+thread, like scheduler and web loops), then reports throughput against the
+endpoint's rate, how many calls were throttled, and where the adaptive
+concurrency limit and call rate settled. Exits non-zero when any call failed or
+there were more than --max-throttled-ratio throttled replies per completion:
+
+    python -m bench.throttle_bench --rate 20 --burst 10 --requests 300 --loops 2
+"""
+import argparse
+import asyncio
+import sys
+import threading
+import time
+
+from autogen_core.models import UserMessage
+from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+
+from bench.fake_azure import serve
+from client_pool import AdaptiveLimit, PooledClient
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=float, default=20.0, help="requests per second the fake endpoint allows")
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--loops", type=int, default=2)
+    parser.add_argument("--initial-limit", type=float, default=32.0)
+    # The first wave of --initial-limit calls is throttled beyond --burst whatever the client
+    # does; a client that paces itself afterwards stays well under one 429 per completion
+    parser.add_argument("--max-throttled-ratio", type=float, default=0.75,
+                        help="most throttled replies per completion before the run counts as failed")
+    args = parser.parse_args(argv)
+
+    app = serve(args.port, rate=args.rate, burst=args.burst, latency=args.latency)
+
+    def factory():
+        return AzureOpenAIChatCompletionClient(
+            azure_deployment="bench", model="gpt-5", api_version="2024-12-01-preview",
+            azure_endpoint=f"http://127.0.0.1:{args.port}", api_key="bench", max_retries=0,
+        )
+
+    limit = AdaptiveLimit(initial=args.initial_limit)
+    client = PooledClient(factory, limit, max_retries=20)
+    failures = []
+
+    async def run_loop(count):
+        async def one(n):
+            try:
+                await client.create([UserMessage(content=f"request {n}", source="user")])
+            except Exception as e:
+                failures.append(repr(e))
+        await asyncio.gather(*(one(n) for n in range(count)))
+
+    per_loop = args.requests // args.loops
+    threads = [threading.Thread(target=asyncio.run, args=(run_loop(per_loop),)) for _ in range(args.loops)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done = per_loop * args.loops - len(failures)
+    print(f"{done} completions in {elapsed:.1f}s = {done / elapsed:.1f}/s (endpoint allows {args.rate:g}/s)")
+    throttled = app.state.counts["throttled"]
+    ratio = throttled / done if done else float("inf")
+    print(f"Throttled replies: {throttled} ({ratio:.2f} per completion, at most {args.max_throttled_ratio:g}), failures: {len(failures)}")
+    print(f"Concurrency limit settled at {limit.limit:.1f}, call rate at {limit.rate or 0:.1f}/s")
+    return 1 if failures or ratio > args.max_throttled_ratio else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
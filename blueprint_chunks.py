@@ -0,0 +1,203 @@
+import json
+import os
+import re
+from dataclasses import dataclass
+
+# Splits blueprints on their natural units so retrieval can return just the
+# matching pieces of a 1 MB DSC export instead of its first 4096 characters:
+#   - DSC resource blocks inside "Configuration M365TenantConfig"
+#   - settings entries in Intune Graph JSON exports
+#   - WriteReg / New-ItemProperty calls in configscripts
+# Anything else falls back to blank-line separated paragraphs.
+
+# Chunks bigger than this (e.g. a settings catalog policy with 250 settings)
+# are split again on their nested blocks
+MAX_CHUNK_CHARS = 3000
+
+DSC_RESOURCE_RE = re.compile(r'^(\s*)([A-Za-z][A-Za-z0-9]*)\s+"([^"]*)"\s*$')
+DSC_DISPLAY_NAME_RE = re.compile(r'^\s*(?:DisplayName|Name)\s*=\s*["\']([^"\']*)["\']')
+REG_PATH_RE = re.compile(r'WriteReg\w*\s*\(\s*["\']([^"\']+)["\']\s*\)')
+REG_PROPERTY_RE = re.compile(r'(?:New|Set)-ItemProperty\b.*?-Name\s+["\']?([^\s"\']+)', re.IGNORECASE)
+SETTING_ID_RE = re.compile(r'"settingDefinitionId"\s*:\s*"([^"]+)"')
+
+
+@dataclass(frozen=True)
+class Chunk:
+    chunk_id: str
+    doc_id: str
+    kind: str
+    title: str
+    start_line: int
+    end_line: int
+    text: str
+
+    def index_text(self) -> str:
+        return self.title + "\n" + self.text
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for this kind of content
+    return len(text) // 4 + 1
+
+
+def chunk_blueprint(doc_id: str, text: str):
+    lines = text.split("\n")
+    if "Configuration M365TenantConfig" in text:
+        chunks = _chunk_dsc(doc_id, lines)
+    elif text.lstrip().startswith("{") and '"settings"' in text:
+        chunks = _chunk_intune_json(doc_id, text, lines)
+    elif REG_PATH_RE.search(text) or REG_PROPERTY_RE.search(text):
+        chunks = _chunk_registry_script(doc_id, lines)
+    else:
+        chunks = []
+    return chunks or _chunk_paragraphs(doc_id, lines, 0, len(lines), "text", os.path.basename(doc_id))
+
+
+def _make_chunk(doc_id, kind, title, lines, start, end):
+    # start/end are 0-based [start, end) line offsets; chunks carry 1-based line numbers
+    return Chunk(
+        chunk_id=f"{doc_id}:{start + 1}",
+        doc_id=doc_id,
+        kind=kind,
+        title=title,
+        start_line=start + 1,
+        end_line=end,
+        text="\n".join(lines[start:end]).strip("\n"),
+    )
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def _chunk_dsc(doc_id, lines):
+    chunks = []
+    i = 0
+    while i < len(lines):
+        match = DSC_RESOURCE_RE.match(lines[i])
+        if not match or i + 1 >= len(lines) or lines[i + 1].strip() != "{":
+            i += 1
+            continue
+        indent, resource, name = len(match.group(1)), match.group(2), match.group(3)
+        end = i + 2
+        while end < len(lines) and not (lines[end].strip() == "}" and _indent(lines[end]) == indent):
+            end += 1
+        end = min(end + 1, len(lines))
+        title = f"{os.path.basename(doc_id)}: DSC {resource} \"{name}\""
+        for line in lines[i + 2:end]:
+            if _indent(line) != indent + 4:
+                continue
+            display = DSC_DISPLAY_NAME_RE.match(line)
+            if display and display.group(1) and display.group(1) not in name:
+                title += f" ({display.group(1)})"
+                break
+        chunks.extend(_split_large(doc_id, "dsc", title, lines, i, end))
+        i = end
+    return chunks
+
+
+def _chunk_intune_json(doc_id, text, lines):
+    try:
+        policy = json.loads(text)
+    except ValueError:
+        return []
+    policy_name = policy.get("name") or policy.get("displayName") or os.path.basename(doc_id)
+    base_title = f"{os.path.basename(doc_id)}: Intune policy \"{policy_name}\""
+    start = next((n for n, line in enumerate(lines) if line.strip().startswith('"settings"')), None)
+    if start is None:
+        return []
+    chunks = [_make_chunk(doc_id, "intune", base_title, lines, 0, start)]
+    item_indent = None
+    i = start + 1
+    while i < len(lines):
+        stripped = lines[i].strip()
+        if stripped.startswith("]") and _indent(lines[i]) <= _indent(lines[start]):
+            break
+        if stripped == "{" and (item_indent is None or _indent(lines[i]) == item_indent):
+            item_indent = _indent(lines[i])
+            end = i + 1
+            while end < len(lines) and not (lines[end].strip() in ("}", "},") and _indent(lines[end]) == item_indent):
+                end += 1
+            end = min(end + 1, len(lines))
+            setting = SETTING_ID_RE.search("\n".join(lines[i:end]))
+            title = base_title + (f" setting {setting.group(1)}" if setting else "")
+            chunks.extend(_split_large(doc_id, "intune", title, lines, i, end))
+            i = end
+            continue
+        i += 1
+    return chunks
+
+
+def _chunk_registry_script(doc_id, lines):
+    # The WriteReg("HKLM:\...") call usually sits at the bottom of the script, after
+    # the New-ItemProperty call it feeds, so attach the paths to every property chunk
+    path_lines = [(n, m.group(1)) for n, line in enumerate(lines) for m in [REG_PATH_RE.search(line)] if m]
+    paths = ", ".join(path for _, path in path_lines)
+    chunks = []
+    for n, line in enumerate(lines):
+        match = REG_PROPERTY_RE.search(line)
+        if not match:
+            continue
+        title = f"{os.path.basename(doc_id)}: registry value {match.group(1)}" + (f" under {paths}" if paths else "")
+        chunk = _make_chunk(doc_id, "registry", title, lines, n, n + 1)
+        calls = "\n".join(lines[p].strip() for p, _ in path_lines)
+        chunks.append(Chunk(chunk.chunk_id, doc_id, "registry", title, chunk.start_line, chunk.end_line,
+                            line.strip() + ("\n" + calls if calls else "")))
+    if not chunks:
+        for n, path in path_lines:
+            title = f"{os.path.basename(doc_id)}: registry key {path}"
+            chunks.append(_make_chunk(doc_id, "registry", title, lines, n, n + 1))
+    return chunks
+
+
+def _chunk_paragraphs(doc_id, lines, start, end, kind, title):
+    chunks = []
+    block_start = start
+    size = 0
+    for n in range(start, end):
+        size += len(lines[n]) + 1
+        at_break = not lines[n].strip()
+        if (at_break and size >= MAX_CHUNK_CHARS // 2) or size >= MAX_CHUNK_CHARS or n == end - 1:
+            if any(line.strip() for line in lines[block_start:n + 1]):
+                chunks.append(_make_chunk(doc_id, kind, title, lines, block_start, n + 1))
+            block_start = n + 1
+            size = 0
+    return chunks
+
+
+def _split_large(doc_id, kind, title, lines, start, end):
+    size = sum(len(line) + 1 for line in lines[start:end])
+    if size <= MAX_CHUNK_CHARS or end - start < 3:
+        return [_make_chunk(doc_id, kind, title, lines, start, end)]
+    # Split the body on its shallowest lines (properties / nested items), packing
+    # consecutive units up to the size limit and recursing into any unit still too big
+    body = [n for n in range(start + 1, end - 1) if lines[n].strip() and lines[n].strip() not in ("{", "}")]
+    if not body:
+        return _chunk_paragraphs(doc_id, lines, start, end, kind, title)
+    depth = min(_indent(lines[n]) for n in body)
+    boundaries = [n for n in body if _indent(lines[n]) == depth]
+    units = []
+    for k, unit_start in enumerate(boundaries):
+        unit_end = boundaries[k + 1] if k + 1 < len(boundaries) else end - 1
+        units.append((unit_start, unit_end))
+    if len(units) <= 1:
+        return _chunk_paragraphs(doc_id, lines, start, end, kind, title)
+    chunks = []
+    pack_start, pack_size = None, 0
+    for unit_start, unit_end in units:
+        unit_size = sum(len(line) + 1 for line in lines[unit_start:unit_end])
+        if unit_size > MAX_CHUNK_CHARS:
+            if pack_start is not None:
+                chunks.append(_make_chunk(doc_id, kind, title, lines, pack_start, unit_start))
+                pack_start, pack_size = None, 0
+            chunks.extend(_split_large(doc_id, kind, title, lines, unit_start, unit_end))
+            continue
+        if pack_start is not None and pack_size + unit_size > MAX_CHUNK_CHARS:
+            chunks.append(_make_chunk(doc_id, kind, title, lines, pack_start, unit_start))
+            pack_start, pack_size = None, 0
+        if pack_start is None:
+            pack_start = unit_start
+        pack_size += unit_size
+    if pack_start is not None:
+        chunks.append(_make_chunk(doc_id, kind, title, lines, pack_start, units[-1][1]))
+    return chunks
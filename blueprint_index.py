@@ -0,0 +1,415 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import replace
+
+import numpy as np
+
+from blueprint_chunks import chunk_blueprint, estimate_tokens
+from blueprint_store import get_blueprint_store, snapshot_var
+
+# Lexical (BM25) index over the blueprint chunks, so search_blueprint can rank
+# evidence locally instead of asking the model to pick from a list of file names.
+
+# Approximate token budget and chunk limit for each search_blueprint result
+BLUEPRINT_TOKEN_BUDGET = int(os.getenv("BLUEPRINT_TOKEN_BUDGET", "2000"))
+BLUEPRINT_MAX_CHUNKS = int(os.getenv("BLUEPRINT_MAX_CHUNKS", "8"))
+
+# A "word" keeps the separators used inside identifiers, so registry paths
+# (HKLM:\SYSTEM\...\LanManServer\Parameters), Intune settingDefinitionIds
+# (device_vendor_msft_policy_config_...) and DSC resource names stay together
+# long enough to be indexed whole as well as in pieces.
+WORD_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9_~\\/.:\-]*")
+PART_SPLIT_RE = re.compile(r"[_~\\/.:\-]+")
+CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+HIVE_ALIASES = {
+    "hkey_local_machine": "hklm",
+    "hkey_current_user": "hkcu",
+    "hkey_classes_root": "hkcr",
+    "hkey_users": "hku",
+}
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have",
+    "if", "in", "is", "it", "its", "of", "on", "or", "such", "that", "the", "their",
+    "them", "they", "this", "to", "was", "were", "which", "with", "within",
+}
+
+
+def stem(token: str) -> str:
+    # Deliberately light - identifiers must survive untouched
+    if len(token) > 4 and token.isalpha():
+        if token.endswith("ies"):
+            return token[:-3] + "y"
+        if token.endswith("s") and not token.endswith(("ss", "us", "os", "is")):
+            return token[:-1]
+    return token
+
+
+def tokenize(text: str):
+    tokens = []
+    for word in WORD_RE.findall(text):
+        word = word.rstrip(".:-\\/")
+        lowered = word.lower()
+        for long_name, alias in HIVE_ALIASES.items():
+            if lowered.startswith(long_name):
+                lowered = alias + lowered[len(long_name):]
+        parts = [p for p in PART_SPLIT_RE.split(word) if p]
+        if len(parts) > 1:
+            # Whole identifier, e.g. a full registry path or settingDefinitionId
+            tokens.append(lowered)
+            if "-" in word and all(p.isalpha() for p in parts):
+                # pre-authentication -> preauthentication
+                tokens.append("".join(parts).lower())
+        for part in parts:
+            lowered_part = HIVE_ALIASES.get(part.lower(), part.lower())
+            if lowered_part in STOPWORDS:
+                continue
+            tokens.append(stem(lowered_part))
+            # CamelCase resource and value names: SPOSharingSettings -> spo, sharing, setting
+            pieces = CAMEL_RE.findall(part)
+            if len(pieces) > 1:
+                for piece in pieces:
+                    piece = piece.lower()
+                    if piece not in STOPWORDS and len(piece) > 1:
+                        tokens.append(stem(piece))
+    return tokens
+
+
+def query_terms(query: str):
+    """
+    Query tokens plus adjacent words joined together, so "screen saver timeout"
+    also matches the run-together names used in Intune settingDefinitionIds
+    (..._cpl_personalization_screensavertimeout).
+    """
+    tokens = tokenize(query)
+    words = [w.lower() for w in re.findall(r"[A-Za-z]+", query)]
+    for size in (2, 3):
+        for i in range(len(words) - size + 1):
+            tokens.append(stem("".join(words[i:i + size])))
+    return tokens
+
+
+def identifier_key(word: str) -> str:
+    """
+    Normalised form of an identifier for exact lookup: case-insensitive, short
+    hive names, no "Registry::" prefix or colon after the hive, backslashes only.
+    """
+    key = word.strip("`'\"").rstrip(".:-\\/").lower().replace("/", "\\")
+    if key.startswith("registry::"):
+        key = key[len("registry::"):]
+    for long_name, alias in HIVE_ALIASES.items():
+        if key.startswith(long_name):
+            key = alias + key[len(long_name):]
+    hive, colon, rest = key.partition(":")
+    if colon and hive in HIVE_ALIASES.values():
+        key = hive + rest
+    return key
+
+
+# How a setting is written rather than a word: camelCase/PascalCase humps, underscores or backslashes
+IDENTIFIER_LIKE_RE = re.compile(r"[a-z][A-Z]|_|\\")
+# Product names spelt that way that aren't settings
+PRODUCT_NAMES = {"powershell", "macos", "ios", "ipados", "bitlocker", "onedrive", "sharepoint", "javascript", "devops", "secdevops", "devsecops", "linkedin"}
+
+
+def named_identifiers(text: str):
+    """Words of text written as identifiers (RequireSignOrSeal, PRF_HMAC_SHA2_256, HKLM:\\...), in order."""
+    found = []
+    for word in WORD_RE.findall(text):
+        word = word.rstrip(".:-\\/")
+        if IDENTIFIER_LIKE_RE.search(word) and word.lower() not in PRODUCT_NAMES and word not in found:
+            found.append(word)
+    return found
+
+
+def line_identifiers(line: str):
+    """Keys under which a line can be looked up: each identifier whole, and each of its parts."""
+    keys = set()
+    for word in WORD_RE.findall(line):
+        key = identifier_key(word)
+        if len(key) >= 3:
+            keys.add(key)
+        parts = [p for p in PART_SPLIT_RE.split(key) if len(p) >= 3]
+        if len(parts) > 1:
+            keys.update(parts)
+    return keys
+
+
+class BM25Index:
+    """
+    Incremental BM25 inverted index; documents can be added and removed one at a
+    time. copy() shares the postings lists with the original until they are written.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.doc_lengths = {}
+        self.doc_terms = {}
+        self.total_length = 0
+        self._shared = set()  # terms whose postings still belong to the index this was copied from
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def copy(self):
+        clone = BM25Index(self.k1, self.b)
+        clone.postings = defaultdict(dict, self.postings)
+        clone.doc_lengths = dict(self.doc_lengths)
+        clone.doc_terms = dict(self.doc_terms)
+        clone.total_length = self.total_length
+        clone._shared = set(self.postings)
+        return clone
+
+    def _writable(self, term):
+        docs = self.postings[term]
+        if term in self._shared:
+            docs = self.postings[term] = dict(docs)
+            self._shared.discard(term)
+        return docs
+
+    def add(self, doc_id, text: str):
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self._writable(term)[doc_id] = tf
+        length = sum(counts.values())
+        self.doc_lengths[doc_id] = length
+        self.doc_terms[doc_id] = list(counts)
+        self.total_length += length
+
+    def remove(self, doc_id):
+        if doc_id not in self.doc_lengths:
+            return
+        for term in self.doc_terms.pop(doc_id):
+            if term not in self.postings:
+                continue
+            docs = self._writable(term)
+            docs.pop(doc_id, None)
+            if not docs:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def search(self, query: str, k: int = 10):
+        n = len(self.doc_lengths)
+        if not n:
+            return []
+        avgdl = self.total_length / n or 1.0
+        scores = defaultdict(float)
+        for term in set(query_terms(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avgdl)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:k]
+
+
+class BlueprintIndex:
+    """
+    BM25 index over blueprint chunks, matching one version of a BlueprintStore.
+    An index is never changed once it is in use: updated() returns a new one in
+    which only the files whose mtime/size stamp changed are re-chunked and
+    re-tokenised, sharing everything else with this one. Searches on the old
+    index carry on undisturbed.
+    """
+
+    def __init__(self):
+        self.bm25 = BM25Index()
+        self.stamps = {}
+        self.chunks = {}
+        self.doc_chunks = {}
+        # Exact-identifier index, per file: identifier_key -> 1-based line numbers
+        self.identifiers = {}
+        self.doc_lines = {}
+
+    def updated(self, store):
+        """This index if it already matches `store`, otherwise a new one that does."""
+        current = set(store.ids())
+        removed = [doc_id for doc_id in self.stamps if doc_id not in current]
+        changed = [doc_id for doc_id in current if self.stamps.get(doc_id) != store.stamp(doc_id)]
+        if not removed and not changed:
+            return self
+        index = BlueprintIndex()
+        index.bm25 = self.bm25.copy()
+        index.stamps = dict(self.stamps)
+        index.chunks = dict(self.chunks)
+        index.doc_chunks = dict(self.doc_chunks)
+        index.identifiers = dict(self.identifiers)
+        index.doc_lines = dict(self.doc_lines)
+        for doc_id in removed:
+            index._remove_doc(doc_id)
+        for doc_id in changed:
+            index._remove_doc(doc_id)
+            index._add_doc(doc_id, store.get(doc_id))
+            index.stamps[doc_id] = store.stamp(doc_id)
+        return index
+
+    def _add_doc(self, doc_id, text):
+        chunk_ids = []
+        for chunk in chunk_blueprint(doc_id, text):
+            self.chunks[chunk.chunk_id] = chunk
+            self.bm25.add(chunk.chunk_id, chunk.index_text())
+            chunk_ids.append(chunk.chunk_id)
+        self.doc_chunks[doc_id] = chunk_ids
+        lines = text.split("\n")
+        identifiers = defaultdict(list)
+        for number, line in enumerate(lines, 1):
+            for key in line_identifiers(line):
+                identifiers[key].append(number)
+        self.identifiers[doc_id] = dict(identifiers)
+        self.doc_lines[doc_id] = lines
+
+    def _remove_doc(self, doc_id):
+        for chunk_id in self.doc_chunks.pop(doc_id, []):
+            self.bm25.remove(chunk_id)
+            self.chunks.pop(chunk_id, None)
+        self.identifiers.pop(doc_id, None)
+        self.doc_lines.pop(doc_id, None)
+        self.stamps.pop(doc_id, None)
+
+    def lookup(self, identifier: str):
+        """
+        (doc_id, line number) of every line containing `identifier` exactly, in file
+        order. A registry path that isn't found whole falls back to its last
+        part, i.e. the value name.
+        """
+        key = identifier_key(identifier)
+        matches = [(doc_id, n) for doc_id in sorted(self.identifiers) for n in self.identifiers[doc_id].get(key, ())]
+        parts = [p for p in PART_SPLIT_RE.split(key) if p]
+        if not matches and len(parts) > 1:
+            return self.lookup(parts[-1])
+        return matches
+
+    def chunks_at(self, doc_id, line):
+        """The chunks of a file that contain a line."""
+        return [
+            self.chunks[chunk_id] for chunk_id in self.doc_chunks.get(doc_id, ())
+            if self.chunks[chunk_id].start_line <= line <= self.chunks[chunk_id].end_line
+        ]
+
+    def search(self, query: str, k: int = 10):
+        return [(self.chunks[chunk_id], score) for chunk_id, score in self.bm25.search(query, k)]
+
+    def search_many(self, queries, k: int = 10):
+        """
+        search() for many queries at once. The BM25 weight of every query term in
+        every chunk goes into one matrix, so scoring all queries against all chunks
+        is a single matrix product rather than a postings walk per query.
+        """
+        bm25 = self.bm25
+        chunk_ids = list(bm25.doc_lengths)
+        term_sets = [set(query_terms(query)) for query in queries]
+        vocabulary = sorted(set().union(*term_sets) & bm25.postings.keys())
+        if not chunk_ids or not vocabulary:
+            return [[] for _ in queries]
+        columns = {term: column for column, term in enumerate(vocabulary)}
+        rows = {chunk_id: row for row, chunk_id in enumerate(chunk_ids)}
+        n = len(chunk_ids)
+        lengths = np.fromiter((bm25.doc_lengths[chunk_id] for chunk_id in chunk_ids), dtype=np.float32, count=n)
+        length_norms = bm25.k1 * (1 - bm25.b + bm25.b * lengths / (bm25.total_length / n or 1.0))
+        weights = np.zeros((n, len(vocabulary)), dtype=np.float32)
+        for term, column in columns.items():
+            docs = bm25.postings[term]
+            doc_rows = np.fromiter((rows[chunk_id] for chunk_id in docs), dtype=np.intp, count=len(docs))
+            tf = np.fromiter(docs.values(), dtype=np.float32, count=len(docs))
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            weights[doc_rows, column] = idf * tf * (bm25.k1 + 1) / (tf + length_norms[doc_rows])
+        present = np.zeros((len(queries), len(vocabulary)), dtype=np.float32)
+        for row, terms in enumerate(term_sets):
+            present[row, [columns[term] for term in terms if term in columns]] = 1.0
+        scores = present @ weights.T
+        k = min(k, n)
+        results = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k]
+            top = top[np.argsort(-row[top], kind="stable")]
+            results.append([(self.chunks[chunk_ids[i]], float(row[i])) for i in top if row[i] > 0])
+        return results
+
+    def retrieve(self, query: str, token_budget: int, max_chunks: int = 8, min_score_ratio: float = 0.3):
+        """
+        Best matching chunks for a query that fit in token_budget. Chunks scoring
+        well below the top hit are dropped rather than used to fill the budget.
+        """
+        return select_hits(self.search(query, k=max_chunks * 3), token_budget, max_chunks, min_score_ratio)
+
+    def retrieve_many(self, queries, token_budget: int, max_chunks: int = 8, min_score_ratio: float = 0.3):
+        """retrieve() for each of many queries, scored together by search_many()."""
+        return [
+            select_hits(hits, token_budget, max_chunks, min_score_ratio)
+            for hits in self.search_many(queries, k=max_chunks * 3)
+        ]
+
+
+def select_hits(hits, token_budget: int, max_chunks: int = 8, min_score_ratio: float = 0.3):
+    """The leading (chunk, score) hits that fit in token_budget, best first."""
+    if not hits:
+        return []
+    cutoff = hits[0][1] * min_score_ratio
+    selected, used = [], 0
+    for chunk, score in hits:
+        if score < cutoff or len(selected) >= max_chunks:
+            break
+        cost = estimate_tokens(chunk.title) + estimate_tokens(chunk.text)
+        if used + cost > token_budget:
+            if selected:
+                continue
+            # Always return something: trim the best chunk to the budget
+            chunk = replace(chunk, text=chunk.text[:token_budget * 4] + "\n...[truncated]...")
+            cost = token_budget
+        selected.append((chunk, score))
+        used += cost
+    return selected
+
+
+_index = None
+_index_version = -1
+_index_lock = threading.Lock()
+# (snapshot, index) pinned for the running job by pin_blueprints()
+pinned_var = ContextVar("blueprint_index", default=None)
+
+
+def get_blueprint_index(store) -> BlueprintIndex:
+    """The index matching `store`: the pinned one for a pinned snapshot, otherwise the latest."""
+    global _index, _index_version
+    pinned = pinned_var.get()
+    if pinned is not None and pinned[0] is store:
+        return pinned[1]
+    with _index_lock:
+        index = (_index or BlueprintIndex()).updated(store)
+        # A job still on an older snapshot mustn't wind the shared index back
+        if store.version >= _index_version:
+            _index, _index_version = index, store.version
+        return index
+
+
+@contextmanager
+def pin_blueprints():
+    """
+    Pin the current blueprints and their index for everything run inside, tasks
+    it starts included: get_blueprint_store() and get_blueprint_index() keep
+    returning this version while files are uploaded, edited or deleted.
+    """
+    store = get_blueprint_store()
+    store.refresh()
+    snapshot = store.snapshot()
+    index = get_blueprint_index(snapshot)
+    store_token = snapshot_var.set(snapshot)
+    index_token = pinned_var.set((snapshot, index))
+    try:
+        yield snapshot
+    finally:
+        pinned_var.reset(index_token)
+        snapshot_var.reset(store_token)
@@ -0,0 +1,298 @@
+import codecs
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+# Blueprints are a mix of UTF-8 (with and without BOM) and UTF-16 LE exports
+# (all of automation/dsc). Work the encoding out once from the BOM, decode each
+# file once, and keep the normalised text in memory and on disk so later
+# searches never touch the raw files again unless they change.
+BLUEPRINT_DIR = os.path.join(os.getcwd(), "input_files")
+# One cache file per blueprint, so a changed file rewrites only its own entry
+CACHE_DIR = os.path.join(os.getcwd(), ".cache", "blueprints")
+CACHE_VERSION = 2
+# Largest blueprint the upload API accepts
+BLUEPRINT_MAX_BYTES = int(os.getenv("BLUEPRINT_MAX_BYTES", str(16 * 1024 * 1024)))
+# How often the watcher re-stats the blueprint directory; 0 turns it off
+BLUEPRINT_WATCH_SECONDS = float(os.getenv("BLUEPRINT_WATCH_SECONDS", "2"))
+
+# The snapshot pinned for the running job (see blueprint_index.pin_blueprints).
+# While it is set get_blueprint_store() returns it instead of the live store, so
+# files uploaded, edited or deleted mid-job only show up in the next job.
+snapshot_var = ContextVar("blueprint_snapshot", default=None)
+
+# UTF-32 LE must be checked before UTF-16 LE, its BOM starts with the same bytes
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+def detect_encoding(raw: bytes) -> str:
+    for bom, encoding in BOMS:
+        if raw.startswith(bom):
+            return encoding
+    # No BOM - UTF-16 without a BOM shows up as every other byte being NUL
+    sample = raw[:4096]
+    if sample and sample.count(b"\x00") > len(sample) // 4:
+        return "utf-16-le" if sample[1:2] == b"\x00" else "utf-16-be"
+    try:
+        raw.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def decode_blueprint(raw: bytes):
+    encoding = detect_encoding(raw)
+    text = raw.decode(encoding, errors="replace")
+    return normalise_text(text), encoding
+
+
+def normalise_text(text: str) -> str:
+    return text.lstrip("\ufeff").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def normalise_id(name: str) -> str:
+    """Blueprint id ("dir/file.txt") for an uploaded name; ValueError if it could escape the directory."""
+    doc_id = name.strip().replace("\\", "/").strip("/")
+    parts = doc_id.split("/")
+    if not doc_id or any(part in ("", ".", "..") for part in parts) or ":" in parts[0]:
+        raise ValueError(f"Invalid blueprint name: {name!r}")
+    if not doc_id.lower().endswith(".txt"):
+        # scan() only picks up .txt files
+        raise ValueError(f"Blueprints must be .txt files: {name!r}")
+    return doc_id
+
+
+class BlueprintSnapshot:
+    """
+    The decoded blueprints as they were at one version. The store never changes
+    an entries dict once it has been published - it builds a new one - so a
+    snapshot costs nothing to take and stays consistent while files change.
+    """
+
+    def __init__(self, root: str, entries: dict, version: int):
+        self.root = root
+        self.entries = entries
+        self.version = version
+
+    def refresh(self):
+        # A snapshot never changes; the live store picks up new files
+        return [], []
+
+    def snapshot(self):
+        return self
+
+    def path_for(self, doc_id: str) -> str:
+        return os.path.join(self.root, *doc_id.split("/"))
+
+    def ids(self):
+        return sorted(self.entries)
+
+    def stamp(self, doc_id: str):
+        entry = self.entries.get(doc_id)
+        return (entry["mtime"], entry["size"]) if entry else None
+
+    def get(self, doc_id: str):
+        entry = self.entries.get(doc_id)
+        return entry["text"] if entry else None
+
+    def lookup(self, name: str):
+        """Resolve an absolute path, relative path or bare file name to a blueprint id."""
+        name = name.strip().strip("`").strip('"').strip("'").replace("\\", "/")
+        if name in self.entries:
+            return name
+        if os.path.isabs(name):
+            rel = os.path.relpath(name, self.root.replace("\\", "/")).replace(os.sep, "/")
+            if rel in self.entries:
+                return rel
+        base = os.path.basename(name)
+        for doc_id in self.entries:
+            if os.path.basename(doc_id) == base:
+                return doc_id
+        return None
+
+
+class BlueprintStore(BlueprintSnapshot):
+    """
+    Decoded blueprint files, keyed by their path relative to the blueprint directory.
+    Entries are refreshed only when a file's mtime or size changes; put() and
+    delete() add and remove single files.
+    """
+
+    def __init__(self, root: str = BLUEPRINT_DIR, cache_dir: str = CACHE_DIR):
+        super().__init__(root, {}, 0)
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._load_cache()
+
+    def _cache_file(self, doc_id):
+        return os.path.join(self.cache_dir, hashlib.sha1(doc_id.encode("utf-8")).hexdigest() + ".json")
+
+    def _load_cache(self):
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, name), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print("Ignoring blueprint cache entry: " + str(e))
+                continue
+            if data.get("version") == CACHE_VERSION and data.get("root") == self.root:
+                self.entries[data["doc_id"]] = data["entry"]
+
+    def _save_cache(self, changed, removed):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for doc_id in changed:
+            path = self._cache_file(doc_id)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, "root": self.root, "doc_id": doc_id, "entry": self.entries[doc_id]}, f)
+            os.replace(tmp_path, path)
+        for doc_id in removed:
+            try:
+                os.remove(self._cache_file(doc_id))
+            except FileNotFoundError:
+                pass
+
+    def snapshot(self) -> BlueprintSnapshot:
+        with self._lock:
+            return BlueprintSnapshot(self.root, self.entries, self.version)
+
+    def scan(self):
+        paths = glob.glob(os.path.join(self.root, "**", "*.txt"), recursive=True)
+        return sorted(os.path.relpath(p, self.root).replace(os.sep, "/") for p in paths)
+
+    def refresh(self, doc_ids=None):
+        """
+        Re-stat the blueprint directory (or only `doc_ids`), decoding only new or
+        changed files. Returns (changed, removed) lists of blueprint ids.
+        """
+        with self._lock:
+            full_scan = doc_ids is None
+            candidates = self.scan() if full_scan else list(doc_ids)
+            entries = dict(self.entries)
+            changed, removed = [], []
+            seen = set()
+            for doc_id in candidates:
+                path = self.path_for(doc_id)
+                entry = entries.get(doc_id)
+                try:
+                    st = os.stat(path)
+                    if entry and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                        seen.add(doc_id)
+                        continue
+                    with open(path, "rb") as f:
+                        raw = f.read()
+                except OSError:
+                    # Deleted (or unreadable) before it could be stat'ed or read: treated as removed
+                    continue
+                seen.add(doc_id)
+                entries[doc_id] = self._entry(raw, st)
+                changed.append(doc_id)
+            for doc_id in list(entries) if full_scan else candidates:
+                if doc_id not in seen and doc_id in entries:
+                    del entries[doc_id]
+                    removed.append(doc_id)
+            self._publish(entries, changed, removed)
+            return changed, removed
+
+    def put(self, doc_id: str, raw: bytes) -> str:
+        """Write (or replace) one blueprint file and decode only that file. Returns its id."""
+        doc_id = normalise_id(doc_id)
+        path = self.path_for(doc_id)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Renamed over the target, so the watcher and readers never see half a file
+            tmp_path = f"{path}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(raw)
+            os.replace(tmp_path, path)
+            entries = dict(self.entries)
+            entries[doc_id] = self._entry(raw, os.stat(path))
+            self._publish(entries, [doc_id], [])
+        return doc_id
+
+    def delete(self, doc_id: str) -> str:
+        """Remove one blueprint file; KeyError if there is no such blueprint."""
+        doc_id = normalise_id(doc_id)
+        path = self.path_for(doc_id)
+        with self._lock:
+            if doc_id not in self.entries and not os.path.exists(path):
+                raise KeyError(doc_id)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            entries = dict(self.entries)
+            removed = [doc_id] if entries.pop(doc_id, None) is not None else []
+            self._publish(entries, [], removed)
+        return doc_id
+
+    @staticmethod
+    def _entry(raw, st):
+        text, encoding = decode_blueprint(raw)
+        return {"mtime": st.st_mtime_ns, "size": st.st_size, "encoding": encoding, "text": text}
+
+    def _publish(self, entries, changed, removed):
+        # Called with the lock held; the previous dict is left as it was for the snapshots using it
+        if changed or removed:
+            self.entries = entries
+            self.version += 1
+            self._save_cache(changed, removed)
+
+
+def watch_blueprints(on_change, interval=BLUEPRINT_WATCH_SECONDS):
+    """
+    Re-stat the blueprint directory every `interval` seconds on a daemon thread,
+    calling on_change(changed, removed) when files were added, edited or deleted.
+    Polling needs no extra dependency and also works on bind mounts. Returns an
+    Event that stops the watcher, or None when interval is 0.
+    """
+    if interval <= 0:
+        return None
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                changed, removed = get_blueprint_store().refresh()
+                if changed or removed:
+                    on_change(changed, removed)
+            except Exception as e:
+                # e.g. a file deleted between the scan and the read; the next pass sees it settled
+                print(f"Blueprint watcher: {e}")
+
+    threading.Thread(target=run, name="blueprint-watcher", daemon=True).start()
+    return stop
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_blueprint_store() -> BlueprintSnapshot:
+    """The live store, or the snapshot pinned for the current job."""
+    global _store
+    pinned = snapshot_var.get()
+    if pinned is not None:
+        return pinned
+    with _store_lock:
+        if _store is None:
+            _store = BlueprintStore()
+            changed, removed = _store.refresh()
+            print(f"Blueprint store ready: {len(_store.entries)} files ({len(changed)} decoded, {len(removed)} removed)")
+        return _store
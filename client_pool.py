@@ -0,0 +1,293 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, AsyncGenerator, Callable, Optional, Sequence, Union
+
+from autogen_core.models import ChatCompletionClient, CreateResult, RequestUsage
+
+from metrics import record_concurrency_limit, record_retry
+
+# Model client layer shared by every job and worker thread. httpx connection pools
+# belong to the event loop that created them, so each loop gets its own underlying
+# client (and keep-alive pool) from a factory. All loops share one AIMD limit on
+# concurrent calls: it grows by about one per limit's worth of successful calls and
+# halves on a 429, at most once per back-off period, so a burst of throttled
+# replies doesn't collapse it to nothing. A cap on calls in flight doesn't cap
+# their rate, though, so once throttled the pool also paces when calls start: no
+# call starts before a 429's Retry-After has passed, and calls are spaced out at
+# a rate that starts at half of what was being sent, then grows with successful
+# calls and drops by a quarter on a 429, in step with the limit. Throttled, 5xx
+# and connection failures are retried with full-jitter exponential back-off,
+# honouring Retry-After.
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "6"))
+MODEL_MIN_CONCURRENCY = float(os.getenv("MODEL_MIN_CONCURRENCY", "1"))
+MODEL_MAX_CONCURRENCY = float(os.getenv("MODEL_MAX_CONCURRENCY", "32"))
+MODEL_INITIAL_CONCURRENCY = float(os.getenv("MODEL_INITIAL_CONCURRENCY", "8"))
+# Slowest the pool is paced down to after repeated 429s, in calls per second
+MODEL_MIN_RATE = float(os.getenv("MODEL_MIN_RATE", "0.5"))
+# Call starts this far back make up the rate the pacing starts from
+RATE_WINDOW_SECONDS = 1.0
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+
+
+class AdaptiveLimit:
+    """
+    Additive-increase/multiplicative-decrease cap on calls in flight, and once
+    throttled on the rate calls start at, usable from any number of event loops at
+    once. Waiters are woken on their own loop.
+    """
+
+    def __init__(self, initial=MODEL_INITIAL_CONCURRENCY, minimum=MODEL_MIN_CONCURRENCY, maximum=MODEL_MAX_CONCURRENCY):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._waiters = deque()  # (loop, future)
+        self._lock = threading.Lock()
+        self._hold_until = 0.0
+        self.rate = None  # call starts per second across the pool; None until throttled
+        self._next_start = 0.0
+        self._starts = deque()  # recent call start times
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self.in_flight += 1
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiting = (loop, future) in self._waiters
+                if waiting:
+                    self._waiters.remove((loop, future))
+            if not waiting and not future.cancelled():
+                # Granted just before the cancellation landed
+                self.release()
+            # Otherwise, if a slot was already on its way, _grant hands it back
+            raise
+
+    async def paced(self):
+        """Wait until this call may start: after any Retry-After, and its turn at `rate`."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            if self.rate is not None:
+                self._next_start = start + 1.0 / self.rate
+            self._starts.append(start)
+            while self._starts and self._starts[0] < now - RATE_WINDOW_SECONDS:
+                self._starts.popleft()
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def _wake(self):
+        # Called with the lock held: hand free slots straight to waiters
+        while self._waiters and self.in_flight < int(self.limit):
+            loop, future = self._waiters.popleft()
+            self.in_flight += 1
+            loop.call_soon_threadsafe(self._grant, future)
+
+    def _grant(self, future):
+        if future.done():
+            # Cancelled while the slot was on its way
+            self.release()
+        else:
+            future.set_result(None)
+
+    def succeeded(self):
+        with self._lock:
+            # No growth while backing off after a cut
+            if time.monotonic() >= self._hold_until:
+                self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+                if self.rate is not None:
+                    self.rate += 1.0 / max(self.rate, 1.0)
+                self._wake()
+            record_concurrency_limit(self.limit, self.in_flight, self.rate)
+
+    def throttled(self, server_delay=None):
+        with self._lock:
+            now = time.monotonic()
+            # Replies to calls made before the last cut say nothing new about the limit
+            if now >= self._hold_until:
+                self.limit = max(self.minimum, self.limit / 2)
+                # The first cut paces at half the rate calls went out at, measured over at least
+                # a back-off period so that one burst doesn't read as a huge rate
+                recent = [start for start in self._starts if start >= now - RATE_WINDOW_SECONDS]
+                sent = len(recent) / max(now - recent[0] if recent else 0.0, BACKOFF_BASE_SECONDS)
+                self.rate = max(MODEL_MIN_RATE, sent / 2 if self.rate is None else self.rate * 0.75)
+                self._hold_until = now + max(server_delay or 0.0, BACKOFF_BASE_SECONDS)
+            if server_delay:
+                # Nothing in the pool is let through before the server said it would be
+                self._next_start = max(self._next_start, now + server_delay)
+            record_concurrency_limit(self.limit, self.in_flight, self.rate)
+
+
+def retry_after(error) -> Optional[float]:
+    """Seconds the server asked us to wait, from retry-after-ms or retry-after."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                continue
+    return None
+
+
+def retry_reason(error) -> Optional[str]:
+    # Only needed once a call has failed; the SDK is slow to import
+    import openai
+
+    if isinstance(error, openai.RateLimitError):
+        return "throttled"
+    if isinstance(error, openai.InternalServerError):
+        return "server"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection"
+    return None
+
+
+def backoff(attempt, server_delay=None, rng=random) -> float:
+    # Full jitter, but never sooner than the server asked for
+    delay = rng.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    return max(delay, server_delay or 0.0)
+
+
+class PooledClient(ChatCompletionClient):
+    """
+    A ChatCompletionClient that creates one underlying client per event loop with
+    `factory`, and runs every call under a shared AdaptiveLimit with retries.
+    """
+
+    def __init__(self, factory: Callable[[], ChatCompletionClient], limit: Optional[AdaptiveLimit] = None, max_retries: int = MODEL_MAX_RETRIES):
+        self._factory = factory
+        self._limit = limit or AdaptiveLimit()
+        self._max_retries = max_retries
+        self._clients = weakref.WeakKeyDictionary()  # event loop -> client
+        self._lock = threading.Lock()
+        self._total = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self._last = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self._template = None
+
+    def _client(self) -> ChatCompletionClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                client = self._clients[loop] = self._factory()
+            return client
+
+    def _any_client(self) -> ChatCompletionClient:
+        # For the loop-independent parts of the interface (token counting, model info)
+        with self._lock:
+            if self._template is None:
+                self._template = self._factory()
+            return self._template
+
+    async def create(self, messages: Sequence[Any], **kwargs: Any) -> CreateResult:
+        client = self._client()
+        attempt = 0
+        while True:
+            await self._limit.acquire()
+            try:
+                await self._limit.paced()
+                result = await client.create(messages, **kwargs)
+            except Exception as error:
+                delay = self._should_retry(error, attempt)
+                if delay is None:
+                    raise
+            else:
+                self._limit.succeeded()
+                self._count(result.usage)
+                return result
+            finally:
+                self._limit.release()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def create_stream(self, messages: Sequence[Any], **kwargs: Any) -> AsyncGenerator[Union[str, CreateResult], None]:
+        client = self._client()
+        attempt = 0
+        while True:
+            started = False
+            await self._limit.acquire()
+            try:
+                await self._limit.paced()
+                async for chunk in client.create_stream(messages, **kwargs):
+                    started = True
+                    if isinstance(chunk, CreateResult):
+                        self._limit.succeeded()
+                        self._count(chunk.usage)
+                    yield chunk
+                return
+            except Exception as error:
+                # Only a stream that hasn't produced anything yet can be retried
+                delay = None if started else self._should_retry(error, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self._limit.release()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _should_retry(self, error, attempt) -> Optional[float]:
+        """Back-off before the next attempt, or None when the error should be raised."""
+        reason = retry_reason(error)
+        if reason is None or attempt >= self._max_retries:
+            return None
+        server_delay = retry_after(error)
+        delay = backoff(attempt, server_delay)
+        if reason == "throttled":
+            self._limit.throttled(server_delay)
+        record_retry(reason, delay)
+        return delay
+
+    def _count(self, usage):
+        with self._lock:
+            self._last = usage
+            self._total = RequestUsage(
+                prompt_tokens=self._total.prompt_tokens + usage.prompt_tokens,
+                completion_tokens=self._total.completion_tokens + usage.completion_tokens,
+            )
+
+    async def close(self) -> None:
+        # Only the calling loop's client can be closed from here; the others go with their loops
+        with self._lock:
+            client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self._last
+
+    def total_usage(self) -> RequestUsage:
+        return self._total
+
+    def count_tokens(self, messages, **kwargs) -> int:
+        return self._any_client().count_tokens(messages, **kwargs)
+
+    def remaining_tokens(self, messages, **kwargs) -> int:
+        return self._any_client().remaining_tokens(messages, **kwargs)
+
+    @property
+    def capabilities(self):
+        return self._any_client().capabilities
+
+    @property
+    def model_info(self):
+        return self._any_client().model_info
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Optional
+
+from autogen_core import CacheStore
+from autogen_ext.models.cache import ChatCompletionCache
+
+# On-disk, size-bounded store for autogen's ChatCompletionCache. ChatCompletionCache
+# already hashes the messages, tools and create args into its key; the store adds
+# the model and deployment so a cached gpt-5 answer is never served for another
+# deployment. Re-running an annex against unchanged blueprints then replays
+# every completion from disk.
+CACHE_DIR = os.path.join(os.getcwd(), ".cache", "completions")
+CACHE_MAX_BYTES = int(os.getenv("COMPLETION_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+
+class _DirectoryUsage:
+    # Bytes used by one cache directory, shared by every store (one per model and
+    # deployment) writing to it in this process
+    def __init__(self, total):
+        self.total = total
+        self.lock = threading.Lock()
+
+
+_usage = {}
+_usage_lock = threading.Lock()
+
+
+class DiskLRUStore(CacheStore[Any]):
+    """
+    JSON files on disk, one per key. Reads bump the file's mtime, and writes evict
+    the least recently used entries once the directory grows past max_bytes. Stores
+    on the same directory share one byte count; since other processes (e.g. web
+    workers) write to it too, the directory is measured again before evicting.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES, namespace: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.namespace = namespace
+        os.makedirs(directory, exist_ok=True)
+        with _usage_lock:
+            key = os.path.realpath(directory)
+            if key not in _usage:
+                _usage[key] = _DirectoryUsage(self._measure())
+            self._usage = _usage[key]
+        self._lock = self._usage.lock
+
+    def _measure(self):
+        return sum(size for _, _, size in self._entries())
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(f"{self.namespace}\n{key}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".json")
+
+    def _entries(self):
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_mtime, st.st_size
+
+    def get(self, key: str, default: Optional[Any] = None) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return default
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        data = json.dumps(_to_jsonable(value)).encode("utf-8")
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique across the workers sharing the directory; a failed write leaves nothing behind
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            with self._lock:
+                try:
+                    replaced = os.path.getsize(path)
+                except OSError:
+                    replaced = 0
+                os.replace(tmp_path, path)
+                self._usage.total += len(data) - replaced
+                if self._usage.total > self.max_bytes:
+                    self._usage.total = self._measure()
+                    if self._usage.total > self.max_bytes:
+                        self._evict()
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in list(self._entries()):
+                os.remove(path)
+            self._usage.total = 0
+
+    def _evict(self):
+        # Drop the oldest entries until comfortably under the limit
+        target = self.max_bytes * 0.9
+        for path, _, size in sorted(self._entries(), key=lambda entry: entry[1]):
+            if self._usage.total <= target:
+                break
+            try:
+                os.remove(path)
+                self._usage.total -= size
+            except OSError:
+                pass
+
+
+def _to_jsonable(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    if isinstance(value, list):
+        return [_to_jsonable(item) for item in value]
+    return value
+
+
+def cached_client(client, model: str, deployment: str, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+    store = DiskLRUStore(directory, max_bytes, namespace=f"{model}|{deployment}")
+    return ChatCompletionCache(client, store)
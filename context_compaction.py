@@ -0,0 +1,111 @@
+import os
+import re
+from typing import List
+
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import AssistantMessage, FunctionExecutionResultMessage, LLMMessage, UserMessage
+
+from blueprint_chunks import estimate_tokens
+from metrics import record_compaction
+
+# History compaction for the agents and the speaker selector. search_blueprint
+# output is large and, left alone, rides along in every later turn of every agent.
+# Once the DataAnalystAgent has spoken after a search, that search's output is
+# replaced by a one-line reference to the blueprint sections it returned, as is
+# any evidence attached to the task. The rest of the history is then held under a
+# per-turn token budget by truncating the oldest long messages first; the task and
+# the latest message are never truncated.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+COMPACTION_ENABLED = os.getenv("CONTEXT_COMPACTION", "1") != "0"
+SEARCH_SOURCE = "SearchBlueprintAgent"
+ANALYST_SOURCE = "DataAnalystAgent"
+TRUNCATED_CHARS = 600
+# The section headers search_blueprint writes: --- title [file lines a-b] ---
+SECTION_RE = re.compile(r"^--- (.+) ---$", re.MULTILINE)
+# Introduces blueprint evidence retrieved before the run and attached to the task
+EVIDENCE_HEADER = "Blueprint evidence already retrieved for this task (search_blueprint results; search again only if it is not enough):"
+
+
+def summarize_evidence(text: str) -> str:
+    sections = SECTION_RE.findall(text)
+    if not sections:
+        return truncate(text, 200)
+    return "[Blueprint search results already analysed; sections returned: " + "; ".join(sections) + "]"
+
+
+def truncate(text: str, limit: int = TRUNCATED_CHARS) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:limit].rstrip() + f" ... [truncated {len(text) - limit} chars]"
+
+
+def message_tokens(message) -> int:
+    content = message.content
+    if isinstance(content, str):
+        return estimate_tokens(content)
+    if isinstance(message, FunctionExecutionResultMessage):
+        return sum(estimate_tokens(result.content) for result in content)
+    return estimate_tokens(str(content))
+
+
+def summarize_task_evidence(text: str) -> str:
+    task, _, evidence = text.partition(EVIDENCE_HEADER)
+    return f"{task.rstrip()}\n\n{summarize_evidence(evidence)}"
+
+
+def is_tool_output(message) -> bool:
+    if isinstance(message, FunctionExecutionResultMessage):
+        return True
+    return isinstance(message, UserMessage) and message.source == SEARCH_SOURCE and isinstance(message.content, str)
+
+
+def has_task_evidence(message) -> bool:
+    return isinstance(message, UserMessage) and isinstance(message.content, str) and EVIDENCE_HEADER in message.content
+
+
+def compact(message, shorten):
+    """Copy of a message with its text passed through shorten; other content is left alone."""
+    if isinstance(message, FunctionExecutionResultMessage):
+        return message.model_copy(update={
+            "content": [result.model_copy(update={"content": shorten(result.content)}) for result in message.content]
+        })
+    if isinstance(message, (UserMessage, AssistantMessage)) and isinstance(message.content, str):
+        return message.model_copy(update={"content": shorten(message.content)})
+    return message
+
+
+def _analysed(message, last_analysis, index) -> bool:
+    return index < last_analysis and is_tool_output(message)
+
+
+class CompactingChatCompletionContext(ChatCompletionContext):
+    """Keeps every message, but hands the model a compacted view of them."""
+
+    def __init__(self, token_budget: int = PROMPT_TOKEN_BUDGET, initial_messages: List[LLMMessage] | None = None):
+        super().__init__(initial_messages)
+        self.token_budget = token_budget
+
+    async def get_messages(self) -> List[LLMMessage]:
+        messages = list(self._messages)
+        before = sum(message_tokens(m) for m in messages)
+        last_analysis = max((i for i, m in enumerate(messages) if getattr(m, "source", None) == ANALYST_SOURCE), default=-1)
+        messages = [compact(m, summarize_evidence) if _analysed(m, last_analysis, i) else m for i, m in enumerate(messages)]
+        # Evidence attached to the task is only needed whole until it has been analysed
+        if messages and last_analysis > 0 and has_task_evidence(messages[0]):
+            messages[0] = compact(messages[0], summarize_task_evidence)
+        total = sum(message_tokens(m) for m in messages)
+        # Over budget: shorten the oldest long messages, keeping the task (first) and the latest message whole
+        for i in range(1, len(messages) - 1):
+            if total <= self.token_budget:
+                break
+            shortened = compact(messages[i], summarize_evidence if is_tool_output(messages[i]) else truncate)
+            total -= message_tokens(messages[i]) - message_tokens(shortened)
+            messages[i] = shortened
+        if total < before:
+            record_compaction(before - total)
+        return messages
+
+
+def compacting_context():
+    """A fresh compacting context, or None (autogen's unbounded default) when disabled."""
+    return CompactingChatCompletionContext() if COMPACTION_ENABLED else None
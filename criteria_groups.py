@@ -0,0 +1,108 @@
+import os
+import re
+
+from blueprint_index import tokenize
+from result_records import last_verdict
+
+# Batching of related criteria. Annex rows are often close variants of each other
+# (e.g. the Netlogon secure channel rows that all map to the same registry key), so
+# criteria whose top retrieved blueprint chunks overlap, or whose wording is nearly
+# the same, are evaluated together in one team run. The planner's summary is asked
+# for one "### Criterion <n>" section per criterion, which is split back into
+# individual results; anything that can't be matched up is re-run on its own.
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "5"))  # 1 disables batching
+BATCH_WINDOW = int(os.getenv("BATCH_WINDOW", "20"))  # most criteria considered together when grouping
+EVIDENCE_OVERLAP = 0.5
+TEXT_OVERLAP = 0.6
+SIGNATURE_CHUNKS = 4
+# "### Criterion 2", "**Criterion 2:** GREEN", ... at the start of a line
+SECTION_RE = re.compile(r"^[ \t]*#{0,4}[ \t]*\**Criterion[ \t]+(\d+)\b(.*)$", re.MULTILINE | re.IGNORECASE)
+HEADER_PUNCTUATION = " \t:*.-#"
+# The numbered criterion lines of a batch_task
+TASK_LINE_RE = re.compile(r"^Criterion (\d+): '", re.MULTILINE)
+
+
+def jaccard(a, b) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def related(a, b) -> bool:
+    return jaccard(a["evidence"], b["evidence"]) >= EVIDENCE_OVERLAP or jaccard(a["terms"], b["terms"]) >= TEXT_OVERLAP
+
+
+def group_criteria(items, index, max_size=BATCH_MAX_SIZE):
+    """
+    Greedy grouping of (position, index, criterion) items, in order: each item joins
+    the first open group whose first member it is related to, or starts a new one.
+    """
+    if max_size <= 1:
+        return [[item] for item in items]
+    groups = []
+    # Every item's top chunks come from one batched scoring pass
+    signatures = index.search_many([item[-1] for item in items], SIGNATURE_CHUNKS)
+    for item, hits in zip(items, signatures):
+        criterion = item[-1]
+        features = {"evidence": frozenset(chunk.chunk_id for chunk, _score in hits), "terms": frozenset(tokenize(criterion))}
+        for group in groups:
+            if len(group["items"]) < max_size and related(group["seed"], features):
+                group["items"].append(item)
+                break
+        else:
+            groups.append({"seed": features, "items": [item]})
+    return [group["items"] for group in groups]
+
+
+def window_sizes(largest=BATCH_WINDOW):
+    """
+    Sizes of the successive windows of criteria grouped as they are read: 1, 2,
+    4, ... up to `largest`. The first team starts on the first criterion that
+    needs one, instead of waiting for a whole window to be read, and later
+    windows are still big enough to find related criteria.
+    """
+    size, largest = 1, max(1, largest)
+    while True:
+        yield min(size, largest)
+        size *= 2
+
+
+def batch_task(criteria):
+    # The planner's own instructions add the final TERMINATE; the task must not mention it,
+    # since the termination condition also sees the task message
+    numbered = "\n".join(f"Criterion {n}: '{criterion}'" for n, criterion in enumerate(criteria, 1))
+    return (
+        "Determine, for each of the following related criteria, whether it has been satisfied with the current setup scripts:\n"
+        f"{numbered}\n"
+        "They are likely covered by the same settings, so search for them together. "
+        'In the analysis, the remediation and your final summary, write one section per criterion, each starting with a line '
+        '"### Criterion <number>"; end each section of the final summary with "GREEN" or "RED".'
+    )
+
+
+def batch_size(task) -> int:
+    """Number of criteria a task asks about: 1 unless it is a batch_task."""
+    return max(1, len(TASK_LINE_RE.findall(task or "")))
+
+
+def split_sections(text, count=None):
+    """
+    {criterion number: section body} for the numbered sections in text; the header
+    line itself is dropped, apart from anything written after the number.
+    """
+    text = text or ""
+    matches = [m for m in SECTION_RE.finditer(text) if count is None or 1 <= int(m.group(1)) <= count]
+    sections = {}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        number = int(match.group(1))
+        if number not in sections:
+            rest = match.group(2).strip(HEADER_PUNCTUATION)
+            sections[number] = "\n".join(part for part in (rest, text[match.end():end].strip()) if part)
+    return sections
+
+
+def section_verdicts(text, count=None):
+    """Verdict of each numbered section that states one."""
+    verdicts = {number: last_verdict(section) for number, section in split_sections(text, count).items()}
+    return {number: v for number, v in verdicts.items() if v is not None}
@@ -0,0 +1,136 @@
+import os
+from dataclasses import replace
+
+from assessment_store import get_assessment_store, content_hash, corpus_hash
+from blueprint_index import BLUEPRINT_MAX_CHUNKS, BLUEPRINT_TOKEN_BUDGET, get_blueprint_index
+from blueprint_store import get_blueprint_store
+from criteria_groups import section_verdicts, split_sections
+from model_routing import as_router
+from result_records import ResultRecord, Verdict, evidence_files, last_verdict
+from rules import evaluate_rules, format_rule_result
+from settings_facts import get_fact_table
+
+# Deciding and recording the result of one criterion, shared by the web app's job
+# runners (webserver_ajax) and the headless batch runner (main.py): the rule fast
+# path, verdicts stored by earlier runs, turning a team's summary into a
+# ResultRecord, and the HTML item the results list and reports show.
+
+# Answer criteria matched by a deterministic rule without running the agent team
+RULES_FAST_PATH = os.environ.get("RULES_FAST_PATH", "1") != "0"
+
+
+def render_result_item(record):
+    li_class = "" if record.verdict == Verdict.GREEN else "red"
+    import markdown2
+
+    summary_html = markdown2.markdown(record.message)
+    return (f'<li class="{li_class}" data-verdict="{record.verdict.value}"><span class="guideline">{record.criterion}</span>'
+            f'<div class="summary">{summary_html}</div></li>')
+
+
+def analyst_cascade(client):
+    """Whether the DataAnalystAgent's verdicts go through the model cascade (see model_routing) with this client."""
+    return as_router(client).tier("DataAnalystAgent") == "cascade"
+
+
+def analysis_text(result):
+    # The DataAnalystAgent's last analysis. On the cascade its verdict was checked by the
+    # large model when the small one was unsure, which the planner's summary never is
+    for message in reversed(result.messages):
+        if message.source == "DataAnalystAgent" and isinstance(message.content, str):
+            return message.content
+    return ""
+
+
+def checked_summary(summary, checked):
+    """The summary, with the analysis' verdict added when the summary ends on a different one."""
+    if checked is None or last_verdict(summary) == checked:
+        return summary
+    return f"{summary}\n\nVerdict of the analysis: {checked.value}"
+
+
+def format_result(guideline_description, result, evidence=(), cascade=False):
+    # With cascade (see analyst_cascade), the analysis' verdict is added to a summary that ends on another
+    if hasattr(result, "messages") and result.messages:
+        checked = last_verdict(analysis_text(result)) if cascade else None
+        summary:str = checked_summary(result.messages[-1].content, checked)
+        record = ResultRecord.create(guideline_description, summary, evidence_files=evidence_files(evidence))
+        if record.verdict == Verdict.RED and len(result.messages) > 1:
+            record = replace(record, remediation=result.messages[-2].content)
+        return record
+    return ResultRecord.create(guideline_description, "[No summary found]")
+
+
+def format_batch_result(criteria, result, evidence=(), cascade=False):
+    """
+    One record per criterion of a batched run, split out of the summary's
+    "Criterion <n>" sections; None for a criterion without a section and verdict.
+    With cascade, each section is checked against the analysis as format_result does.
+    """
+    if not (hasattr(result, "messages") and result.messages):
+        return [None] * len(criteria)
+    sections = split_sections(result.messages[-1].content, len(criteria))
+    checked = section_verdicts(analysis_text(result), len(criteria)) if cascade else {}
+    remediation = result.messages[-2].content if len(result.messages) > 1 else ""
+    remediation_sections = split_sections(remediation, len(criteria))
+    records = []
+    for number, guideline_description in enumerate(criteria, 1):
+        summary = sections.get(number)
+        if summary is None or last_verdict(summary) is None:
+            records.append(None)
+            continue
+        summary = checked_summary(summary, checked.get(number))
+        section_verdict = last_verdict(summary)
+        remediation_steps = remediation_sections.get(number, remediation) if section_verdict == Verdict.RED else ""
+        # A section's verdict may be mid-sentence, so it is taken from the section as a whole
+        records.append(ResultRecord(guideline_description, section_verdict, summary, remediation_steps,
+                                    evidence_files(evidence), path="batch"))
+    return records
+
+
+def rule_result(guideline_description):
+    if not RULES_FAST_PATH:
+        return None
+    result = evaluate_rules(guideline_description, get_fact_table(get_blueprint_store()))
+    if result is None:
+        return None
+    files = evidence_files(fact.location() for fact in result.facts)
+    return ResultRecord.create(guideline_description, format_rule_result(result), evidence_files=files, path="rule")
+
+
+def retrieval_hits(guideline_description, index):
+    # What the criterion's own text retrieves; a chunk that turns up here later and
+    # wasn't part of the stored evidence means the blueprints gained something relevant
+    return [chunk for chunk, _score in index.retrieve(guideline_description, BLUEPRINT_TOKEN_BUDGET, BLUEPRINT_MAX_CHUNKS)]
+
+
+def stored_result(guideline_description):
+    # Verdict from an earlier run, provided none of the blueprint chunks it was based on
+    # changed and the criterion retrieves nothing new
+    blueprint_store = get_blueprint_store()
+    index = get_blueprint_index(blueprint_store)
+    stored = get_assessment_store().lookup(guideline_description, index, corpus_hash(blueprint_store),
+                                           retrieval_hits(guideline_description, index))
+    if stored is None:
+        return None
+    record = ResultRecord.from_stored(stored)
+    if record.verdict not in (Verdict.GREEN, Verdict.RED):
+        return None
+    return replace(record, path="stored")
+
+
+def save_result(guideline_description, result, record, evidence):
+    # Only verdicts are worth replaying: a run that ended without GREEN/RED (e.g. it hit
+    # max_turns) is tried again next time rather than stored until the evidence changes
+    if record.verdict not in (Verdict.GREEN, Verdict.RED):
+        return
+    if hasattr(result, "messages") and result.messages:
+        blueprint_store = get_blueprint_store()
+        evidence = dict(evidence)
+        for chunk in retrieval_hits(guideline_description, get_blueprint_index(blueprint_store)):
+            evidence.setdefault(chunk.chunk_id, content_hash(chunk.text))
+        get_assessment_store().save(guideline_description, record.to_json(), evidence, corpus_hash(blueprint_store))
+
+
+def criterion_task(guideline_description):
+    return f"Determine if this criteria has been satisfied with the current setup scripts: '{guideline_description}'"
@@ -0,0 +1,305 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from result_records import ResultRecord, Verdict
+
+# Durable job subsystem shared by every web worker: job metadata, each result line
+# (rendered to HTML once, when it is appended) and a per-job stop flag live in a
+# local SQLite database in WAL mode. Any worker can serve /progress or /events for
+# any job, a stop only affects its own job, and a job whose worker died can be
+# picked up again and resumed from the criteria it had already completed.
+DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(os.getcwd(), ".cache", "jobs.db"))
+# A running job whose heartbeat is older than this is treated as orphaned
+HEARTBEAT_SECONDS = 10
+STALE_AFTER_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class Job:
+    job_id: str
+    status: str  # "running", "complete", "stopped" or "failed"
+    criteria: list
+    concurrency: int
+    use_cache: bool
+    stop_requested: bool
+    message: str
+    created_at: float
+    updated_at: float
+    heartbeat: float
+    source: str = ""  # uploaded workbook the criteria are read from
+    criteria_column: str = ""
+    ingested: bool = True  # False while criteria are still being read from source
+    summary: dict = None  # metrics.RunStats totals for the job
+    replaced: int = 0  # stopped / error results since replaced by a re-run
+
+    @property
+    def done(self) -> bool:
+        return self.status != "running"
+
+
+class JobStore:
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    criteria TEXT NOT NULL,
+                    concurrency INTEGER NOT NULL,
+                    use_cache INTEGER NOT NULL,
+                    stop_requested INTEGER NOT NULL DEFAULT 0,
+                    message TEXT NOT NULL DEFAULT '',
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    heartbeat REAL NOT NULL,
+                    source TEXT NOT NULL DEFAULT '',
+                    criteria_column TEXT NOT NULL DEFAULT '',
+                    ingested INTEGER NOT NULL DEFAULT 1,
+                    summary TEXT NOT NULL DEFAULT '{}',
+                    replaced INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+            # Each result's ResultRecord as JSON, with its verdict in a column of its own for filtering
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS results (
+                    job_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    criterion_index INTEGER,
+                    kind TEXT NOT NULL,
+                    line TEXT NOT NULL,
+                    html TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    verdict TEXT NOT NULL,
+                    record TEXT NOT NULL,
+                    PRIMARY KEY (job_id, position)
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_by_verdict ON results (job_id, verdict, position)")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_by_criterion ON results (job_id, criterion_index)")
+            # Kept up to date by append(), so summaries never scan a job's results
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS verdict_counts (
+                    job_id TEXT NOT NULL,
+                    verdict TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (job_id, verdict)
+                )"""
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, job_id, criteria, concurrency, use_cache, source="", criteria_column=""):
+        # With a source, criteria are filled in by set_criteria as the workbook is read
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, status, criteria, concurrency, use_cache, created_at, updated_at, heartbeat,"
+                " source, criteria_column, ingested) VALUES (?, 'running', ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(criteria), concurrency, int(use_cache), now, now, now,
+                 source, criteria_column, int(not source)),
+            )
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            "SELECT job_id, status, criteria, concurrency, use_cache, stop_requested, message, created_at, updated_at, heartbeat,"
+            " source, criteria_column, ingested, summary, replaced FROM jobs WHERE job_id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return Job(row[0], row[1], json.loads(row[2]), row[3], bool(row[4]), bool(row[5]), row[6], row[7], row[8], row[9],
+                   row[10], row[11], bool(row[12]), json.loads(row[13]), row[14])
+
+    def set_criteria(self, job_id, criteria, ingested):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET criteria = ?, ingested = ?, updated_at = ? WHERE job_id = ?",
+                (json.dumps(criteria), int(ingested), time.time(), job_id),
+            )
+
+    def set_summary(self, job_id, summary):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET summary = ? WHERE job_id = ?", (json.dumps(summary), job_id))
+
+    def append(self, job_id, record: ResultRecord, html, criterion_index=None):
+        # The kind ("result" for a finished criterion, or "stopped" / "error") comes from the record.
+        # A criterion run again when its job resumed takes the place of its stopped / error
+        # result, so every criterion is listed and counted once, in spreadsheet order
+        now = time.time()
+        with self._connect() as conn:
+            previous = None
+            if criterion_index is not None:
+                previous = conn.execute(
+                    "SELECT position, verdict FROM results WHERE job_id = ? AND criterion_index = ? AND kind != 'result'",
+                    (job_id, criterion_index),
+                ).fetchone()
+            if previous is None:
+                conn.execute(
+                    "INSERT INTO results (job_id, position, criterion_index, kind, line, html, created_at, verdict, record)"
+                    " SELECT ?, COALESCE(MAX(position), -1) + 1, ?, ?, ?, ?, ?, ?, ? FROM results WHERE job_id = ?",
+                    (job_id, criterion_index, record.kind, record.line, html, now, record.verdict.value, record.to_json(), job_id),
+                )
+            else:
+                position, verdict = previous
+                conn.execute(
+                    "UPDATE results SET kind = ?, line = ?, html = ?, created_at = ?, verdict = ?, record = ?"
+                    " WHERE job_id = ? AND position = ?",
+                    (record.kind, record.line, html, now, record.verdict.value, record.to_json(), job_id, position),
+                )
+                conn.execute("UPDATE verdict_counts SET count = count - 1 WHERE job_id = ? AND verdict = ?", (job_id, verdict))
+                conn.execute("DELETE FROM verdict_counts WHERE job_id = ? AND count <= 0", (job_id,))
+                # Tells the reports that a result they already hold has changed
+                conn.execute("UPDATE jobs SET replaced = replaced + 1 WHERE job_id = ?", (job_id,))
+            conn.execute(
+                "INSERT INTO verdict_counts (job_id, verdict, count) VALUES (?, ?, 1)"
+                " ON CONFLICT (job_id, verdict) DO UPDATE SET count = count + 1",
+                (job_id, record.verdict.value),
+            )
+            conn.execute("UPDATE jobs SET updated_at = ?, heartbeat = ? WHERE job_id = ?", (now, now, job_id))
+
+    def items(self, job_id, since=0):
+        """Rendered items from cursor `since` onwards, and the cursor to use next time."""
+        since = max(0, since)
+        rows = self._connect().execute(
+            "SELECT position, html FROM results WHERE job_id = ? AND position >= ? ORDER BY position",
+            (job_id, since),
+        ).fetchall()
+        next_cursor = rows[-1][0] + 1 if rows else min(since, self.count(job_id))
+        return [html for _, html in rows], next_cursor
+
+    def rows(self, job_id, since=0):
+        """(position, criterion_index, ResultRecord, html) for results from position `since` onwards."""
+        rows = self._connect().execute(
+            "SELECT position, criterion_index, record, html FROM results WHERE job_id = ? AND position >= ? ORDER BY position",
+            (job_id, max(0, since)),
+        ).fetchall()
+        return [(position, index, ResultRecord.from_stored(record), html) for position, index, record, html in rows]
+
+    def count(self, job_id):
+        return self._connect().execute("SELECT COUNT(*) FROM results WHERE job_id = ?", (job_id,)).fetchone()[0]
+
+    def counts(self, job_id):
+        """{verdict: number of results} for the job, without reading the results."""
+        rows = self._connect().execute("SELECT verdict, count FROM verdict_counts WHERE job_id = ?", (job_id,)).fetchall()
+        return {verdict: count for verdict, count in rows}
+
+    def query(self, job_id, verdicts=None, offset=0, limit=50):
+        """
+        One page of a job's results, optionally only those with the given verdicts:
+        ([(position, criterion_index, ResultRecord, html)], number of matching results).
+        """
+        counts = self.counts(job_id)
+        if verdicts:
+            verdicts = [Verdict(v).value for v in verdicts]
+            total = sum(counts.get(v, 0) for v in verdicts)
+            where = f" AND verdict IN ({', '.join('?' * len(verdicts))})"
+        else:
+            verdicts, total, where = [], sum(counts.values()), ""
+        if limit <= 0:
+            return [], total
+        rows = self._connect().execute(
+            f"SELECT position, criterion_index, record, html FROM results WHERE job_id = ?{where}"
+            " ORDER BY position LIMIT ? OFFSET ?",
+            (job_id, *verdicts, limit, max(0, offset)),
+        ).fetchall()
+        return [(position, index, ResultRecord.from_stored(record), html) for position, index, record, html in rows], total
+
+    def records(self, job_id):
+        return [record for _, _, record, _ in self.rows(job_id)]
+
+    def completed_indices(self, job_id):
+        rows = self._connect().execute(
+            "SELECT criterion_index FROM results WHERE job_id = ? AND kind = 'result' AND criterion_index IS NOT NULL",
+            (job_id,),
+        ).fetchall()
+        return {index for (index,) in rows}
+
+    def request_stop(self, job_id):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET stop_requested = 1, updated_at = ? WHERE job_id = ? AND status = 'running'",
+                (time.time(), job_id),
+            )
+        return cursor.rowcount == 1
+
+    def stop_requested(self, job_id):
+        row = self._connect().execute("SELECT stop_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def finish(self, job_id, message=""):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN stop_requested THEN 'stopped' ELSE 'complete' END,"
+                " message = ?, updated_at = ? WHERE job_id = ?",
+                (message, now, job_id),
+            )
+
+    def fail(self, job_id, message):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', message = ?, updated_at = ? WHERE job_id = ?",
+                (message, time.time(), job_id),
+            )
+
+    def heartbeat(self, job_id):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET heartbeat = ? WHERE job_id = ? AND status = 'running'", (time.time(), job_id))
+
+    def claim(self, job_id, stale_after=STALE_AFTER_SECONDS):
+        """
+        Take over a job so it can be resumed: any job that isn't complete, unless it
+        is still running with a live heartbeat. Only one worker wins the claim.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'running', stop_requested = 0, message = '', updated_at = ?, heartbeat = ?"
+                " WHERE job_id = ? AND status != 'complete' AND (status != 'running' OR heartbeat < ?)",
+                (now, now, job_id, now - stale_after),
+            )
+        return cursor.rowcount == 1
+
+    def orphaned(self, stale_after=STALE_AFTER_SECONDS):
+        rows = self._connect().execute(
+            "SELECT job_id FROM jobs WHERE status = 'running' AND heartbeat < ? ORDER BY created_at",
+            (time.time() - stale_after,),
+        ).fetchall()
+        return [job_id for (job_id,) in rows]
+
+    async def wait(self, job_id, cursor, timeout=15.0, interval=0.5):
+        """Wait until there is an item past cursor, the job finished, or timeout elapsed."""
+        # The runner may live in another worker process, so watch the database
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = self.get(job_id)
+            if job is None or job.done or self.count(job_id) > cursor:
+                return
+            await asyncio.sleep(interval)
+
+
+_job_store = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    global _job_store
+    with _job_store_lock:
+        if _job_store is None:
+            _job_store = JobStore()
+        return _job_store
@@ -1,121 +1,219 @@
-from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.conditions import MaxMessageTermination, TextMentionTermination
-from autogen_agentchat.teams import SelectorGroupChat
-from autogen_agentchat.ui import Console
-from autogen_core.tools import FunctionTool
-from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
 from dotenv import load_dotenv
 import asyncio
+import json
 import os
+import threading
 
 
 # Note: This example uses mock tools instead of real APIs for demonstration purposes
-import glob
-import aiofiles
+from blueprint_store import get_blueprint_store
+from blueprint_index import BLUEPRINT_MAX_CHUNKS, BLUEPRINT_TOKEN_BUDGET, get_blueprint_index, named_identifiers, select_hits
+from completion_cache import cached_client
+from client_pool import PooledClient
+from assessment_store import collect_evidence, criterion_key, record_evidence
+from settings_facts import get_fact_table
+from metrics import RunStats, collect_stats, format_summary, record_tool_call, record_selection, record_turns
+from result_records import ResultRecord, Verdict, last_verdict, verdict_counts
+from evaluation import analyst_cascade, criterion_task, format_batch_result, format_result, rule_result, save_result, stored_result
+from model_routing import CONFIDENCE_INSTRUCTION, ModelRouter, as_router
+from context_compaction import compacting_context, EVIDENCE_HEADER
+from criteria_groups import BATCH_MAX_SIZE, batch_task, group_criteria, section_verdicts, window_sizes
+import time
+
+# Nothing expensive happens at import: the blueprint store and index, the model
+# clients and the default agents are built on first use (or by warm_up() when the
+# web app starts), and the autogen agent classes and the OpenAI SDK are imported by
+# the functions that need them. Importing this module therefore needs no .env.
+# Lines of context either side of each lookup_identifier match, and matches shown per identifier
+LOOKUP_CONTEXT_LINES = int(os.getenv("LOOKUP_CONTEXT_LINES", "2"))
+LOOKUP_MAX_MATCHES = int(os.getenv("LOOKUP_MAX_MATCHES", "8"))
+# Very long lines (e.g. DSC arrays on one line) are cut in snippets
+LOOKUP_LINE_CHARS = 300
 
 async def search_blueprint(query: str) -> str:
-    print("GO\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\nWE HIT THE TOOL LETS GO\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n")
-    input_dir = os.path.join(os.getcwd(), "input_files")
-    file_paths = [f for f in glob.glob(f"{input_dir}/**/*.txt", recursive=True)]
-    if not file_paths:
+    start = time.perf_counter()
+    result = _search_blueprint(query)
+    elapsed = time.perf_counter() - start
+    record_tool_call("search_blueprint", elapsed, len(result.encode("utf-8")))
+    # One summary line instead of dumping the returned text to stdout
+    print(f"search_blueprint({query!r}): {len(result)} chars in {elapsed * 1000:.1f} ms")
+    return result
+
+
+def _search_blueprint(query: str) -> str:
+    blueprint_store = get_blueprint_store()
+    # Only re-stats the blueprint directory; unchanged files are served from memory
+    blueprint_store.refresh()
+    if not blueprint_store.ids():
         return "No blueprint files found."
-
-    prompt = f"""
-You are a system blueprint search agent.
-Given the following query:
----
-{query}
----
-Here is a list of available blueprint files:
-{chr(10).join(file_paths)}
-Which files are most relevant to answering the query? Return a comma separated list of file paths.
-"""
-    #print(prompt)
-    from autogen_core.models import UserMessage
-    response = await model_client.create(messages=[UserMessage(role="user", content=prompt, source="user")])
-    # Extract content and clean up code block and raw string prefixes
-    #print(response.content)    # Remove code block markers
-    content = response.content.split(",")
-    print("Chose files:")
-    print("\n".join(content))
-    if not content:
-        print("OOPSY WOOPSY!!!")
-        return "Error retrieving files :("
-    contents = []
-    for path in content:
-        path = path.strip().strip("`").strip('"').strip("'")
-        file_content = None
-        encodings = ["utf-8", "utf-16", "utf-8-sig", "latin-1"]
-        for encoding in encodings:
-            try:
-                async with aiofiles.open(path, "r", encoding=encoding) as f:
-                    file_content = await f.read()
-                break
-            except Exception as e:
-                print("ERROR: " + str(e))
-                file_content = None
-        # Try ascii with errors ignored as last resort
-        if file_content is None:
-            try:
-                async with aiofiles.open(path, "r", encoding="ascii", errors="ignore") as f:
-                    file_content = await f.read()
-            except Exception as e:
-                print("ERROR: " + str(e))
-                file_content = None
-        # Try binary read and decode as utf-8 ignoring errors
-        if file_content is None:
-            try:
-                async with aiofiles.open(path, "rb") as f:
-                    raw_bytes = await f.read()
-                file_content = raw_bytes.decode("utf-8", errors="ignore")
-            except Exception as e:
-                file_content = None
-                print("ERROR: " + str(e))
-        if file_content is not None:
-            if file_content and len(file_content) > 4096:
-                file_content = file_content[:4096] + "\n...[truncated]..."
-            contents.append(f"--- {os.path.basename(path)} ---\n{file_content}")
+    # Rank chunks locally with BM25 rather than asking the model to pick from file names,
+    # and return only the matching DSC resources / Intune settings / registry values
+    hits = get_blueprint_index(blueprint_store).retrieve(query, BLUEPRINT_TOKEN_BUDGET, BLUEPRINT_MAX_CHUNKS)
+    # Remember what this criterion's verdict was based on, for incremental re-assessment
+    record_evidence(chunk for chunk, _score in hits)
+    print("Chose chunks: " + ", ".join(f"{chunk.chunk_id} ({score:.2f})" for chunk, score in hits))
+    if not hits:
+        return "No relevant blueprint files found for this query. Try different keywords, e.g. a registry value name or setting name."
+    return format_hits(hits)
+
+
+async def lookup_identifier(identifiers: str) -> str:
+    """
+    Exact lookup of registry value names or paths, Intune settingDefinitionIds,
+    JSON keys and DSC resource or property names (comma-separated for several).
+    Returns only the lines that contain them, with a little context and their
+    file and line numbers.
+    """
+    start = time.perf_counter()
+    result = _lookup_identifier(identifiers)
+    elapsed = time.perf_counter() - start
+    record_tool_call("lookup_identifier", elapsed, len(result.encode("utf-8")))
+    print(f"lookup_identifier({identifiers!r}): {len(result)} chars in {elapsed * 1000:.1f} ms")
+    return result
+
+
+def _lookup_identifier(identifiers: str) -> str:
+    blueprint_store = get_blueprint_store()
+    blueprint_store.refresh()
+    index = get_blueprint_index(blueprint_store)
+    facts = get_fact_table(blueprint_store)
+    sections, missing = [], []
+    for identifier in [i.strip() for i in identifiers.replace("\n", ",").split(",") if i.strip()]:
+        matches = index.lookup(identifier)
+        if not matches:
+            missing.append(identifier)
+            continue
+        shown = matches[:LOOKUP_MAX_MATCHES]
+        # The chunks holding the matched lines are this criterion's evidence, as for search_blueprint
+        record_evidence(chunk for doc_id, line in shown for chunk in index.chunks_at(doc_id, line))
+        sections.extend(format_snippets(identifier, index, shown, facts))
+        if len(matches) > len(shown):
+            sections.append(f"[{len(matches) - len(shown)} more lines contain {identifier}; use a more specific identifier to see them]")
+    if not sections:
+        return f"No blueprint lines match {', '.join(missing)}. Try search_blueprint with keywords instead."
+    if missing:
+        sections.append(f"[No blueprint lines match {', '.join(missing)}]")
+    return "\n\n".join(sections)
+
+
+def format_snippets(identifier, index, matches, facts=None):
+    """
+    One section per run of nearby matches in a file, the matching lines marked
+    with ">". Registry values set through a variable get their resolved key added.
+    """
+    snippets = []
+    for doc_id, line in matches:
+        first, last = max(1, line - LOOKUP_CONTEXT_LINES), line + LOOKUP_CONTEXT_LINES
+        if snippets and snippets[-1][0] == doc_id and first <= snippets[-1][2] + 1:
+            snippets[-1][2] = last
+            snippets[-1][3].add(line)
         else:
-            contents.append(f"--- {os.path.basename(path)} ---\n[Error reading file: Could not decode with utf-16, utf-8-sig, utf-8, latin-1, ascii, or binary utf-8: {file_content}]")
-    print("\n\n".join(contents))
+            snippets.append([doc_id, first, last, {line}])
+    sections = []
+    for doc_id, first, last, hits in snippets:
+        lines = index.doc_lines[doc_id]
+        last = min(last, len(lines))
+        body = []
+        for n in range(first, last + 1):
+            body.append(f"{'>' if n in hits else ' '}{n:>6}: {lines[n - 1][:LOOKUP_LINE_CHARS]}")
+            for fact in facts.at(doc_id, n) if facts is not None and n in hits else ():
+                if fact.kind == "registry" and fact.key and fact.key not in lines[n - 1]:
+                    body.append(f"{'':>8}(sets {fact.key}\\{fact.name} = {fact.value})")
+        body = "\n".join(body)
+        sections.append(f"--- {identifier} [{doc_id} lines {first}-{last}] ---\n{body}")
+    return sections
+
+
+def format_hits(hits):
+    contents = []
+    for chunk, _score in hits:
+        contents.append(f"--- {chunk.title} [{os.path.basename(chunk.doc_id)} lines {chunk.start_line}-{chunk.end_line}] ---\n{chunk.text}")
     return "\n\n".join(contents)
 
+
+# Evidence for a whole window of criteria is retrieved up front, in one batched
+# scoring pass, and attached to each task so the team can go straight to analysis
+PREFETCH_EVIDENCE = os.getenv("PREFETCH_EVIDENCE", "1") != "0"
+
+
+def prefetch_evidence(criteria):
+    """search_blueprint's hits for each criterion, with the criterion text as the query."""
+    if not PREFETCH_EVIDENCE:
+        return [[] for _ in criteria]
+    blueprint_store = get_blueprint_store()
+    blueprint_store.refresh()
+    return get_blueprint_index(blueprint_store).retrieve_many(criteria, BLUEPRINT_TOKEN_BUDGET, BLUEPRINT_MAX_CHUNKS)
+
+
+def merge_evidence(hit_lists):
+    """One evidence set for criteria evaluated together: each chunk once, at its best score."""
+    best = {}
+    for hits in hit_lists:
+        for chunk, score in hits:
+            if chunk.chunk_id not in best or score > best[chunk.chunk_id][1]:
+                best[chunk.chunk_id] = (chunk, score)
+    ranked = sorted(best.values(), key=lambda hit: hit[1], reverse=True)
+    # Room for more than one criterion's worth, without growing with the group
+    scale = min(len(hit_lists), 2)
+    return select_hits(ranked, BLUEPRINT_TOKEN_BUDGET * scale, BLUEPRINT_MAX_CHUNKS * scale)
+
+
+def with_evidence(task, hits):
+    if not hits:
+        return task
+    return f"{task}\n\n{EVIDENCE_HEADER}\n\n{format_hits(hits)}"
+
 load_dotenv()
 api_key = os.getenv("API_KEY")
 azure_endpoint = os.getenv("AZURE_ENDPOINT")
 azure_deployment = os.getenv("AZURE_DEPLOYMENT")
-model_client = AzureOpenAIChatCompletionClient(
-    azure_deployment=azure_deployment,
-    model="gpt-5",
-    api_version="2024-12-01-preview",
-    azure_endpoint=azure_endpoint,
-    api_key=api_key,
-)
-
-planning_agent = AssistantAgent(
-    "PlanningAgent",
-    description="An agent for planning tasks, this agent should be the first to engage when given a new task.",
-    model_client=model_client,
-    system_message="""
-    You are a planning agent.
-    Your job is to break down complex tasks into smaller, manageable subtasks.
-    Your team members are:
-        SearchBlueprintAgent: Searches for information
-        DataAnalystAgent: Analyses the information given
-        RemediationAgent: Provides a remediation strategy based on the analysis.
-
-    You only plan and delegate tasks - you do not execute them yourself.
-
-    When assigning tasks, use this format:
-    1. <agent> : <task>
-    
-    The RemediationAgent should only be assigned a task once the DataAnalystAgent has completed its analysis.
-    If the SearchBlueprintAgent cannot retrieve any relevant files after a few tries, proceed with the remediation anyway based on the information available.
-    After all tasks are complete, summarize the findings in full detail, as the history will not be shown, giving references to the file-names that you referred to, and re-stating any scripts provided by the remediation agent, and end with "GREEN" if it meets the criteria, or "RED" if it doesn't, then finally "TERMINATE".
-    """,
-)
-
-
+# Optional cheaper deployment for the roles model_routing sends to the small tier
+azure_small_deployment = os.getenv("AZURE_SMALL_DEPLOYMENT")
+azure_small_model = os.getenv("AZURE_SMALL_MODEL", "gpt-5-mini")
+
+
+def azure_client(deployment=None, model="gpt-5"):
+    from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+    # Retries are left to PooledClient, which also backs off the shared concurrency limit
+    return AzureOpenAIChatCompletionClient(
+        azure_deployment=deployment or azure_deployment,
+        model=model,
+        api_version="2024-12-01-preview",
+        azure_endpoint=azure_endpoint,
+        api_key=api_key,
+        max_retries=0,
+    )
+
+
+def _cached(pooled, model, deployment):
+    # Identical prompts (same model, deployment, messages and tools) are answered from
+    # the local completion cache; set COMPLETION_CACHE=0 to always call Azure
+    if os.getenv("COMPLETION_CACHE", "1") != "0":
+        return cached_client(pooled, model=model, deployment=deployment)
+    return pooled
+
+
+def _build_clients():
+    # A client already assigned to either name (e.g. by the benchmark) is kept.
+    # One Azure client (and HTTP connection pool) per event loop, under a shared adaptive concurrency limit
+    pooled = globals().setdefault("azure_model_client", PooledClient(azure_client))
+    globals().setdefault("model_client", _cached(pooled, "gpt-5", azure_deployment))
+
+
+def _build_small_clients():
+    # The small deployment has its own rate limit, so its own adaptive concurrency limit too
+    pooled = None
+    if azure_small_deployment:
+        pooled = PooledClient(lambda: azure_client(azure_small_deployment, azure_small_model))
+    pooled = globals().setdefault("small_azure_model_client", pooled)
+    globals().setdefault("small_model_client", pooled and _cached(pooled, azure_small_model, azure_small_deployment))
+
+
+def get_model_router(use_cache=True):
+    """The model client for each agent role (see model_routing); use_cache=False bypasses the completion cache."""
+    if use_cache:
+        return ModelRouter(get_model_client(), __getattr__("small_model_client"))
+    return ModelRouter(get_azure_model_client(), __getattr__("small_azure_model_client"))
 
 # async def blueprint_search_tool(query: str) -> str:
 #     return await search_blueprint(query)
@@ -124,41 +222,90 @@ planning_agent = AssistantAgent(
 # print(search_blueprint_tool.schema)
 
 
-blueprint_search_agent = AssistantAgent(
-    "SearchBlueprintAgent",
-    description="An agent for retrieving Powershell scripts.",
-    tools=[search_blueprint],
-    model_client=model_client,
-    system_message="""
-    You are a search agent.
-    Your only tool is search_tool - use it to find information.
-    You make only one search call at a time.
-    """,
-)
-
-data_analyst_agent = AssistantAgent(
-    "DataAnalystAgent",
-    description="An agent for analysing criteria. You speak concisely, avoiding unnecessary elaboration.",
-    model_client=model_client,
-    tools=[],
-    system_message="""
-    Once scripts have been provided, analyse whether there is evidence of the query criteria being satisfied. Speak concisly, avoiding unnecessary elaboration.
-    """,
-)
-
-remediation_agent = AssistantAgent(
-    "RemediationAgent",
-    description="An agent for providing a precise, concise remediation strategy, once the analysis is complete.",
-    model_client=model_client,
-    tools=[],
-    system_message="""
-    Once the analysis has been completed, provide a strategy for remediation - for some criteria, this might involve new scripts being provided, for others it will be policy recommendations. If a new script is appropriate, give only a very brief explanation, then provide the script. Speak concisly, avoiding unnecessary elaboration.
-    """,
-)
-
-text_mention_termination = TextMentionTermination("TERMINATE")
-max_messages_termination = MaxMessageTermination(max_messages=25)
-termination = text_mention_termination | max_messages_termination
+def build_agents(client=None):
+    """
+    Build a fresh set of the four agents. Agents keep their own conversation
+    state, so every concurrently running team needs its own instances.
+    """
+    from autogen_agentchat.agents import AssistantAgent
+
+    # A single client serves every role; a ModelRouter picks each role's deployment.
+    # Each agent gets its own instrumented view of its client so /metrics can split calls by agent,
+    # and its own compacting history so old search results don't ride along in every turn
+    router = as_router(client or get_model_router())
+    planning_agent = AssistantAgent(
+        "PlanningAgent",
+        description="An agent for planning tasks, this agent should be the first to engage when given a new task.",
+        model_client=router.client("PlanningAgent"),
+        model_context=compacting_context(),
+        system_message="""
+        You are a planning agent.
+        Your job is to break down complex tasks into smaller, manageable subtasks.
+        Your team members are:
+            SearchBlueprintAgent: Searches for information
+            DataAnalystAgent: Analyses the information given
+            RemediationAgent: Provides a remediation strategy based on the analysis.
+
+        You only plan and delegate tasks - you do not execute them yourself.
+
+        When assigning tasks, use this format:
+        1. <agent> : <task>
+    
+        The RemediationAgent should only be assigned a task once the DataAnalystAgent has completed its analysis.
+        If the SearchBlueprintAgent cannot retrieve any relevant files after a few tries, proceed with the remediation anyway based on the information available.
+        After all tasks are complete, summarize the findings in full detail, as the history will not be shown, giving references to the file-names that you referred to, and re-stating any scripts provided by the remediation agent, and end with "GREEN" if it meets the criteria, or "RED" if it doesn't, then finally "TERMINATE".
+        """,
+    )
+
+    blueprint_search_agent = AssistantAgent(
+        "SearchBlueprintAgent",
+        description="An agent for retrieving Powershell scripts.",
+        tools=[search_blueprint, lookup_identifier],
+        model_client=router.client("SearchBlueprintAgent"),
+        model_context=compacting_context(),
+        system_message="""
+        You are a search agent.
+        Your tools are search_blueprint and lookup_identifier - use them to find information.
+        When the criteria names an exact setting (a registry value name or path, an Intune settingDefinitionId, a JSON key or a DSC resource or property name), use lookup_identifier with it: it returns just the matching lines and their file and line numbers.
+        Otherwise use search_blueprint. It is a keyword search, so include specific terms such as registry value names, registry paths, Intune setting names or DSC resource names.
+        You make only one tool call at a time.
+        """,
+    )
+
+    data_analyst_agent = AssistantAgent(
+        "DataAnalystAgent",
+        description="An agent for analysing criteria. You speak concisely, avoiding unnecessary elaboration.",
+        model_client=router.client("DataAnalystAgent"),
+        model_context=compacting_context(),
+        tools=[],
+        system_message="""
+        Once scripts have been provided, analyse whether there is evidence of the query criteria being satisfied. Speak concisly, avoiding unnecessary elaboration.
+        Cite the file and line numbers of the evidence you rely on.
+        End with "GREEN" if the criteria is satisfied, or "RED" if it is not.
+        """ + (CONFIDENCE_INSTRUCTION if router.tier("DataAnalystAgent") == "cascade" else ""),
+    )
+
+    remediation_agent = AssistantAgent(
+        "RemediationAgent",
+        description="An agent for providing a precise, concise remediation strategy, once the analysis is complete.",
+        model_client=router.client("RemediationAgent"),
+        model_context=compacting_context(),
+        tools=[],
+        system_message="""
+        Once the analysis has been completed, provide a strategy for remediation - for some criteria, this might involve new scripts being provided, for others it will be policy recommendations. If a new script is appropriate, give only a very brief explanation, then provide the script. Speak concisly, avoiding unnecessary elaboration.
+        """,
+    )
+    return [planning_agent, blueprint_search_agent, data_analyst_agent, remediation_agent]
+
+
+def build_termination():
+    from autogen_agentchat.conditions import MaxMessageTermination, TextMentionTermination
+
+    # Termination conditions keep per-run state, so each team gets its own
+    text_mention_termination = TextMentionTermination("TERMINATE")
+    max_messages_termination = MaxMessageTermination(max_messages=25)
+    return text_mention_termination | max_messages_termination
+
 
 selector_prompt = """Select an agent to perform task.
 
@@ -179,14 +326,100 @@ def selector_func(messages):
 	"""
 	if len(messages) > 0 and messages[-1].source != "PlanningAgent":
 		#always return to the manager afer other agents speak
+		record_selection("PlanningAgent")
 		return "PlanningAgent"
+	record_selection(None)
 	return None
 
 
+# "pipeline" drives the fixed Planner -> Search -> Analyst -> (Remediation) -> Planner order
+# without asking the model; "model" keeps the original selector_func plus model selection
+SPEAKER_SELECTION = os.getenv("SPEAKER_SELECTION", "pipeline")
+MAX_SEARCH_ATTEMPTS = int(os.getenv("MAX_SEARCH_ATTEMPTS", "2"))
+EMPTY_SEARCH_PREFIXES = ("No blueprint files found", "No relevant blueprint files found", "No blueprint lines match")
+
+
+def _verdict(text):
+    # A batched analysis has a verdict per criterion section; any RED needs remediation
+    sections = section_verdicts(text)
+    if sections:
+        return Verdict.RED if Verdict.RED in sections.values() else Verdict.GREEN
+    return last_verdict(text)
+
+
+def pipeline_selector(messages):
+    """
+    Next speaker for the fixed assessment pipeline:
+    PlanningAgent -> SearchBlueprintAgent (retried while it finds nothing, up to
+    MAX_SEARCH_ATTEMPTS; skipped when the task carries prefetched evidence, unless
+    the criterion names an exact identifier for lookup_identifier) ->
+    DataAnalystAgent -> RemediationAgent on RED -> PlanningAgent.
+    Returns None, i.e. model selection, for anything that doesn't fit the pipeline.
+    """
+    speaker = _pipeline_next(messages)
+    record_selection(speaker)
+    return speaker
+
+
+def _pipeline_next(messages):
+    from autogen_agentchat.messages import BaseChatMessage
+
+    # Tool call request/execution events, thoughts and other events are part of the
+    # thread too; only chat messages move the pipeline on
+    spoken = [m for m in messages if m.source != "user" and isinstance(m, BaseChatMessage) and isinstance(m.content, str)]
+    if not spoken:
+        return "PlanningAgent"
+    last = spoken[-1]
+    searches = [m for m in spoken if m.source == "SearchBlueprintAgent"]
+    # Evidence retrieved before the run counts as a search, unless the criterion names a
+    # registry value, settingDefinitionId or the like: lookup_identifier finds those exactly
+    task = messages[0].content if messages[0].source == "user" and isinstance(getattr(messages[0], "content", None), str) else ""
+    criteria_text, header, _ = task.partition(EVIDENCE_HEADER)
+    prefetched = bool(header) and not named_identifiers(criteria_text)
+    if last.source == "PlanningAgent":
+        if not searches and not prefetched:
+            return "SearchBlueprintAgent"
+        if not any(m.source == "DataAnalystAgent" for m in spoken):
+            return "DataAnalystAgent"
+        return None
+    if last.source == "SearchBlueprintAgent":
+        if last.content.startswith(EMPTY_SEARCH_PREFIXES) and len(searches) < MAX_SEARCH_ATTEMPTS:
+            return "SearchBlueprintAgent"
+        return "DataAnalystAgent"
+    if last.source == "DataAnalystAgent":
+        verdict = _verdict(last.content)
+        if verdict == Verdict.RED:
+            return "RemediationAgent"
+        return "PlanningAgent" if verdict == Verdict.GREEN else None
+    if last.source == "RemediationAgent":
+        return "PlanningAgent"
+    return None
+
+
+def build_team(max_turns=15, client=None):
+    """
+    A self-contained team (own agents and termination state) for evaluating one criterion
+    """
+    from autogen_agentchat.teams import SelectorGroupChat
+
+    router = as_router(client or get_model_router())
+    return SelectorGroupChat(
+        build_agents(router),
+        model_client=router.client("Selector"),
+        # The selector's {history} is compacted the same way as the agents' own histories
+        model_context=compacting_context(),
+        termination_condition=build_termination(),
+        selector_prompt=selector_prompt,
+        selector_func=pipeline_selector if SPEAKER_SELECTION == "pipeline" else selector_func,
+        allow_repeated_speaker=True,
+        max_turns=max_turns,
+    )
+
+
 
 
 # Load values from column O in the spreadsheet and run each as a separate task
-import openpyxl
+# import openpyxl
 from datetime import datetime
 spreadsheet_path = os.path.join(os.getcwd(), "input_spreadsheet", "test.xlsx")
 # wb = openpyxl.load_workbook(spreadsheet_path, data_only=True)
@@ -203,98 +436,297 @@ spreadsheet_path = os.path.join(os.getcwd(), "input_spreadsheet", "test.xlsx")
 #     if val and str(val).strip():
 #         criteria.append(str(val).strip())
 
-load_dotenv()
-
-team = SelectorGroupChat(
-    [planning_agent, blueprint_search_agent, data_analyst_agent, remediation_agent],
-
-    #[planning_agent, web_search_agent],
-    model_client=model_client,
-    termination_condition=termination,
-    selector_prompt=selector_prompt,
-    selector_func=selector_func,
-    allow_repeated_speaker=True,  # Allow an agent to speak multiple turns in a row.
-    max_turns=7,
-)
-
-
-
-# async def main():
-    #print (blueprint_search_tool.schema)
-#     results = []
-#     for guideline_description in criteria:
-#         task = f"Determine if this criteria has been satisfied with the current setup scripts: '{guideline_description}'"
-#         print(f"\n\n=== Running task: {guideline_description} ===\n\n")
-#         team.reset()
-#         result = await Console(team.run_stream(task=task))
-
-#         # Only append the final message (summary) from the result
-#         if hasattr(result, "messages") and result.messages:
-#             final_message = result.messages[-2].content
-#             final_message += "\n\n" + result.messages[-1].content
-#             results.append(f"{guideline_description}: {final_message}")
-#         else:
-#             results.append(f"{guideline_description}: [No summary found]")
-
-#     # Write results to output file
-#     now_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-#     output_path = os.path.join(os.getcwd(), f"output_guideline_results_{now_str}.html")
-#     with open(output_path, "w", encoding="utf-8") as f:
-#         f.write("""
-# <html>
-# <head>
-#     <title>Guideline Results</title>
-#     <style>
-#         body {
-#             font-family: 'Segoe UI', Arial, sans-serif;
-#             background: #f8f9fa;
-#             margin: 0;
-#             padding: 2em;
-#         }
-#         h1 {
-#             color: #2c3e50;
-#             margin-bottom: 1em;
-#         }
-#         ul {
-#             list-style: none;
-#             padding: 0;
-#         }
-#         li {
-#             background: #fff;
-#             margin-bottom: 1em;
-#             padding: 1em;
-#             border-radius: 8px;
-#             box-shadow: 0 2px 6px rgba(0,0,0,0.07);
-#         }
-#         strong {
-#             color: #2980b9;
-#             font-size: 1.1em;
-#         }
-#         .summary {
-#             display: block;
-#             margin-top: 0.5em;
-#             color: #444;
-#             white-space: pre-line;
-#         }
-#     </style>
-# </head>
-# <body>
-#     <h1>Guideline Results</h1>
-#     <ul>
-# """)
-#         for line in results:
-#             green = "GREEN" in line
-#             guideline, summary = line.split(":", 1) if ":" in line else (line, "")
-#             f.write(f"""        <li style="background: {'#d4edda' if green else '#f8d7da'};">
-#             <strong>{guideline.strip()}</strong>
-#             <span class="summary">{summary.strip()}</span>
-#         </li>
-# """)
-#         f.write("""
-#     </ul>
-# </body>
-# </html>
-# """)
-
-# if __name__ == "__main__":
-#     asyncio.run(main())
\ No newline at end of file
+def _build_default_team():
+    from autogen_agentchat.teams import SelectorGroupChat
+
+    global planning_agent, blueprint_search_agent, data_analyst_agent, remediation_agent, termination, team
+    planning_agent, blueprint_search_agent, data_analyst_agent, remediation_agent = build_agents()
+    termination = build_termination()
+    team = SelectorGroupChat(
+        [planning_agent, blueprint_search_agent, data_analyst_agent, remediation_agent],
+
+        #[planning_agent, web_search_agent],
+        model_client=get_model_router().client("Selector"),
+        termination_condition=termination,
+        selector_prompt=selector_prompt,
+        selector_func=selector_func,
+        allow_repeated_speaker=True,  # Allow an agent to speak multiple turns in a row.
+        max_turns=7,
+    )
+
+
+# Module attributes built on first access, e.g. `from main import model_client`
+_LAZY_ATTRIBUTES = {
+    "azure_model_client": _build_clients,
+    "model_client": _build_clients,
+    "small_azure_model_client": _build_small_clients,
+    "small_model_client": _build_small_clients,
+    "planning_agent": _build_default_team,
+    "blueprint_search_agent": _build_default_team,
+    "data_analyst_agent": _build_default_team,
+    "remediation_agent": _build_default_team,
+    "termination": _build_default_team,
+    "team": _build_default_team,
+}
+_lazy_lock = threading.RLock()
+
+
+def __getattr__(name):
+    build = _LAZY_ATTRIBUTES.get(name)
+    if build is None:
+        if name == "blueprint_store":
+            return get_blueprint_store()
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _lazy_lock:
+        if name not in globals():
+            build()
+    return globals()[name]
+
+
+def get_model_client():
+    return __getattr__("model_client")
+
+
+def get_azure_model_client():
+    return __getattr__("azure_model_client")
+
+
+def warm_up():
+    """
+    Build what the first job would otherwise wait for: the blueprint store and
+    index, the model clients and the agent classes. Returns the seconds taken.
+    """
+    start = time.perf_counter()
+    get_blueprint_index(get_blueprint_store())
+    get_model_client()
+    # Imports autogen's agent and team modules; the team itself is thrown away
+    build_team()
+    return time.perf_counter() - start
+
+
+# Headless batch runs, e.g. nightly: `python main.py annex.xlsx --concurrency 8`.
+# Each finished verdict is appended to a JSONL checkpoint the moment it is
+# decided, so a run that is interrupted picks up where it stopped when it is
+# started again with the same checkpoint. The HTML and JSON reports are written
+# once every criterion has a result.
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", os.path.join(os.getcwd(), "batch_results"))
+
+
+class Checkpoint:
+    """
+    Append-only JSONL of finished results, one record per line, keyed on the
+    criterion text. The last line for a criterion wins; errors and stopped
+    criteria don't count as done, so a resumed run tries them again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}  # criterion key -> (criterion index, ResultRecord)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        complete = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                complete += len(line)
+                try:
+                    data = json.loads(line)
+                    index = data.pop("criterion_index")
+                    record = ResultRecord.from_dict(data)
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"Skipping unreadable checkpoint line: {e}")
+                    continue
+                self.records[criterion_key(record.criterion)] = (index, record)
+        if complete < os.path.getsize(self.path):
+            # Cut short by the interruption; that criterion is simply evaluated again
+            with open(self.path, "ab") as f:
+                f.truncate(complete)
+
+    def done(self, criterion):
+        entry = self.records.get(criterion_key(criterion))
+        return entry is not None and entry[1].kind == "result"
+
+    def get(self, criterion):
+        entry = self.records.get(criterion_key(criterion))
+        return entry[1] if entry else None
+
+    def append(self, criterion_index, record):
+        line = json.dumps({"criterion_index": criterion_index, **record.as_dict()}) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.records[criterion_key(record.criterion)] = (criterion_index, record)
+
+
+async def run_batch(criteria, checkpoint, concurrency=4, use_cache=True, stats=None):
+    """
+    Evaluate the (index, criterion) pairs not yet done in `checkpoint`, up to
+    `concurrency` team runs at once, the same way the web app's job runner does:
+    rules and stored verdicts first, then related criteria grouped into one team
+    run. Every result is appended to the checkpoint as soon as it is decided.
+    Returns the RunStats of this run.
+    """
+    stats = stats if stats is not None else RunStats()
+    client = get_model_router(use_cache)
+    cascade = analyst_cascade(client)
+    semaphore = asyncio.Semaphore(concurrency)
+    evaluations = []
+
+    def decide_without_team(index, criterion):
+        start = time.perf_counter()
+        fast = rule_result(criterion)
+        if fast is None and use_cache:
+            fast = stored_result(criterion)
+        if fast is None:
+            return False
+        with collect_stats(fast.path, into=stats):
+            checkpoint.append(index, fast.timed(time.perf_counter() - start))
+        return True
+
+    async def evaluate(index, criterion, hits):
+        async with semaphore:
+            with collect_stats(into=stats) as criterion_stats:
+                try:
+                    with collect_evidence() as evidence:
+                        record_evidence(chunk for chunk, _score in hits)
+                        result = await build_team(max_turns=15, client=client).run(task=with_evidence(criterion_task(criterion), hits))
+                    record_turns(result.messages)
+                    record = format_result(criterion, result, evidence, cascade).timed(criterion_stats.elapsed())
+                    save_result(criterion, result, record, evidence)
+                except Exception as e:
+                    criterion_stats.path = "error"
+                    record = ResultRecord.error(criterion, f"Error evaluating criterion: {e}")
+                checkpoint.append(index, record)
+
+    async def evaluate_group(group, prefetched):
+        if len(group) == 1:
+            await evaluate(*group[0], prefetched[group[0][0]])
+            return
+        criteria = [criterion for _, criterion in group]
+        unanswered = []
+        async with semaphore:
+            hits = merge_evidence([prefetched[index] for index, _ in group])
+            with collect_stats(path="batch", into=stats, count=len(group)) as group_stats:
+                try:
+                    with collect_evidence() as evidence:
+                        record_evidence(chunk for chunk, _score in hits)
+                        result = await build_team(max_turns=15, client=client).run(task=with_evidence(batch_task(criteria), hits))
+                    record_turns(result.messages)
+                    for (index, criterion), record in zip(group, format_batch_result(criteria, result, evidence, cascade)):
+                        if record is None:
+                            unanswered.append((index, criterion))
+                            continue
+                        checkpoint.append(index, record.timed(group_stats.elapsed()))
+                        save_result(criterion, result, record, evidence)
+                    group_stats.count -= len(unanswered)
+                except Exception as e:
+                    group_stats.path = "error"
+                    for index, criterion in group:
+                        checkpoint.append(index, ResultRecord.error(criterion, f"Error evaluating criterion: {e}"))
+        # Criteria the summary didn't give a verdict for are evaluated on their own
+        await asyncio.gather(*(evaluate(index, criterion, prefetched[index]) for index, criterion in unanswered))
+
+    def schedule(window):
+        # As in the web runner: one batched evidence pass per window, then grouping
+        prefetched = dict(zip((index for index, _ in window), prefetch_evidence([criterion for _, criterion in window])))
+        for group in group_criteria(window, get_blueprint_index(get_blueprint_store()), BATCH_MAX_SIZE):
+            evaluations.append(asyncio.create_task(evaluate_group(group, prefetched)))
+
+    window = []
+    sizes = window_sizes()
+    window_size = next(sizes)
+    for index, criterion in criteria:
+        if checkpoint.done(criterion) or decide_without_team(index, criterion):
+            continue
+        window.append((index, criterion))
+        if len(window) >= window_size:
+            schedule(window)
+            window = []
+            window_size = next(sizes)
+            # Let the scheduled runs start while the rest is read and grouped
+            await asyncio.sleep(0)
+    if window:
+        schedule(window)
+    try:
+        await asyncio.gather(*evaluations)
+    finally:
+        for evaluation in evaluations:
+            evaluation.cancel()
+    return stats
+
+
+def main(argv=None):
+    """Command-line batch assessment; see `python main.py --help`."""
+    import argparse
+    import signal
+
+    from blueprint_index import pin_blueprints
+    from reports import write_reports
+    from spreadsheet import CRITERIA_COLUMN, CRITERIA_MIN_ROW, iter_criteria
+
+    parser = argparse.ArgumentParser(
+        description="Assess every criterion of a spreadsheet without the web server. Results are checkpointed "
+                    "as they come in; run the same command again to resume an interrupted run.",
+    )
+    parser.add_argument("spreadsheet", nargs="?", default=os.path.join("input_spreadsheet", "remediation_annex.xlsx"))
+    parser.add_argument("--column", default=CRITERIA_COLUMN, help="criteria column, a letter or 1-based number (default %(default)s)")
+    parser.add_argument("--min-row", type=int, default=CRITERIA_MIN_ROW, help="first row with criteria (default %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("CRITERIA_CONCURRENCY", "4")), help="team runs at once (default %(default)s)")
+    parser.add_argument("--limit", type=int, default=None, help="only the first N criteria")
+    parser.add_argument("--no-cache", action="store_true", help="re-evaluate every criterion with Azure instead of reusing stored verdicts and cached completions")
+    parser.add_argument("--output-dir", default=BATCH_OUTPUT_DIR, help="where the checkpoint and reports go (default %(default)s)")
+    parser.add_argument("--checkpoint", default=None, help="JSONL checkpoint to resume; default <output dir>/<spreadsheet>-<date>.jsonl, so each day starts afresh")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    criteria = list(enumerate(iter_criteria(args.spreadsheet, args.column, args.min_row)))[:args.limit]
+    os.makedirs(args.output_dir, exist_ok=True)
+    checkpoint_path = args.checkpoint or os.path.join(
+        args.output_dir, f"{os.path.splitext(os.path.basename(args.spreadsheet))[0]}-{datetime.now():%Y%m%d}.jsonl")
+    checkpoint = Checkpoint(checkpoint_path)
+    done = sum(checkpoint.done(criterion) for _, criterion in criteria)
+    print(f"{len(criteria)} criteria in {args.spreadsheet}; {done} already done in {checkpoint_path}")
+
+    async def run():
+        # A scheduler stopping the run (SIGTERM) is treated like Ctrl+C: the run is
+        # cancelled from the event loop rather than interrupted mid-callback
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except NotImplementedError:
+            pass  # Windows has no loop signal handlers; Ctrl+C still works
+        await run_batch(criteria, checkpoint, args.concurrency, not args.no_cache, stats)
+
+    stats = RunStats()
+    try:
+        # The whole run sees the blueprints as they were when it started
+        with pin_blueprints():
+            asyncio.run(run())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        done = sum(checkpoint.done(criterion) for _, criterion in criteria)
+        print(f"Interrupted with {done} of {len(criteria)} criteria done; run the same command again to resume")
+        return 130
+
+    rows = [(index, checkpoint.get(criterion)) for index, criterion in criteria]
+    stem = os.path.splitext(checkpoint_path)[0]
+    paths = write_reports(stem, rows, stats.as_dict(), source=args.spreadsheet, checkpoint=checkpoint_path)
+    # A criterion without a record (e.g. its checkpoint line was unreadable) counts as UNKNOWN
+    counts = verdict_counts(record for _, record in rows)
+    print(", ".join(f"{count} {verdict}" for verdict, count in sorted(counts.items())))
+    print(format_summary(stats.as_dict()))
+    print("Reports: " + ", ".join(paths))
+    # Non-zero when any criterion failed, so a scheduler can flag the run
+    return 1 if counts.get("ERROR") else 0
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(main())
@@ -0,0 +1,288 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Mapping, Optional, Sequence, Union
+
+from autogen_core.models import ChatCompletionClient, CreateResult
+
+# Run instrumentation: wall time, tokens, call counts and tool payload sizes.
+# Every measurement goes to two places - the process-wide registry rendered by
+# /metrics in Prometheus text format, and the RunStats of the criterion currently
+# being evaluated (a ContextVar, like the evidence collection in assessment_store)
+# which the runner folds into a per-job summary. Each web worker keeps its own
+# registry, as usual for multi-process Prometheus targets.
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._values = defaultdict(float)
+
+    def inc(self, name, help_text, value=1.0, **labels):
+        self._add(name, "counter", help_text, name, value, labels)
+
+    def set(self, name, help_text, value, **labels):
+        key = (name, name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help[name] = help_text
+            self._types[name] = "gauge"
+            self._values[key] = value
+
+    def observe(self, name, help_text, value, **labels):
+        # A Prometheus summary without quantiles: _sum and _count
+        self._add(name, "summary", help_text, name + "_sum", value, labels)
+        self._add(name, "summary", help_text, name + "_count", 1.0, labels)
+
+    def _add(self, name, kind, help_text, series, value, labels):
+        key = (name, series, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help[name] = help_text
+            self._types[name] = kind
+            self._values[key] += value
+
+    def render(self) -> str:
+        with self._lock:
+            values = dict(self._values)
+            help_texts = dict(self._help)
+            types = dict(self._types)
+        lines = []
+        for name in sorted(help_texts):
+            lines.append(f"# HELP {name} {help_texts[name]}")
+            lines.append(f"# TYPE {name} {types[name]}")
+            for (family, series, labels), value in sorted(values.items()):
+                if family != name:
+                    continue
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f"{series}{{{label_text}}} {value:g}" if label_text else f"{series} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REGISTRY = Registry()
+
+
+class RunStats:
+    """Totals for one criterion, or for a whole job once criteria are merged in."""
+
+    FIELDS = (
+        "criteria", "seconds", "model_calls", "cached_model_calls", "model_seconds",
+        "prompt_tokens", "completion_tokens", "tool_calls", "tool_seconds", "tool_bytes",
+        "turns", "selector_rule_picks", "selector_model_picks", "compacted_tokens", "model_retries",
+        "small_model_calls", "model_escalations",
+    )
+
+    def __init__(self, values=None):
+        self.values = defaultdict(float, values or {})
+        self.path = None  # for one criterion: rule, stored, team, batch, error or stopped
+        self.paths = defaultdict(int)  # how criteria were decided: rule, stored, team, batch, error
+        self.turns_by_agent = defaultdict(int)
+        self.started = time.perf_counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def add(self, field, value=1.0):
+        self.values[field] += value
+
+    def merge(self, other):
+        for field, value in other.values.items():
+            self.values[field] += value
+        for path, count in other.paths.items():
+            self.paths[path] += count
+        for agent, count in other.turns_by_agent.items():
+            self.turns_by_agent[agent] += count
+
+    def as_dict(self):
+        data = {field: round(self.values[field], 3) for field in self.FIELDS}
+        data["paths"] = dict(self.paths)
+        data["turns_by_agent"] = dict(self.turns_by_agent)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls({field: data.get(field, 0) for field in cls.FIELDS})
+        stats.paths.update(data.get("paths", {}))
+        stats.turns_by_agent.update(data.get("turns_by_agent", {}))
+        return stats
+
+
+stats_var = ContextVar("run_stats", default=None)
+
+
+def _current(field, value=1.0):
+    stats = stats_var.get()
+    if stats is not None:
+        stats.add(field, value)
+
+
+@contextmanager
+def collect_stats(path="team", into=None, count=1):
+    """
+    Attribute everything measured inside the block to a fresh RunStats for one
+    criterion (or `count` criteria decided together), merged into the job's
+    RunStats `into` when the block exits.
+    """
+    stats = RunStats()
+    stats.count = count  # lowered by a batch for criteria it hands back to be run alone
+    token = stats_var.set(stats)
+    try:
+        yield stats
+    finally:
+        stats_var.reset(token)
+        elapsed = stats.elapsed()
+        stats.add("criteria", stats.count)
+        stats.add("seconds", elapsed)
+        stats.path = stats.path or path
+        stats.paths[stats.path] += stats.count
+        for _ in range(stats.count):
+            record_criterion(stats.path, elapsed / stats.count)
+        if into is not None:
+            into.merge(stats)
+
+
+def record_model_call(agent, seconds, usage, cached, tier="large"):
+    REGISTRY.inc("assessor_model_calls_total", "Model completions, by agent, model tier and cache hit.", agent=agent, tier=tier, cached=str(bool(cached)).lower())
+    REGISTRY.observe("assessor_model_call_seconds", "Model completion wall time.", seconds, agent=agent, tier=tier)
+    REGISTRY.inc("assessor_model_tokens_total", "Model tokens, by agent and type.", usage.prompt_tokens, agent=agent, type="prompt")
+    REGISTRY.inc("assessor_model_tokens_total", "Model tokens, by agent and type.", usage.completion_tokens, agent=agent, type="completion")
+    _current("model_calls")
+    _current("small_model_calls", 1.0 if tier == "small" else 0.0)
+    _current("cached_model_calls", 1.0 if cached else 0.0)
+    _current("model_seconds", seconds)
+    _current("prompt_tokens", usage.prompt_tokens)
+    _current("completion_tokens", usage.completion_tokens)
+
+
+def record_retry(reason, delay):
+    # reason is "throttled" (429), "server" (5xx) or "connection"
+    REGISTRY.inc("assessor_model_retries_total", "Model calls retried, by reason.", reason=reason)
+    REGISTRY.observe("assessor_model_retry_delay_seconds", "Back-off before retrying a model call.", delay, reason=reason)
+    _current("model_retries")
+
+
+def record_cascade(agent, reason):
+    # reason is None when the small model's answer was kept
+    outcome = "kept" if reason is None else "escalated"
+    REGISTRY.inc("assessor_model_cascade_total", "Small-model answers kept or escalated to the large model, by agent and reason.", agent=agent, outcome=outcome, reason=reason or "")
+    if reason is not None:
+        _current("model_escalations")
+
+
+def record_concurrency_limit(limit, in_flight, rate=None):
+    REGISTRY.set("assessor_model_concurrency_limit", "Adaptive limit on concurrent model calls.", limit)
+    REGISTRY.set("assessor_model_in_flight", "Model calls currently in flight.", in_flight)
+    # 0 until the first 429
+    REGISTRY.set("assessor_model_call_rate", "Pace of model call starts after throttling, per second.", rate or 0.0)
+
+
+def record_tool_call(tool, seconds, payload_bytes):
+    REGISTRY.inc("assessor_tool_calls_total", "Agent tool calls, by tool.", tool=tool)
+    REGISTRY.observe("assessor_tool_call_seconds", "Agent tool call wall time.", seconds, tool=tool)
+    REGISTRY.inc("assessor_tool_payload_bytes_total", "Bytes returned by agent tools to the model.", payload_bytes, tool=tool)
+    _current("tool_calls")
+    _current("tool_seconds", seconds)
+    _current("tool_bytes", payload_bytes)
+
+
+def record_selection(agent):
+    # agent is None when selector_func leaves the choice to the model
+    mode = "model" if agent is None else "rule"
+    REGISTRY.inc("assessor_selector_decisions_total", "Speaker selections, by selected agent and how it was chosen.", agent=agent or "", mode=mode)
+    _current(f"selector_{mode}_picks")
+
+
+def record_turns(messages):
+    stats = stats_var.get()
+    for message in messages:
+        source = getattr(message, "source", "")
+        if source in ("", "user"):
+            continue
+        REGISTRY.inc("assessor_agent_turns_total", "Messages produced by each agent.", agent=source)
+        if stats is not None:
+            stats.add("turns")
+            stats.turns_by_agent[source] += 1
+
+
+def record_criterion(path, seconds):
+    REGISTRY.observe("assessor_criterion_seconds", "Wall time per criterion, by how it was decided.", seconds, path=path)
+
+
+def record_compaction(saved_tokens):
+    REGISTRY.inc("assessor_context_compacted_tokens_total", "Prompt tokens removed from agent and selector history by compaction.", saved_tokens)
+    _current("compacted_tokens", saved_tokens)
+
+
+def record_job(status):
+    REGISTRY.inc("assessor_jobs_total", "Finished jobs, by final status.", status=status)
+
+
+class InstrumentedClient(ChatCompletionClient):
+    """Delegating model client that times every completion and records its token usage."""
+
+    def __init__(self, client: ChatCompletionClient, agent: str = "", tier: str = "large"):
+        self._client = client
+        self._agent = agent
+        self._tier = tier
+
+    async def create(self, messages: Sequence[Any], **kwargs: Any) -> CreateResult:
+        start = time.perf_counter()
+        result = await self._client.create(messages, **kwargs)
+        record_model_call(self._agent, time.perf_counter() - start, result.usage, result.cached, self._tier)
+        return result
+
+    async def create_stream(self, messages: Sequence[Any], **kwargs: Any) -> AsyncGenerator[Union[str, CreateResult], None]:
+        start = time.perf_counter()
+        async for chunk in self._client.create_stream(messages, **kwargs):
+            if isinstance(chunk, CreateResult):
+                record_model_call(self._agent, time.perf_counter() - start, chunk.usage, chunk.cached, self._tier)
+            yield chunk
+
+    async def close(self) -> None:
+        await self._client.close()
+
+    def actual_usage(self):
+        return self._client.actual_usage()
+
+    def total_usage(self):
+        return self._client.total_usage()
+
+    def count_tokens(self, messages, **kwargs) -> int:
+        return self._client.count_tokens(messages, **kwargs)
+
+    def remaining_tokens(self, messages, **kwargs) -> int:
+        return self._client.remaining_tokens(messages, **kwargs)
+
+    @property
+    def capabilities(self):
+        return self._client.capabilities
+
+    @property
+    def model_info(self):
+        return self._client.model_info
+
+
+def format_summary(summary: Optional[Mapping]) -> str:
+    """Human-readable job summary for the report."""
+    if not summary:
+        return ""
+    paths = ", ".join(f"{count} {path}" for path, count in sorted(summary.get("paths", {}).items()))
+    turns = ", ".join(f"{agent} {count}" for agent, count in sorted(summary.get("turns_by_agent", {}).items()))
+    lines = [
+        f"Criteria: {summary['criteria']:g} ({paths or 'none'}) in {summary['seconds']:.1f}s of criterion time",
+        f"Model calls: {summary['model_calls']:g} ({summary['cached_model_calls']:g} from cache,"
+        f" {summary.get('model_retries', 0):g} retries, {summary.get('small_model_calls', 0):g} to the small model,"
+        f" {summary.get('model_escalations', 0):g} escalated), {summary['model_seconds']:.1f}s",
+        f"Tokens: {summary['prompt_tokens']:g} prompt, {summary['completion_tokens']:g} completion"
+        f" ({summary.get('compacted_tokens', 0):g} removed from history by compaction)",
+        f"Tool calls: {summary['tool_calls']:g}, {summary['tool_seconds']:.2f}s, {summary['tool_bytes'] / 1024:.1f} KiB returned",
+        f"Agent turns: {summary['turns']:g}" + (f" ({turns})" if turns else ""),
+        f"Speaker selection: {summary['selector_rule_picks']:g} by rule, {summary['selector_model_picks']:g} by model",
+    ]
+    return "\n".join(lines)
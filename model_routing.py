@@ -0,0 +1,169 @@
+import os
+import re
+from typing import Any, AsyncGenerator, Mapping, Optional, Sequence, Union
+
+from autogen_core.models import ChatCompletionClient, CreateResult, RequestUsage, UserMessage
+
+from criteria_groups import batch_size, section_verdicts
+from metrics import InstrumentedClient, record_cascade
+from result_records import last_verdict
+
+# Which deployment answers each agent role. There are two tiers - "large" (the
+# gpt-5 deployment) and "small" (a cheaper, faster one) - and a role can also be
+# set to "cascade": the small deployment answers first, and the same prompt goes
+# to the large one only when that answer has no clear GREEN/RED for every
+# criterion, reports low confidence or hedges. MODEL_ROUTES overrides the
+# defaults below, e.g. "PlanningAgent=large,DataAnalystAgent=small". Without a
+# small deployment every role uses the large one. The planner only plans and
+# summarises: when the DataAnalystAgent is on the cascade, a summary ending on
+# another verdict than its analysis gets the analysis' one added (see
+# evaluation.format_result), and that is the verdict recorded.
+TIERS = ("small", "large", "cascade")
+DEFAULT_ROUTES = {
+    "PlanningAgent": "small",
+    "SearchBlueprintAgent": "small",
+    "Selector": "small",
+    "DataAnalystAgent": "cascade",
+    "RemediationAgent": "large",
+}
+# Lowest confidence ("low", "medium" or "high") a small-model answer may state and still be kept
+CASCADE_MIN_CONFIDENCE = os.getenv("CASCADE_MIN_CONFIDENCE", "medium")
+CONFIDENCE_LEVELS = ("low", "medium", "high")
+CONFIDENCE_RE = re.compile(r"confidence\W{0,3}(low|medium|high)\b", re.IGNORECASE)
+HEDGE_RE = re.compile(
+    r"\b(unclear|uncertain|not sure|inconclusive|ambiguous|cannot (?:be )?determined?|can't determine|unable to (?:determine|verify|confirm))\b",
+    re.IGNORECASE,
+)
+# Added to the prompt of a cascading role, so the small model can say when it is unsure
+CONFIDENCE_INSTRUCTION = """
+        On the line before the verdict, state how sure you are as "Confidence: high", "Confidence: medium" or "Confidence: low".
+        """
+
+
+def parse_routes(spec) -> dict:
+    """{role: tier} from "Role=tier,Role=tier", on top of DEFAULT_ROUTES."""
+    routes = dict(DEFAULT_ROUTES)
+    for part in (spec or "").split(","):
+        if not part.strip():
+            continue
+        role, _, tier = part.partition("=")
+        role, tier = role.strip(), tier.strip().lower()
+        if tier not in TIERS:
+            raise ValueError(f"Unknown model tier {tier!r} for {role!r} in MODEL_ROUTES; expected one of {', '.join(TIERS)}")
+        routes[role] = tier
+    return routes
+
+
+MODEL_ROUTES = parse_routes(os.getenv("MODEL_ROUTES", ""))
+
+
+def escalation_reason(text, expected=1, min_confidence=CASCADE_MIN_CONFIDENCE) -> Optional[str]:
+    """Why a small-model answer should go to the large model, or None to keep it."""
+    if expected > 1:
+        if len(section_verdicts(text, expected)) < expected:
+            return "no_verdict"
+    elif last_verdict(text) is None:
+        return "no_verdict"
+    stated = CONFIDENCE_RE.findall(text)
+    if stated and min(CONFIDENCE_LEVELS.index(level.lower()) for level in stated) < CONFIDENCE_LEVELS.index(min_confidence):
+        return "low_confidence"
+    if HEDGE_RE.search(text):
+        return "hedged"
+    return None
+
+
+def _task_text(messages) -> str:
+    # The criterion (or numbered batch of criteria) is the first user message
+    for message in messages:
+        if isinstance(message, UserMessage) and isinstance(message.content, str):
+            return message.content
+    return ""
+
+
+class CascadeClient(ChatCompletionClient):
+    """
+    Answers with `small`, re-asking `large` when the answer isn't a confident
+    verdict. Tool calls and other non-text answers are kept as they are.
+    """
+
+    def __init__(self, small: ChatCompletionClient, large: ChatCompletionClient, role: str = ""):
+        self._small = small
+        self._large = large
+        self._role = role
+        self._last_client = large
+
+    async def create(self, messages: Sequence[Any], **kwargs: Any) -> CreateResult:
+        result = await self._small.create(messages, **kwargs)
+        reason = None
+        if isinstance(result.content, str):
+            reason = escalation_reason(result.content, batch_size(_task_text(messages)))
+        record_cascade(self._role, reason)
+        if reason is None:
+            self._last_client = self._small
+            return result
+        self._last_client = self._large
+        return await self._large.create(messages, **kwargs)
+
+    async def create_stream(self, messages: Sequence[Any], **kwargs: Any) -> AsyncGenerator[Union[str, CreateResult], None]:
+        # The whole answer is needed before deciding whether to keep it, so nothing streams early
+        result = await self.create(messages, **kwargs)
+        if isinstance(result.content, str):
+            yield result.content
+        yield result
+
+    async def close(self) -> None:
+        await self._small.close()
+        await self._large.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self._last_client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        small, large = self._small.total_usage(), self._large.total_usage()
+        return RequestUsage(
+            prompt_tokens=small.prompt_tokens + large.prompt_tokens,
+            completion_tokens=small.completion_tokens + large.completion_tokens,
+        )
+
+    def count_tokens(self, messages, **kwargs) -> int:
+        return self._large.count_tokens(messages, **kwargs)
+
+    def remaining_tokens(self, messages, **kwargs) -> int:
+        # Whatever is sent to the small model may be sent on to the large one
+        return min(self._small.remaining_tokens(messages, **kwargs), self._large.remaining_tokens(messages, **kwargs))
+
+    @property
+    def capabilities(self):
+        return self._large.capabilities
+
+    @property
+    def model_info(self):
+        return self._large.model_info
+
+
+class ModelRouter:
+    """
+    Hands each agent role its (instrumented) model client according to `routes`.
+    Any ChatCompletionClient can be used for either tier, e.g. local stubs in tests.
+    """
+
+    def __init__(self, large: ChatCompletionClient, small: Optional[ChatCompletionClient] = None, routes: Optional[Mapping[str, str]] = None):
+        self.large = large
+        self.small = small
+        self.routes = dict(MODEL_ROUTES if routes is None else routes)
+
+    def tier(self, role) -> str:
+        if self.small is None:
+            return "large"
+        return self.routes.get(role, "large")
+
+    def client(self, role) -> ChatCompletionClient:
+        tier = self.tier(role)
+        if tier == "cascade":
+            return CascadeClient(InstrumentedClient(self.small, role, "small"), InstrumentedClient(self.large, role, "large"), role)
+        return InstrumentedClient(self.small if tier == "small" else self.large, role, tier)
+
+
+def as_router(client) -> ModelRouter:
+    """A ModelRouter as is; a single client serves every role."""
+    return client if isinstance(client, ModelRouter) else ModelRouter(client)
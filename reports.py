@@ -0,0 +1,317 @@
+import csv
+import glob
+import hashlib
+import html
+import importlib.util
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: the in-process lock is all there is
+    fcntl = None
+# python-docx is only imported when a DOCX is first built
+DOCX_AVAILABLE = importlib.util.find_spec("docx") is not None
+
+from evaluation import render_result_item
+from metrics import format_summary
+from result_records import verdict_counts
+
+# Report exports for a job, kept up to date as results come in rather than rebuilt
+# per download. The HTML item fragments, JSON lines and CSV rows are appended to
+# files under REPORT_DIR/<job id>/ as each result is stored; the DOCX document is
+# held in memory and only gets the results added since it was last saved. Every
+# artifact is caught up from the job store before it is served, so any worker can
+# serve any job, and each carries an ETag of the results and run summary it covers.
+REPORT_DIR = os.getenv("REPORT_DIR", os.path.join(os.getcwd(), ".cache", "reports"))
+# DOCX documents kept in memory; others are rebuilt from the job store when next downloaded
+REPORT_DOCX_CACHE = int(os.getenv("REPORT_DOCX_CACHE", "8"))
+REPORT_FORMATS = {
+    "html": "text/html; charset=utf-8",
+    "json": "application/json",
+    "csv": "text/csv; charset=utf-8",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+CSV_COLUMNS = ["position", "criterion_index", "verdict", "criterion", "summary", "remediation", "evidence_files", "seconds"]
+# Bumped when the layout of the appended artifacts changes; older ones are rebuilt
+REPORT_VERSION = 1
+CHUNK_SIZE = 64 * 1024
+
+REPORT_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Guideline Results</title>
+    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;600&display=swap" rel="stylesheet">
+    <style>
+        body { font-family: 'Inter', 'Segoe UI', Arial, sans-serif; background: linear-gradient(120deg, #f8f9fa 0%, #e3e6ea 100%); margin: 0; padding: 2em; }
+        h1 { color: #1a2636; margin-bottom: 2em; font-weight: 600; font-size: 2.2em; }
+        ul { list-style: none; padding: 0; max-width: 900px; margin: 0 auto; }
+        li { background: #fff; margin-bottom: 2em; padding: 2em 2em 1em 2em; border-radius: 16px; box-shadow: 0 4px 24px rgba(30,40,60,0.08); border-left: 8px solid #4fd18b; transition: box-shadow 0.2s; }
+        li.red { border-left: 8px solid #e74c3c; }
+        .guideline { color: #2980b9; font-size: 1.2em; font-weight: 600; margin-bottom: 1em; display: block; }
+        .summary { margin-top: 0.5em; color: #222; font-size: 1em; }
+        .run-summary { max-width: 900px; margin: 0 auto 2em auto; white-space: pre-wrap; }
+        @media (max-width: 600px) { body { padding: 0.5em; } ul { padding: 0; } li { padding: 1em; } }
+        pre, code { background: #f4f6fa; border-radius: 6px; padding: 0.2em 0.5em; font-size: 0.95em; }
+        blockquote { border-left: 4px solid #4fd18b; margin: 1em 0; padding-left: 1em; color: #555; background: #f8f9fa; }
+        table { border-collapse: collapse; width: 100%; margin: 1em 0; }
+        th, td { border: 1px solid #e3e6ea; padding: 0.5em 1em; }
+        th { background: #f4f6fa; }
+    </style>
+</head>
+<body>
+    <h1>Guideline Results</h1>
+"""
+REPORT_TAIL = "</ul></body></html>\n"
+
+
+def html_summary(summary):
+    if not summary:
+        return "<ul>\n"
+    return f'<pre class="run-summary">{html.escape(format_summary(summary))}</pre>\n<ul>\n'
+
+
+def report_etag(fmt, count, status, summary, replaced=0):
+    digest = hashlib.sha1(json.dumps([fmt, count, status, summary or {}, replaced], sort_keys=True).encode("utf-8")).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def _write_atomic(path, write):
+    # Written next to the target and renamed over it, so a download never sees half a file
+    # and a failed write leaves nothing behind
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class JobReport:
+    """The export artifacts of one job, and how many of its results they cover."""
+
+    def __init__(self, job_id, directory):
+        self.job_id = job_id
+        self.directory = directory
+        self.items_path = os.path.join(directory, "items.html")
+        self.jsonl_path = os.path.join(directory, "results.jsonl")
+        self.csv_path = os.path.join(directory, "results.csv")
+        self.docx_path = os.path.join(directory, "results.docx")
+        self.state_path = os.path.join(directory, "state.json")
+        self.lock = threading.Lock()
+        self.document = None
+        self.document_rows = 0
+        self.document_replaced = 0
+        self.summary_paragraph = None
+
+    def _load_state(self, replaced):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        # A resumed job re-ran criteria in place of their stopped / error results, so the
+        # artifacts are rebuilt rather than appended to
+        if state.get("version") != REPORT_VERSION or state.get("replaced", 0) != replaced:
+            return {"version": REPORT_VERSION, "rows": 0, "offsets": {}, "replaced": replaced}
+        return state
+
+    def _save_state(self, state):
+        def write(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+        _write_atomic(self.state_path, write)
+
+    def _file_lock(self):
+        handle = open(os.path.join(self.directory, ".lock"), "a")
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def catch_up(self, store):
+        """Append results stored since the last update to the text artifacts; returns the row count."""
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with self._file_lock():
+                # Read before the rows, so a replacement made in between is picked up next time
+                job = store.get(self.job_id)
+                replaced = job.replaced if job is not None else 0
+                state = self._load_state(replaced)
+                rows = store.rows(self.job_id, state["rows"])
+                if not rows:
+                    return state["rows"]
+                paths = {"items": self.items_path, "jsonl": self.jsonl_path, "csv": self.csv_path}
+                for name, path in paths.items():
+                    # Drop anything written after the last recorded state, e.g. by an interrupted update
+                    offset = state["offsets"].get(name, 0)
+                    with open(path, "ab") as f:
+                        f.truncate(offset)
+                new_csv = state["offsets"].get("csv", 0) == 0
+                with open(self.items_path, "a", encoding="utf-8") as items, \
+                        open(self.jsonl_path, "a", encoding="utf-8") as jsonl, \
+                        open(self.csv_path, "a", encoding="utf-8", newline="") as csv_file:
+                    writer = csv.writer(csv_file)
+                    if new_csv:
+                        writer.writerow(CSV_COLUMNS)
+                    for position, criterion_index, record, item_html in rows:
+                        items.write(item_html + "\n")
+                        jsonl.write(json.dumps({"position": position, "criterion_index": criterion_index, **record.as_dict()}) + "\n")
+                        writer.writerow([position, criterion_index, record.verdict.value, record.criterion, record.summary,
+                                         record.remediation, "; ".join(record.evidence_files), record.seconds])
+                state = {
+                    "version": REPORT_VERSION,
+                    "rows": rows[-1][0] + 1,
+                    "offsets": {name: os.path.getsize(path) for name, path in paths.items()},
+                    "replaced": replaced,
+                }
+                self._save_state(state)
+                return state["rows"]
+
+    def docx(self, store, job, tag):
+        """Path of the saved DOCX for the current results and summary, saving it if stale."""
+        if not DOCX_AVAILABLE:
+            raise RuntimeError("python-docx not installed")
+        from docx import Document
+
+        with self.lock:
+            tag_path = self.docx_path + ".etag"
+            if os.path.exists(self.docx_path) and _read(tag_path) == tag:
+                return self.docx_path
+            if self.document is not None and self.document_replaced != job.replaced:
+                self.document = None
+            if self.document is None:
+                self.document = Document()
+                self.document.add_heading("Remediation Results", 0)
+                # Filled in on every save; the results below it are only ever appended
+                self.document.add_heading("Run summary", level=1)
+                self.summary_paragraph = self.document.add_paragraph()
+                self.document_rows = 0
+                self.document_replaced = job.replaced
+            for position, _index, record, _html in store.rows(self.job_id, self.document_rows):
+                self.document.add_heading(record.criterion, level=1)
+                details = f"Verdict: {record.verdict.value}"
+                if record.evidence_files:
+                    details += f" (evidence: {', '.join(record.evidence_files)})"
+                self.document.add_paragraph(details)
+                if record.remediation:
+                    self.document.add_paragraph(record.remediation)
+                self.document.add_paragraph(record.summary)
+                self.document_rows = position + 1
+            self.summary_paragraph.text = format_summary(job.summary) if job.summary else ""
+            _write_atomic(self.docx_path, self.document.save)
+            _write_text(tag_path, tag)
+            return self.docx_path
+
+    def html_chunks(self, job):
+        yield REPORT_HEAD + html_summary(job.summary)
+        yield from _file_chunks(self.items_path)
+        yield REPORT_TAIL
+
+    def csv_chunks(self, job):
+        if not os.path.exists(self.csv_path):
+            yield ",".join(CSV_COLUMNS) + "\r\n"
+        yield from _file_chunks(self.csv_path)
+
+    def json_chunks(self, job):
+        yield json.dumps({"task_id": self.job_id, "status": job.status, "summary": job.summary or {}})[:-1] + ', "results": ['
+        # One record per line, and JSON strings never contain a raw newline, so the
+        # separators can be swapped for commas chunk by chunk; the final one is dropped
+        pending = ""
+        for chunk in _file_chunks(self.jsonl_path):
+            chunk = chunk.replace("\n", ",")
+            yield pending + chunk[:-1]
+            pending = chunk[-1:]
+        yield "]}"
+
+
+def write_reports(stem, rows, summary, **meta):
+    """
+    Standalone HTML and JSON reports, stem + ".html" and stem + ".json", for
+    (criterion index, ResultRecord) rows, as the batch runner writes them. A row
+    without a record is only counted, as UNKNOWN. `meta` (e.g. the source
+    spreadsheet) goes at the top of the JSON. Returns the paths.
+    """
+    counts = verdict_counts(record for _index, record in rows)
+    rows = [(index, record) for index, record in rows if record is not None]
+
+    def write_html(path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(REPORT_HEAD + html_summary(summary))
+            for _index, record in rows:
+                f.write(render_result_item(record) + "\n")
+            f.write(REPORT_TAIL)
+
+    def write_json(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({**meta, "summary": summary or {}, "counts": counts,
+                       "results": [{"criterion_index": index, **record.as_dict()} for index, record in rows]}, f, indent=1)
+
+    paths = [stem + ".html", stem + ".json"]
+    _write_atomic(paths[0], write_html)
+    _write_atomic(paths[1], write_json)
+    return paths
+
+
+def _read(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_text(path, text):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    _write_atomic(path, write)
+
+
+def _file_chunks(path):
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+class ReportCache:
+    def __init__(self, directory=REPORT_DIR, docx_cache=REPORT_DOCX_CACHE):
+        self.directory = directory
+        self.docx_cache = docx_cache
+        self._reports = {}
+        self._lock = threading.Lock()
+
+    def get(self, job_id) -> JobReport:
+        with self._lock:
+            report = self._reports.pop(job_id, None) or JobReport(job_id, os.path.join(self.directory, job_id))
+            # Most recently used last; the others give up their in-memory DOCX
+            self._reports[job_id] = report
+            for old in list(self._reports.values())[:-self.docx_cache or None]:
+                if old.document is not None and old.lock.acquire(blocking=False):
+                    old.document = None
+                    old.lock.release()
+            return report
+
+    def cleanup(self):
+        """Remove temporary files left behind by a worker that died mid-write."""
+        for path in glob.glob(os.path.join(self.directory, "*", "*.tmp")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_report_cache = None
+_report_cache_lock = threading.Lock()
+
+
+def get_report_cache() -> ReportCache:
+    global _report_cache
+    with _report_cache_lock:
+        if _report_cache is None:
+            _report_cache = ReportCache()
+        return _report_cache
@@ -0,0 +1,116 @@
+import json
+import os
+import re
+from dataclasses import asdict, dataclass, replace
+from enum import Enum
+
+# Job results as structured records instead of "criterion: message" strings. The
+# verdict, remediation and evidence files are worked out once, when the result is
+# produced, and stored with it (see job_store), so the rendered item, the exports
+# and the /results query read fields rather than re-parsing text - criteria often
+# contain colons of their own.
+
+
+class Verdict(str, Enum):
+    GREEN = "GREEN"
+    RED = "RED"
+    UNKNOWN = "UNKNOWN"  # the summary didn't end with either
+    ERROR = "ERROR"
+    STOPPED = "STOPPED"
+
+
+# Whole words only, so e.g. "CONFIGURED" doesn't read as RED
+VERDICT_RE = re.compile(r"\b(GREEN|RED)\b")
+
+
+def last_verdict(text):
+    """
+    The last GREEN or RED written as a word, e.g. GREEN for "not RED ... overall
+    GREEN. No change REQUIRED."; None when there is neither. Every verdict in the
+    pipeline (selector, cascade, batch sections, records) is read with this.
+    """
+    found = VERDICT_RE.findall(text or "")
+    return Verdict(found[-1]) if found else None
+
+
+def extract_verdict(summary) -> Verdict:
+    """The last GREEN/RED in the closing two paragraphs of a summary."""
+    paragraphs = [p.strip() for p in (summary or "").split("\n") if p.strip()]
+    return last_verdict("\n".join(paragraphs[-2:])) or Verdict.UNKNOWN
+
+
+def verdict_counts(records):
+    """{verdict: count} for records; a missing record (None) counts as UNKNOWN."""
+    counts = {}
+    for record in records:
+        verdict = record.verdict.value if record is not None else Verdict.UNKNOWN.value
+        counts[verdict] = counts.get(verdict, 0) + 1
+    return counts
+
+
+def evidence_files(chunk_ids):
+    """Blueprint file names from chunk ids ("<doc id>:<line>") or fact locations."""
+    return tuple(sorted({os.path.basename(chunk_id.rsplit(":", 1)[0]) for chunk_id in chunk_ids}))
+
+
+@dataclass(frozen=True)
+class ResultRecord:
+    criterion: str
+    verdict: Verdict
+    summary: str
+    remediation: str = ""
+    evidence_files: tuple = ()
+    seconds: float = 0.0
+    path: str = "team"  # how it was decided: rule, stored, team, batch, error or stopped
+
+    @classmethod
+    def create(cls, criterion, summary, remediation="", **fields):
+        return cls(criterion, extract_verdict(summary), summary, remediation, **fields)
+
+    @classmethod
+    def error(cls, criterion, message):
+        return cls(criterion, Verdict.ERROR, f"[{message}]", path="error")
+
+    @classmethod
+    def stopped(cls, criterion):
+        return cls(criterion, Verdict.STOPPED, "[Stopped by user]", path="stopped")
+
+    @property
+    def kind(self):
+        # The job store's result kind: only "result"s count as done when a job resumes
+        return {Verdict.ERROR: "error", Verdict.STOPPED: "stopped"}.get(self.verdict, "result")
+
+    @property
+    def message(self):
+        """Summary with the remediation steps in front of it, as the results list shows it."""
+        if not self.remediation:
+            return self.summary
+        return f'<span><small class="remediation-steps">{self.remediation}</small></span><br>{self.summary}'
+
+    @property
+    def line(self):
+        return f"{self.criterion}: {self.message}"
+
+    def timed(self, seconds):
+        return replace(self, seconds=round(seconds, 3))
+
+    def as_dict(self):
+        data = asdict(self)
+        data["verdict"] = self.verdict.value
+        data["evidence_files"] = list(self.evidence_files)
+        return data
+
+    def to_json(self):
+        return json.dumps(self.as_dict())
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data["verdict"] = Verdict(data["verdict"])
+        data["evidence_files"] = tuple(data.get("evidence_files", ()))
+        return cls(**data)
+
+    @classmethod
+    def from_stored(cls, text):
+        """A record saved with to_json()."""
+        return cls.from_dict(json.loads(text))
@@ -0,0 +1,258 @@
+import re
+from dataclasses import dataclass
+from typing import Callable
+
+from settings_facts import get_fact_table
+
+# Rule-based fast path ahead of the agent team. Each rule recognises a family of
+# criteria from their wording and checks the matching facts from the settings
+# fact table. A rule only answers when it finds the setting in the blueprints;
+# otherwise the criterion falls through to run_team as before.
+#
+# A rule's verdict is final, so rules only take criteria that ask for the one
+# setting they check: the pattern spells out what that setting does, `exclude`
+# lists wording for neighbouring requirements the setting doesn't cover (HSMs,
+# SSH keys, untrusted publishers, ...), and criteria with more than one clause
+# (bullet lists, several sentences, "when ..." conditions) always go to the team.
+
+# Lists, semicolons, several sentences or a condition mean more than one requirement
+COMPOUND_RE = re.compile(r"[\n•;]|:\s|\.\s+\w|^\s*(when|where|if|unless)\b|\b(unless|except|preferred|preferably)\b", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class Rule:
+    rule_id: str
+    pattern: str  # regex matched (case-insensitively) against the criterion text
+    description: str
+    lookup: Callable  # FactTable -> list of lists of facts, one list per required setting
+    check: Callable  # fact value -> bool, or a dict of such checks keyed by lower-cased setting name
+    expected: str
+    remediation: str
+    exclude: str = ""  # regex for wording the setting doesn't cover; a match sends the criterion to the team
+
+    def matches(self, criterion):
+        if not re.search(self.pattern, criterion, re.IGNORECASE):
+            return False
+        return not (self.exclude and re.search(self.exclude, criterion, re.IGNORECASE))
+
+    def passes(self, fact):
+        check = self.check.get(fact.name.lower()) if isinstance(self.check, dict) else self.check
+        return check(fact.value)
+
+
+@dataclass(frozen=True)
+class RuleResult:
+    rule: Rule
+    verdict: str
+    facts: list
+
+
+def _number(value):
+    try:
+        return int(str(value).strip(), 0)
+    except ValueError:
+        return None
+
+
+def equals(expected):
+    return lambda value: _number(value) == expected
+
+
+def at_most(limit):
+    return lambda value: _number(value) is not None and 0 <= _number(value) <= limit
+
+
+def at_least(limit):
+    return lambda value: _number(value) is not None and _number(value) >= limit
+
+
+def choice_enabled(value):
+    # Settings catalog choice values end in _1 when the policy is enabled
+    return str(value).endswith("_1")
+
+
+def registry(*names, path=None):
+    return lambda table: [table.registry(name, path) for name in names]
+
+
+def intune(*settings):
+    return lambda table: [table.intune(setting) for setting in settings]
+
+
+def registry_rule(rule_id, pattern, description, names, path, check, expected, data, exclude=""):
+    remediation = "\n".join(
+        f"New-ItemProperty -Path \"{path_hint}\" -Name {name} -Value {data} -PropertyType DWORD -Force"
+        for name, path_hint in names
+    )
+    return Rule(
+        rule_id, pattern, description,
+        registry(*(name for name, _ in names), path=path),
+        check, expected,
+        f"Set the registry value(s) as follows:\n```powershell\n{remediation}\n```",
+        exclude,
+    )
+
+
+RULES = [
+    registry_rule(
+        "smb-idle-disconnect", r"\b(smb|server message block|lan ?manager server)\b.*\b(idle|inactiv|disconnect)|\b(idle|inactiv)\w*\b.*\b(smb|server message block)\b",
+        "SMB server idle sessions are disconnected",
+        [("autodisconnect", r"HKLM:\SYSTEM\CurrentControlSet\Services\LanManServer\Parameters")], r"LanManServer\\Parameters",
+        at_most(15), "autodisconnect of 15 minutes or less", 15,
+    ),
+    registry_rule(
+        "netlogon-strong-key", r"secure channel.*strong (session )?key|strong (session )?key.*secure channel",
+        "Netlogon secure channel requires a strong session key",
+        [("RequireStrongKey", r"HKLM:\SYSTEM\CurrentControlSet\Services\Netlogon\Parameters")], r"Netlogon\\Parameters",
+        equals(1), "RequireStrongKey = 1", 1,
+    ),
+    registry_rule(
+        "netlogon-sign-seal", r"secure channel.*\b(sign|seal|encrypt)|\b(sign|seal|encrypt)\w*\b.*secure channel",
+        "Netlogon secure channel traffic is signed and sealed",
+        [(name, r"HKLM:\SYSTEM\CurrentControlSet\Services\Netlogon\Parameters") for name in ("RequireSignOrSeal", "SealSecureChannel", "SignSecureChannel")],
+        r"Netlogon\\Parameters", equals(1), "RequireSignOrSeal, SealSecureChannel and SignSecureChannel = 1", 1,
+    ),
+    Rule(
+        "machine-account-password", r"machine account password",
+        "Machine account passwords are changed regularly",
+        registry("DisablePasswordChange", "MaximumPasswordAge", path=r"Netlogon\\Parameters"),
+        {"disablepasswordchange": equals(0), "maximumpasswordage": at_most(30)},
+        "DisablePasswordChange = 0 and MaximumPasswordAge of 30 days or less",
+        "Set the registry values as follows:\n```powershell\n"
+        "New-ItemProperty -Path \"HKLM:\\SYSTEM\\CurrentControlSet\\Services\\Netlogon\\Parameters\" -Name DisablePasswordChange -Value 0 -PropertyType DWORD -Force\n"
+        "New-ItemProperty -Path \"HKLM:\\SYSTEM\\CurrentControlSet\\Services\\Netlogon\\Parameters\" -Name MaximumPasswordAge -Value 30 -PropertyType DWORD -Force\n```",
+    ),
+    registry_rule(
+        "ldap-client-signing", r"\bldap\b.*\b(sign|integrity)",
+        "LDAP client signing is negotiated or required",
+        [("LDAPClientIntegrity", r"HKLM:\System\CurrentControlSet\Services\LDAP")], r"Services\\LDAP",
+        at_least(1), "LDAPClientIntegrity of 1 (negotiate) or 2 (require)", 1,
+    ),
+    registry_rule(
+        "null-session-fallback", r"null session",
+        "NTLM null session fallback is disabled",
+        [("allownullsessionfallback", r"HKLM:\System\CurrentControlSet\Control\LSA\MSV1_0")], r"MSV1_0",
+        equals(0), "allownullsessionfallback = 0", 0,
+    ),
+    registry_rule(
+        "everyone-includes-anonymous", r"anonymous.*\beveryone\b|\beveryone\b.*anonymous",
+        "Everyone permissions are not applied to anonymous users",
+        [("EveryoneIncludesAnonymous", r"HKLM:\System\CurrentControlSet\Control\Lsa")], r"Control\\Lsa",
+        equals(0), "EveryoneIncludesAnonymous = 0", 0,
+    ),
+    registry_rule(
+        "object-case-insensitivity", r"case.?insensitiv",
+        "Case insensitivity is required for non-Windows subsystems",
+        [("ObCaseInsensitive", r"HKLM:\SYSTEM\CurrentControlSet\Control\Session Manager\Kernel")], r"Session Manager\\Kernel",
+        equals(1), "ObCaseInsensitive = 1", 1,
+    ),
+    registry_rule(
+        "global-object-permissions", r"internal system objects|global (system )?objects",
+        "Default permissions of internal system objects are strengthened",
+        [("ProtectionMode", r"HKLM:\SYSTEM\CurrentControlSet\Control\Session Manager")], r"Session Manager$",
+        equals(1), "ProtectionMode = 1", 1,
+    ),
+    registry_rule(
+        "fips-algorithms", r"\bfips[- ](140[- ]?[23]?[- ]?)?(compliant|approved|validated)\b.*\b(algorithms?|cryptograph\w*)\b",
+        "FIPS compliant algorithms are used",
+        [("Enabled", r"HKLM:\SYSTEM\CurrentControlSet\Control\Lsa\FIPSAlgorithmPolicy")], r"FIPSAlgorithmPolicy",
+        equals(1), "FIPSAlgorithmPolicy Enabled = 1", 1,
+        exclude=r"\bML-|\bFIPS 20\d\b|\b(quantum|kyber|dilithium|hsm|hardware security module)\b",
+    ),
+    registry_rule(
+        "strong-key-protection", r"\bstrong key protection\b|\buser keys? stored on the (computer|device|workstation)\b.*\b(protect|password|prompt)",
+        "Strong key protection is forced for user keys",
+        [("ForceKeyProtection", r"HKLM:\SOFTWARE\Policies\Microsoft\Cryptography")], r"Cryptography",
+        at_least(1), "ForceKeyProtection of 1 or 2", 2,
+        exclude=r"\b(hsm|hardware security module|ssh|ca servers?|certificate authorit\w*|ad cs|passphrase|key encryption key|smart ?card|tpm)\b",
+    ),
+    registry_rule(
+        "domain-credential-storage", r"\b(stor|sav|cach)\w*\b.*\b(network|domain)\b.*\b(password|credential)s?\b",
+        "Passwords and credentials for network authentication are not stored",
+        [("DisableDomainCreds", r"HKLM:\SYSTEM\CurrentControlSet\Control\Lsa")], r"Control\\Lsa",
+        equals(1), "DisableDomainCreds = 1", 1,
+    ),
+    registry_rule(
+        "audit-subcategories", r"audit\w*\b.*subcategor|subcategor\w*\b.*audit",
+        "Audit policy subcategory settings override category settings",
+        [("SCENoApplyLegacyAuditPolicy", r"HKLM:\System\CurrentControlSet\Control\Lsa")], r"Control\\Lsa",
+        equals(1), "SCENoApplyLegacyAuditPolicy = 1", 1,
+    ),
+    registry_rule(
+        "ole-package-activation", r"\bole\b|object linking and embedding",
+        "Activation of OLE packages in Office is prevented",
+        [("PackagerPrompt", r"HKCU:\Software\Microsoft\Office\16.0\<app>\Security")], r"Office\\16\.0\\\w+\\Security",
+        equals(2), "PackagerPrompt = 2", 2,
+    ),
+    registry_rule(
+        "macros-trusted-publishers", r"\bmacros?\b.*\b(signed by|from) an? trusted publishers?\b",
+        "VBA macros must be signed by a trusted publisher",
+        [("vbarequirelmtrustedpublisher", r"HKCU:\Software\Policies\Microsoft\office\16.0\<app>\security")], r"office\\16\.0",
+        equals(1), "vbarequirelmtrustedpublisher = 1", 1,
+        exclude=r"\buntrusted\b|\bsandbox\w*|\btrusted locations?\b|\bmessage bar\b|\bbackstage\b|\bsignatures? (is|are) (validated|verified)\b",
+    ),
+    Rule(
+        "macros-from-internet", r"macros?\b.*\b(internet|web)\b",
+        "Office macros in files originating from the internet are blocked",
+        intune(r"l_blockmacroexecutionfrominternet$"),
+        choice_enabled, "the 'Block macros from running in Office files from the Internet' settings enabled",
+        "Enable 'Block macros from running in Office files from the Internet' for every Office application in the Intune Office hardening policy.",
+    ),
+    Rule(
+        "screen-lock-timeout",
+        r"\b(screen ?saver|screen lock|session lock|sessions?|screens?|workstations?|systems?)\b.*\b(lock\w*|activat\w*|time ?out)\b.*\b(after|within)\b.*\b(\d+|fifteen|ten|five) (minutes?|mins?|seconds?)\b.*\binactiv\w*"
+        r"|\b(screen ?saver|screen lock) time ?out\b",
+        "Sessions are locked after a period of inactivity",
+        intune(r"screensavertimeout_screensavertimeoutfreqspin$"),
+        at_most(900), "a screen saver timeout of 900 seconds or less",
+        "Set the 'Screen saver timeout' policy to 900 seconds or less in the Intune Windows hardening policy.",
+        r"\b(ssh|agent|key cach\w*|password|passcode|re-?authenticat\w*|conceal\w*|power sav\w*|overall session|session time|manually|blocks access|services?)\b",
+    ),
+]
+
+
+def evaluate_rules(criterion, table, rules=RULES):
+    """
+    First rule that matches a single-requirement criterion and whose settings are all
+    present in the fact table, as a RuleResult; None when no rule can decide the criterion.
+    """
+    if COMPOUND_RE.search(criterion.strip()):
+        return None
+    for rule in rules:
+        if not rule.matches(criterion):
+            continue
+        groups = rule.lookup(table)
+        if not groups or any(not facts for facts in groups):
+            # Recognised, but the setting isn't in the blueprints - let the agents look wider
+            continue
+        facts = [fact for facts in groups for fact in facts]
+        verdict = "GREEN" if all(rule.passes(fact) for fact in facts) else "RED"
+        return RuleResult(rule, verdict, facts)
+    return None
+
+
+def format_rule_result(result):
+    rule = result.rule
+    evidence = []
+    for fact in result.facts:
+        ok = "meets" if rule.passes(fact) else "does not meet"
+        if fact.kind == "registry":
+            evidence.append(f"- `{fact.location()}` sets `{fact.name}` = `{fact.value}` under `{fact.key}` ({ok} the requirement)")
+        elif fact.kind == "intune":
+            evidence.append(f"- `{fact.location()}` ({fact.resource}) sets `{fact.key}` = `{fact.value}` ({ok} the requirement)")
+        else:
+            evidence.append(f"- `{fact.location()}` sets {fact.key} `{fact.resource}` `{fact.name}` = `{fact.value}` ({ok} the requirement)")
+    parts = [
+        f"**Rule-based assessment** (`{rule.rule_id}`): {rule.description}. Expected {rule.expected}.",
+        "Evidence:\n" + "\n".join(evidence),
+    ]
+    if result.verdict == "RED":
+        parts.append("Remediation: " + rule.remediation)
+    parts.append(result.verdict)
+    return "\n\n".join(parts)
+
+
+def assess_with_rules(criterion, store):
+    """Formatted verdict for a criterion decided by a rule, or None to fall back to the agent team."""
+    result = evaluate_rules(criterion, get_fact_table(store))
+    return format_rule_result(result) if result else None
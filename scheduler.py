@@ -0,0 +1,175 @@
+import asyncio
+import os
+import threading
+import traceback
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from job_store import HEARTBEAT_SECONDS
+
+# Job scheduling for one web worker. Jobs wait in a bounded queue and at most
+# MAX_ACTIVE_JOBS run at once, all on a single scheduler thread and event loop.
+# Across those jobs, team runs share SCHEDULER_WORKERS slots, handed out round-robin
+# between the jobs waiting for one, so a big annex can't starve a small one. Once
+# the queue is full, new jobs are turned away (HTTP 429) until there is room.
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "8"))
+MAX_ACTIVE_JOBS = int(os.getenv("MAX_ACTIVE_JOBS", "4"))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "16"))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "30"))
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after=RETRY_AFTER_SECONDS):
+        super().__init__("The job queue is full, try again later")
+        self.retry_after = retry_after
+
+
+class FairSlots:
+    """
+    A semaphore shared by several jobs. When slots are short, a released slot goes
+    to the next job in rotation that is waiting, rather than to the longest waiter.
+    Only used from the scheduler's event loop.
+    """
+
+    def __init__(self, size):
+        self.free = size
+        self.waiters = OrderedDict()  # job id -> waiting futures, in rotation order
+
+    async def acquire(self, job_id):
+        if self.free > 0 and not self.waiters:
+            self.free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(job_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Handed a slot just as we were cancelled: pass it on
+                self.release()
+            else:
+                self._forget(job_id, future)
+            raise
+
+    def release(self):
+        while self.waiters:
+            job_id, waiting = self.waiters.popitem(last=False)
+            future = waiting.popleft()
+            if waiting:
+                # To the back of the rotation with its remaining waiters
+                self.waiters[job_id] = waiting
+            if not future.done():
+                future.set_result(None)
+                return
+        self.free += 1
+
+    def _forget(self, job_id, future):
+        waiting = self.waiters.get(job_id)
+        if waiting is None:
+            return
+        try:
+            waiting.remove(future)
+        except ValueError:
+            pass
+        if not waiting:
+            del self.waiters[job_id]
+
+    @asynccontextmanager
+    async def slot(self, job_id):
+        await self.acquire(job_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class JobScheduler:
+    def __init__(self, run_job, jobs, workers=SCHEDULER_WORKERS, max_active=MAX_ACTIVE_JOBS, max_queued=MAX_QUEUED_JOBS):
+        # run_job(job_id, slots) is awaited on the scheduler loop for each job
+        self.run_job = run_job
+        self.jobs = jobs
+        self.workers = workers
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.slots = None
+        self._queue = deque()
+        self._active = set()
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def full(self):
+        with self._lock:
+            return self._full()
+
+    def _full(self):
+        # Jobs about to start on a free run slot don't count against the queue
+        return len(self._queue) >= self.max_queued + max(0, self.max_active - len(self._active))
+
+    def submit(self, job_id):
+        """Queue a job to run; raises QueueFull when there is no room."""
+        with self._lock:
+            if job_id in self._active or job_id in self._queue:
+                return
+            if self._full():
+                raise QueueFull()
+            self._queue.append(job_id)
+            loop = self._ensure_loop()
+        loop.call_soon_threadsafe(self._dispatch)
+
+    def remove(self, job_id):
+        """Take a job off the queue before it starts; False if it isn't queued."""
+        with self._lock:
+            if job_id not in self._queue:
+                return False
+            self._queue.remove(job_id)
+            return True
+
+    def position(self, job_id):
+        """0 while the job runs here, its 1-based place in the queue, or None if this worker doesn't have it."""
+        with self._lock:
+            if job_id in self._active:
+                return 0
+            if job_id in self._queue:
+                return self._queue.index(job_id) + 1
+            return None
+
+    def _ensure_loop(self):
+        # Called with the lock held
+        if self._loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=self._serve, args=(loop,), name="job-scheduler", daemon=True).start()
+            self._loop = loop
+        return self._loop
+
+    def _serve(self, loop):
+        asyncio.set_event_loop(loop)
+        self.slots = FairSlots(self.workers)
+        loop.create_task(self._keep_queued_alive())
+        loop.run_forever()
+
+    def _dispatch(self):
+        with self._lock:
+            while self._queue and len(self._active) < self.max_active:
+                job_id = self._queue.popleft()
+                self._active.add(job_id)
+                self._loop.create_task(self._run(job_id))
+
+    async def _run(self, job_id):
+        try:
+            await self.run_job(job_id, self.slots)
+        except Exception:
+            # run_job has already marked the job failed; keep the scheduler going
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+            self._dispatch()
+
+    async def _keep_queued_alive(self):
+        # A queued job has no runner heartbeating it yet, but isn't orphaned either
+        while True:
+            with self._lock:
+                queued = list(self._queue)
+            for job_id in queued:
+                self.jobs.heartbeat(job_id)
+            await asyncio.sleep(HEARTBEAT_SECONDS)
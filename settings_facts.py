@@ -0,0 +1,222 @@
+import json
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+
+from blueprint_chunks import DSC_RESOURCE_RE, REG_PATH_RE
+
+# Deterministic fact table extracted from the blueprints: every registry value
+# written by a configscript, every Intune settingDefinitionId with its value and
+# every top-level DSC resource property, each with its source file and line.
+# The rule engine (rules.py) answers simple criteria straight from these facts.
+
+REG_CALL_RE = re.compile(r"(?:New|Set)-ItemProperty\b(.*)", re.IGNORECASE)
+REG_ARG_RE = re.compile(r"-(Path|Name|Value|PropertyType|Type)\s+(\"[^\"]*\"|'[^']*'|\S+)", re.IGNORECASE)
+DSC_PROPERTY_RE = re.compile(r"^\s*([A-Za-z][A-Za-z0-9]*)\s*=\s*(.*?);?\s*$")
+DSC_SETTING_ID_RE = re.compile(r"^\s*SettingDefinitionId\s*=\s*'([^']*)'")
+DSC_VALUE_RE = re.compile(r"^\s*(?:Value|IntValue|StringValue)\s*=\s*'?([^']*)'?\s*$")
+JSON_SETTING_ID_RE = re.compile(r'"settingDefinitionId"\s*:\s*"([^"]+)"')
+
+
+@dataclass(frozen=True)
+class Fact:
+    kind: str  # "registry", "intune" or "dsc"
+    key: str  # registry key path, settingDefinitionId or DSC resource type
+    name: str  # registry value name, setting id (again) or DSC property
+    value: str
+    doc_id: str
+    line: int
+    resource: str = ""  # DSC resource instance name / Intune policy name
+
+    def location(self) -> str:
+        return f"{self.doc_id}:{self.line}"
+
+
+def _unquote(value: str) -> str:
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value
+
+
+def extract_registry_facts(doc_id, lines):
+    paths = [m.group(1) for line in lines for m in [REG_PATH_RE.search(line)] if m]
+    facts = []
+    for n, line in enumerate(lines):
+        call = REG_CALL_RE.search(line)
+        if not call:
+            continue
+        args = {k.lower(): _unquote(v) for k, v in REG_ARG_RE.findall(call.group(1))}
+        if "name" not in args:
+            continue
+        targets = [args["path"]] if args.get("path") and not args["path"].startswith("$") else paths
+        for path in targets or [""]:
+            facts.append(Fact("registry", path, args["name"], args.get("value", ""), doc_id, n + 1))
+    return facts
+
+
+def extract_intune_json_facts(doc_id, text, lines):
+    try:
+        policy = json.loads(text)
+    except ValueError:
+        return []
+    line_numbers = defaultdict(list)
+    for n, line in enumerate(lines):
+        for setting_id in JSON_SETTING_ID_RE.findall(line):
+            line_numbers[setting_id].append(n + 1)
+    policy_name = policy.get("name") or policy.get("displayName") or ""
+    facts = []
+
+    def visit(instance):
+        if not isinstance(instance, dict):
+            return
+        setting_id = instance.get("settingDefinitionId")
+        children = []
+        value = ""
+        if "choiceSettingValue" in instance and instance["choiceSettingValue"]:
+            value = str(instance["choiceSettingValue"].get("value", ""))
+            children = instance["choiceSettingValue"].get("children") or []
+        elif "simpleSettingValue" in instance and instance["simpleSettingValue"]:
+            value = str(instance["simpleSettingValue"].get("value", ""))
+        elif "simpleSettingCollectionValue" in instance:
+            value = "; ".join(str(v.get("value", "")) for v in instance["simpleSettingCollectionValue"] or [])
+        elif "groupSettingCollectionValue" in instance:
+            for group in instance["groupSettingCollectionValue"] or []:
+                children.extend(group.get("children") or [])
+        if setting_id:
+            found = line_numbers.get(setting_id)
+            line = found.pop(0) if found else 0
+            facts.append(Fact("intune", setting_id, setting_id, value, doc_id, line, policy_name))
+        for child in children:
+            visit(child)
+
+    for setting in policy.get("settings", []):
+        visit(setting.get("settingInstance"))
+    return facts
+
+
+def extract_dsc_facts(doc_id, lines):
+    facts = []
+    i = 0
+    while i < len(lines):
+        match = DSC_RESOURCE_RE.match(lines[i])
+        if not match or i + 1 >= len(lines) or lines[i + 1].strip() != "{":
+            i += 1
+            continue
+        indent, resource, name = len(match.group(1)), match.group(2), match.group(3)
+        end = i + 2
+        while end < len(lines) and not (lines[end].strip() == "}" and _indent(lines[end]) == indent):
+            line = lines[end]
+            if _indent(line) == indent + 4:
+                prop = DSC_PROPERTY_RE.match(line)
+                if prop:
+                    facts.append(Fact("dsc", resource, prop.group(1), _unquote(prop.group(2)), doc_id, end + 1, name))
+            setting = DSC_SETTING_ID_RE.match(line)
+            if setting:
+                value = _dsc_setting_value(lines, end)
+                facts.append(Fact("intune", setting.group(1), setting.group(1), value, doc_id, end + 1, name))
+            end += 1
+        i = end + 1
+    return facts
+
+
+def _dsc_setting_value(lines, n):
+    # A settings catalog instance nested in a DSC resource holds its value one level
+    # deeper than its SettingDefinitionId, either before or after it depending on
+    # the value type; stay inside the instance (indent >= the id's own indent)
+    indent = _indent(lines[n])
+    for step in (-1, 1):
+        k = n + step
+        while 0 <= k < len(lines) and (not lines[k].strip() or _indent(lines[k]) >= indent):
+            value = DSC_VALUE_RE.match(lines[k])
+            if value and _indent(lines[k]) == indent + 4:
+                return value.group(1)
+            k += step
+    return ""
+
+
+def _indent(line):
+    return len(line) - len(line.lstrip())
+
+
+def extract_facts(doc_id, text):
+    lines = text.split("\n")
+    if "Configuration M365TenantConfig" in text:
+        return extract_dsc_facts(doc_id, lines)
+    if text.lstrip().startswith("{") and '"settings"' in text:
+        return extract_intune_json_facts(doc_id, text, lines)
+    return extract_registry_facts(doc_id, lines)
+
+
+class FactTable:
+    """Facts for the whole blueprint corpus, indexed by registry value name, setting id and DSC property."""
+
+    def __init__(self, facts=()):
+        self.facts = []
+        self.by_name = defaultdict(list)
+        self.by_location = defaultdict(list)
+        for fact in facts:
+            self.add(fact)
+
+    def add(self, fact):
+        self.facts.append(fact)
+        self.by_name[fact.name.lower()].append(fact)
+        self.by_location[(fact.doc_id, fact.line)].append(fact)
+
+    def at(self, doc_id, line):
+        return self.by_location.get((doc_id, line), [])
+
+    def registry(self, name, path_pattern=None):
+        matches = [f for f in self.by_name.get(name.lower(), []) if f.kind == "registry"]
+        if path_pattern:
+            matches = [f for f in matches if re.search(path_pattern, f.key, re.IGNORECASE)]
+        return matches
+
+    def intune(self, setting_pattern):
+        regex = re.compile(setting_pattern, re.IGNORECASE)
+        return [f for f in self.facts if f.kind == "intune" and regex.search(f.key)]
+
+    def dsc(self, resource_pattern, prop):
+        regex = re.compile(resource_pattern, re.IGNORECASE)
+        return [f for f in self.by_name.get(prop.lower(), []) if f.kind == "dsc" and regex.search(f.key)]
+
+
+def build_fact_table(store):
+    table = FactTable()
+    for doc_id in store.ids():
+        for fact in extract_facts(doc_id, store.get(doc_id)):
+            table.add(fact)
+    return table
+
+
+# Facts per file, keyed on (blueprint id, mtime/size stamp), so a changed blueprint
+# is the only one parsed again; and tables by store version, since jobs pinned to
+# different versions can be running at once
+_doc_facts = {}
+_tables = {}
+_table_lock = threading.Lock()
+
+
+def get_fact_table(store) -> FactTable:
+    # Reassembled for each store version; only new or changed files are parsed
+    with _table_lock:
+        table = _tables.get(store.version)
+        if table is not None:
+            return table
+        table = FactTable()
+        keys = []
+        for doc_id in store.ids():
+            key = (doc_id, store.stamp(doc_id))
+            if key not in _doc_facts:
+                _doc_facts[key] = extract_facts(doc_id, store.get(doc_id))
+            keys.append(key)
+            for fact in _doc_facts[key]:
+                table.add(fact)
+        if len(_doc_facts) > 2 * len(keys) + 64:
+            for key in set(_doc_facts) - set(keys):
+                del _doc_facts[key]
+        if len(_tables) >= 4:
+            _tables.pop(min(_tables))
+        _tables[store.version] = table
+        return table
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import threading
+
+# Criteria ingestion for uploaded annexes. Rows are streamed with openpyxl's
+# read-only mode on a worker thread and handed to the job runner in batches, so
+# evaluation starts on the first criteria while the rest of the workbook is read.
+# openpyxl is imported on first use, so it isn't paid for at server start.
+CRITERIA_COLUMN = os.getenv("CRITERIA_COLUMN", "O")
+CRITERIA_MIN_ROW = int(os.getenv("CRITERIA_MIN_ROW", "2"))
+BATCH_SIZE = 50
+
+
+def column_index(column) -> int:
+    """Zero-based index for a column letter ("O") or one-based number ("15")."""
+    column = str(column).strip()
+    if column.isdigit():
+        return int(column) - 1
+    from openpyxl.utils import column_index_from_string
+
+    return column_index_from_string(column.upper()) - 1
+
+
+def iter_criteria(path, column=CRITERIA_COLUMN, min_row=CRITERIA_MIN_ROW):
+    """Non-empty criteria from the active sheet, whitespace-trimmed, first occurrence only."""
+    import openpyxl
+
+    index = column_index(column)
+    seen = set()
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in wb.active.iter_rows(min_row=min_row, values_only=True):
+            if index >= len(row) or row[index] is None:
+                continue
+            criterion = str(row[index]).strip()
+            key = " ".join(criterion.split()).lower()
+            if not criterion or key in seen:
+                continue
+            seen.add(key)
+            yield criterion
+    finally:
+        wb.close()
+
+
+async def stream_criteria(path, column=CRITERIA_COLUMN, min_row=CRITERIA_MIN_ROW, batch_size=BATCH_SIZE):
+    """Batches of criteria, read off the event loop. The first criterion is sent on its own."""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+    cancelled = threading.Event()
+
+    def produce():
+        try:
+            batch = []
+            first = True
+            for criterion in iter_criteria(path, column, min_row):
+                if cancelled.is_set():
+                    return
+                batch.append(criterion)
+                if first or len(batch) >= batch_size:
+                    loop.call_soon_threadsafe(queue.put_nowait, batch)
+                    batch = []
+                    first = False
+            if batch:
+                loop.call_soon_threadsafe(queue.put_nowait, batch)
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    reader = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Stop reading if the consumer gave up early
+        cancelled.set()
+        await reader
@@ -11,6 +11,8 @@ from main import planning_agent, blueprint_search_agent, data_analyst_agent, rem
 from autogen_agentchat.teams import SelectorGroupChat
 from autogen_agentchat.ui import Console
 from datetime import datetime
+from reports import REPORT_HEAD, REPORT_TAIL, html_summary
+from result_records import ResultRecord, Verdict
 
 templates = Jinja2Templates(directory="templates")
 app = FastAPI()
@@ -51,106 +53,14 @@ def upload(request: Request, file: UploadFile = File(...)):
     return templates.TemplateResponse("results.html", {"request": request, "results": results, "report_path": output_path})
 
 def render_html_report(results):
-    # html = '''<html><head><title>Guideline Results</title><style>body {font-family: 'Segoe UI', Arial, sans-serif; background: #f8f9fa; margin: 0; padding: 2em;} h1 {color: #2c3e50; margin-bottom: 1em;} ul {list-style: none; padding: 0;} li {background: #fff; margin-bottom: 1em; padding: 1em; border-radius: 8px; box-shadow: 0 2px 6px rgba(0,0,0,0.07);} strong {color: #2980b9; font-size: 1.1em;} .summary {display: block; margin-top: 0.5em; color: #444; white-space: pre-line;}</style></head><body><h1>Guideline Results</h1><ul>'''
-    # for line in results:
-    #     green = "GREEN" in line
-    #     guideline, summary = line.split(":", 1) if ":" in line else (line, "")
-    # html += "</ul></body></html>"
-    # return html
-        import markdown2
-        html = '''<!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <title>Guideline Results</title>
-        <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;600&display=swap" rel="stylesheet">
-        <style>
-            body {
-                font-family: 'Inter', 'Segoe UI', Arial, sans-serif;
-                background: linear-gradient(120deg, #f8f9fa 0%, #e3e6ea 100%);
-                margin: 0;
-                padding: 2em;
-            }
-            h1 {
-                color: #1a2636;
-                margin-bottom: 2em;
-                font-weight: 600;
-                font-size: 2.2em;
-            }
-            ul {
-                list-style: none;
-                padding: 0;
-                max-width: 900px;
-                margin: 0 auto;
-            }
-            li {
-                background: #fff;
-                margin-bottom: 2em;
-                padding: 2em 2em 1em 2em;
-                border-radius: 16px;
-                box-shadow: 0 4px 24px rgba(30,40,60,0.08);
-                border-left: 8px solid #4fd18b;
-                transition: box-shadow 0.2s;
-            }
-            li.red {
-                border-left: 8px solid #e74c3c;
-            }
-            .guideline {
-                color: #2980b9;
-                font-size: 1.2em;
-                font-weight: 600;
-                margin-bottom: 1em;
-                display: block;
-            }
-            .summary {
-                margin-top: 0.5em;
-                color: #222;
-                font-size: 1em;
-            }
-            @media (max-width: 600px) {
-                body { padding: 0.5em; }
-                ul { padding: 0; }
-                li { padding: 1em; }
-            }
-            pre, code {
-                background: #f4f6fa;
-                border-radius: 6px;
-                padding: 0.2em 0.5em;
-                font-size: 0.95em;
-            }
-            blockquote {
-                border-left: 4px solid #4fd18b;
-                margin: 1em 0;
-                padding-left: 1em;
-                color: #555;
-                background: #f8f9fa;
-            }
-            table {
-                border-collapse: collapse;
-                width: 100%;
-                margin: 1em 0;
-            }
-            th, td {
-                border: 1px solid #e3e6ea;
-                padding: 0.5em 1em;
-            }
-            th {
-                background: #f4f6fa;
-            }
-        </style>
-    </head>
-    <body>
-        <h1>Guideline Results</h1>
-        <ul>
-    '''
-        for line in results:
-            green = "GREEN" in line
-            guideline, summary = line.split(":", 1) if ":" in line else (line, "")
-            summary_html = markdown2.markdown(summary.strip())
-            li_class = "" if green else "red"
-            html += f'<li class="{li_class}"><span class="guideline">{guideline.strip()}</span><div class="summary">{summary_html}</div></li>'
-        html += "</ul></body></html>"
-        return html
+    import markdown2
+    items = []
+    for record in results:
+        summary_html = markdown2.markdown(record.summary)
+        li_class = "" if record.verdict == Verdict.GREEN else "red"
+        items.append(f'<li class="{li_class}"><span class="guideline">{record.criterion}</span><div class="summary">{summary_html}</div></li>')
+    # Joined once rather than concatenated item by item
+    return REPORT_HEAD + html_summary(None) + "".join(items) + REPORT_TAIL
 
 async def run_team(criteria):
     results = []
@@ -170,9 +80,9 @@ async def run_team(criteria):
         if hasattr(result, "messages") and result.messages:
             final_message = result.messages[-2].content
             final_message += "\n\n" + result.messages[-1].content
-            results.append(f"{guideline_description}: {final_message}")
+            results.append(ResultRecord.create(guideline_description, final_message))
         else:
-            results.append(f"{guideline_description}: [No summary found]")
+            results.append(ResultRecord.create(guideline_description, "[No summary found]"))
     return results
 
 @app.get("/report/{filename}")
@@ -1,149 +1,635 @@
+import time
+_import_started = time.perf_counter()
 import os
 import shutil
+import threading
 import uuid
-import docx
-from fastapi import FastAPI, File, UploadFile, Request, BackgroundTasks, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import APIRouter, FastAPI, File, UploadFile, Request, BackgroundTasks, Form
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-import openpyxl
 import asyncio
-import threading
-from main import planning_agent, blueprint_search_agent, data_analyst_agent, remediation_agent, model_client, termination, selector_prompt, selector_func
-from autogen_agentchat.teams import SelectorGroupChat
-from autogen_agentchat.ui import Console
-from datetime import datetime
-import markdown2
+from contextlib import nullcontext
+import main
+from main import build_team, prefetch_evidence, merge_evidence, with_evidence
+from evaluation import render_result_item, format_result, format_batch_result, rule_result, stored_result, save_result, criterion_task, analyst_cascade
+from settings_facts import get_fact_table
+from result_records import ResultRecord, Verdict
+from blueprint_store import get_blueprint_store, watch_blueprints, BLUEPRINT_MAX_BYTES
+from blueprint_index import get_blueprint_index, pin_blueprints
+from assessment_store import collect_evidence, record_evidence
+from autogen_core import CancellationToken
+import json
+from job_store import get_job_store, HEARTBEAT_SECONDS
+from spreadsheet import stream_criteria, column_index, CRITERIA_COLUMN
+from metrics import REGISTRY, RunStats, collect_stats, record_turns, record_job
+from reports import get_report_cache, report_etag, REPORT_FORMATS, DOCX_AVAILABLE
+from scheduler import JobScheduler, QueueFull
+from criteria_groups import BATCH_MAX_SIZE, group_criteria, batch_task, window_sizes
 
 templates = Jinja2Templates(directory="templates")
-app = FastAPI()
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Routes are collected here and mounted by create_app()
+router = APIRouter()
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-progress_store = {}
-stop_requested = False
+# Jobs, their results and stop flags live in SQLite so every worker sees the same state
+jobs = get_job_store()
+# Export artifacts, appended to as results are stored
+report_cache = get_report_cache()
+# Number of criteria evaluated at once; 1 keeps the original one-at-a-time runner
+CRITERIA_CONCURRENCY = int(os.environ.get("CRITERIA_CONCURRENCY", "4"))
+# Most criteria a single upload may ask to evaluate at once; larger values are capped
+MAX_CRITERIA_CONCURRENCY = int(os.environ.get("MAX_CRITERIA_CONCURRENCY", str(CRITERIA_CONCURRENCY)))
+# Build the blueprint index, model clients and agents in the background at startup
+# rather than when the first job needs them; 0 leaves it all to first use
+WARM_UP = os.environ.get("WARM_UP", "1") != "0"
 
-@app.get("/", response_class=HTMLResponse)
+@router.get("/", response_class=HTMLResponse)
 def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
-from fastapi.responses import FileResponse
-import tempfile
-try:
-    from docx import Document
-except ImportError:
-    Document = None
-# Add endpoint to generate and serve DOCX file
-@app.get("/download-docx/{task_id}")
-def download_docx(task_id: str):
-    if Document is None:
+from fastapi.responses import FileResponse, Response
+# Add endpoint to serve the DOCX report
+@router.get("/download-docx/{task_id}")
+def download_docx(task_id: str, request: Request):
+    return download_report(task_id, "docx", request)
+
+
+@router.get("/report/{task_id}/{fmt}")
+def download_report(task_id: str, fmt: str, request: Request):
+    # A plain (threadpool) endpoint: catching up and saving the DOCX never blocks the event loop
+    job = jobs.get(task_id)
+    if job is None or fmt not in REPORT_FORMATS:
+        return JSONResponse({"error": "Unknown task or report format"}, status_code=404)
+    if fmt == "docx" and not DOCX_AVAILABLE:
         return JSONResponse({"error": "python-docx not installed"}, status_code=500)
-    items = progress_store.get(task_id, [])
-    doc = Document()
-    doc.add_heading("Remediation Results", 0)
-    for line in items:
-        if line.startswith("__COMPLETE__:"):
-            continue
-        guideline, summary = line.split(":", 1) if ":" in line else (line, "")
-        doc.add_heading(guideline.strip(), level=1)
-        doc.add_paragraph(summary.strip())
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-        doc.save(tmp.name)
-        tmp_path = tmp.name
-    return FileResponse(tmp_path, media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document", filename="remediation_results.docx")
-
-
-@app.post("/upload", response_class=JSONResponse)
-async def upload(request: Request, background_tasks: BackgroundTasks = None, file: UploadFile = File(None), use_default: str = Form(None)):
+    report = report_cache.get(task_id)
+    tag = report_etag(fmt, report.catch_up(jobs), job.status, job.summary, job.replaced)
+    headers = {"ETag": tag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match == "*" or tag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    media_type = REPORT_FORMATS[fmt]
+    if fmt == "docx":
+        return FileResponse(report.docx(jobs, job, tag), media_type=media_type, filename="remediation_results.docx", headers=headers)
+    if fmt != "html":
+        headers["Content-Disposition"] = f'attachment; filename="remediation_results.{fmt}"'
+    chunks = {"html": report.html_chunks, "json": report.json_chunks, "csv": report.csv_chunks}[fmt]
+    return StreamingResponse(chunks(job), media_type=media_type, headers=headers)
+
+
+@router.post("/upload", response_class=JSONResponse)
+async def upload(request: Request, background_tasks: BackgroundTasks = None, file: UploadFile = File(None), use_default: str = Form(None), concurrency: int = Form(None), no_cache: str = Form(None), criteria_column: str = Form(None)):
+    criteria_column = criteria_column or CRITERIA_COLUMN
+    try:
+        column_index(criteria_column)
+    except ValueError:
+        return {"error": f"Invalid criteria column: {criteria_column}"}
+    if concurrency is not None and concurrency < 1:
+        return {"error": f"Invalid concurrency: {concurrency}; it must be at least 1"}
+    concurrency = min(concurrency or CRITERIA_CONCURRENCY, max(1, MAX_CRITERIA_CONCURRENCY))
+    if scheduler.full():
+        # Checked before the upload is saved; submit() below re-checks it
+        return queue_full_response(QueueFull())
+    task_id = str(uuid.uuid4())
     if use_default == '1':
         file_path = os.path.join("input_spreadsheet", "remediation_annex.xlsx")
     else:
         if file is None:
             return {"error": "No file uploaded and 'use default' not selected."}
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    wb = openpyxl.load_workbook(file_path, data_only=True)
-    ws = wb.active
+        file_path = os.path.join(UPLOAD_DIR, f"{task_id}_{os.path.basename(file.filename)}")
+        # Copy on a worker thread so a large upload doesn't hold up the event loop
+        await asyncio.to_thread(save_upload, file.file, file_path)
+    # The workbook is read by the job itself, so criteria start running while later rows are parsed
+    jobs.create(task_id, [], concurrency, no_cache != '1', source=file_path, criteria_column=criteria_column)
+    try:
+        scheduler.submit(task_id)
+    except QueueFull as e:
+        jobs.fail(task_id, str(e))
+        return queue_full_response(e)
+    return {"task_id": task_id, "queue_position": scheduler.position(task_id)}
+
+
+def queue_full_response(error):
+    return JSONResponse({"error": str(error)}, status_code=429, headers={"Retry-After": str(error.retry_after)})
+
+
+def save_upload(source, file_path):
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer)
+
+
+def decided_result(guideline_description, reuse=True):
+    """A rule's or a stored verdict for the criterion, or None when the team has to run."""
+    fast = rule_result(guideline_description)
+    if fast is None and reuse:
+        fast = stored_result(guideline_description)
+    return fast
+
+
+def append_result(task_id, record, criterion_index=None):
+    # Rendered once here; /progress and /events only ever send the stored HTML
+    jobs.append(task_id, record, render_result_item(record), criterion_index)
+    try:
+        report_cache.get(task_id).catch_up(jobs)
+    except OSError as e:
+        # Not fatal: the report catches up again when it is downloaded
+        print(f"Report update failed for {task_id}: {e}")
+
+
+async def run_team(task_id, slots=None):
+    """Run a job to the end; with the scheduler's slots, each team run first waits for a slot."""
+    job = jobs.get(task_id)
+    # The whole job sees the blueprints as they were when it started, whatever is uploaded meanwhile
+    with pin_blueprints():
+        # Bypassing the cache means talking to Azure directly and re-evaluating every
+        # criterion, rather than reusing verdicts whose evidence is unchanged
+        client = main.get_model_router(job.use_cache)
+        # A resumed job skips the criteria it already has results for
+        pending = job_criteria(job, jobs.completed_indices(task_id))
+        # Totals carry over when a job is resumed
+        stats = RunStats.from_dict(job.summary or {})
+        heartbeat = asyncio.create_task(keep_alive(task_id, stats))
+        try:
+            if job.concurrency <= 1:
+                await run_team_sequential(pending, task_id, client, job.use_cache, stats, slots)
+            else:
+                await run_team_parallel(pending, task_id, job.concurrency, client, job.use_cache, stats, slots)
+        except Exception as e:
+            jobs.fail(task_id, f"Job failed: {e}")
+            record_job("failed")
+            raise
+        finally:
+            heartbeat.cancel()
+            await pending.aclose()
+            jobs.set_summary(task_id, stats.as_dict())
+        # Signal completion explicitly; /progress and /events report it alongside the items
+        stopped = jobs.stop_requested(task_id)
+        jobs.finish(task_id, "Stopped by user." if stopped else "All criteria processed.")
+        record_job("stopped" if stopped else "complete")
+
+
+async def job_criteria(job, done):
+    """(index, criterion) pairs still to evaluate, streamed from the workbook on the first run."""
+    if job.ingested:
+        for index, criterion in enumerate(job.criteria):
+            if index not in done:
+                yield index, criterion
+        return
+    # Reading is deterministic, so a job resumed mid-ingestion gets the same indices again
     criteria = []
-    for row in ws.iter_rows(min_row=2):
-        val = row[14].value
-        if val and str(val).strip():
-            criteria.append(str(val).strip())
-    task_id = str(uuid.uuid4())
-    progress_store[task_id] = []
-    background_tasks.add_task(run_team_background, criteria, task_id)
-    return {"task_id": task_id}
-
-def render_result_item(line):
-    guideline, summary = line.split(":", 1) if ":" in line else (line, "")
-    summary_clean = summary.strip()
-    # Do NOT remove TERMINATE so polling can detect completion
-    paragraphs = [p.strip() for p in summary_clean.split("\n") if p.strip()]
-    last_two = paragraphs[-2:] if len(paragraphs) >= 2 else paragraphs
-    color = None
-    for p in last_two:
-        if "GREEN" in p:
-            color = "green"
-        if "RED" in p:
-            color = "red"
-    li_class = "" if color == "green" else "red"
-    summary_html = markdown2.markdown(summary_clean)
-    return f'<li class="{li_class}"><span class="guideline">{guideline.strip()}</span><div class="summary">{summary_html}</div></li>'
-
-
-
-async def run_team(criteria, task_id):
-    global stop_requested
+    async for batch in stream_criteria(job.source, job.criteria_column or CRITERIA_COLUMN):
+        for criterion in batch:
+            if len(criteria) not in done:
+                yield len(criteria), criterion
+            criteria.append(criterion)
+        jobs.set_criteria(job.job_id, criteria, ingested=False)
+    jobs.set_criteria(job.job_id, criteria, ingested=True)
+
+
+async def keep_alive(task_id, stats):
+    # Lets other workers tell a running job from one whose worker died, and
+    # keeps the job's running totals visible to them
+    while True:
+        jobs.heartbeat(task_id)
+        jobs.set_summary(task_id, stats.as_dict())
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+
+
+def team_slot(slots, task_id):
+    return slots.slot(task_id) if slots is not None else nullcontext()
+
+
+async def run_team_sequential(pending, task_id, client, reuse=True, job_stats=None, slots=None):
     # Create a fresh team and console for each run
-    team = SelectorGroupChat(
-        [planning_agent, blueprint_search_agent, data_analyst_agent, remediation_agent],
-        model_client=model_client,
-        termination_condition=termination,
-        selector_prompt=selector_prompt,
-        selector_func=selector_func,
-        allow_repeated_speaker=True,
-        max_turns=15,
-    )
+    team = build_team(max_turns=15, client=client)
+    cascade = analyst_cascade(client)
     from autogen_agentchat.ui import Console
-    for guideline_description in criteria:
-        if stop_requested:
-            progress_store[task_id].append(f"{guideline_description}: [Stopped by user]")
+    # Every job shares this event loop, so rules, stored verdicts, retrieval and the
+    # job store and report writes run on worker threads rather than holding it up
+    async for index, guideline_description in pending:
+        if jobs.stop_requested(task_id):
+            await asyncio.to_thread(append_result, task_id, ResultRecord.stopped(guideline_description), index)
             break
-        task = f"Determine if this criteria has been satisfied with the current setup scripts: '{guideline_description}'"
-        await team.reset()
-        result = await Console(team.run_stream(task=task))
-        if hasattr(result, "messages") and result.messages:
-            remediation_html = ""
-            if "RED" in result.messages[-1].content:
-                remediation_steps = result.messages[-2].content
-                remediation_html = f'<span><small class="remediation-steps">{remediation_steps}</small></span><br>'
-            summary:str = result.messages[-1].content
-            final_message = remediation_html + summary
-            progress_store[task_id].append(f"{guideline_description}: {final_message}")
-        else:
-            progress_store[task_id].append(f"{guideline_description}: [No summary found]")
-    # Add a special event at the end to signal completion, but allow polling to continue
-    progress_store[task_id].append("__COMPLETE__: All criteria processed.")
-    team.reset()
-
-# Wrapper for background task
-def run_team_background(criteria, task_id):
-    global stop_requested
-    stop_requested = False
-    threading.Thread(target=lambda: asyncio.run(run_team(criteria, task_id)), daemon=True).start()
-@app.post("/stop-tasks", response_class=JSONResponse)
-def stop_tasks():
-    global stop_requested
-    stop_requested = True
-    return {"status": "stopping background tasks"}
-
-@app.get("/progress/{task_id}", response_class=JSONResponse)
-def get_progress(task_id: str):
-    items = progress_store.get(task_id, [])
-    html_items = [render_result_item(line) for line in items if not line.startswith("__COMPLETE__:")]
-    # Always return items, never signal done
-    return {"items": html_items}
+        with collect_stats(into=job_stats) as stats:
+            fast = await asyncio.to_thread(decided_result, guideline_description, reuse)
+            if fast is not None:
+                stats.path = fast.path
+                await asyncio.to_thread(append_result, task_id, fast.timed(stats.elapsed()), index)
+                continue
+            await team.reset()
+            hits = (await asyncio.to_thread(prefetch_evidence, [guideline_description]))[0]
+            async with team_slot(slots, task_id):
+                with collect_evidence() as evidence:
+                    record_evidence(chunk for chunk, _score in hits)
+                    result = await Console(team.run_stream(task=with_evidence(criterion_task(guideline_description), hits)))
+            record_turns(result.messages)
+            record = format_result(guideline_description, result, evidence, cascade).timed(stats.elapsed())
+            await asyncio.to_thread(append_result, task_id, record, index)
+            await asyncio.to_thread(save_result, guideline_description, result, record, evidence)
+    await team.reset()
+
+
+async def run_team_parallel(pending, task_id, concurrency, client, reuse=True, job_stats=None, slots=None):
+    """
+    Evaluate up to `concurrency` criteria at once, each with its own team.
+    Criteria that need the team are grouped with related ones (see criteria_groups),
+    and each group is answered by a single run. Finished results are released to
+    the job store in spreadsheet order. As in run_team_sequential, the blocking
+    work for each criterion runs on worker threads.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    cascade = analyst_cascade(client)
+    results = {}
+    stopped = set()
+    tokens = set()
+    criteria = []
+    window = []
+    prefetched = {}  # position -> blueprint hits retrieved ahead of the team run
+    evaluations = []
+    next_position = 0
+    flushing = asyncio.Lock()
+
+    async def flush():
+        # One flush at a time, so results still reach the job store in order
+        nonlocal next_position
+        async with flushing:
+            while next_position in results:
+                await asyncio.to_thread(append_result, task_id, *results.pop(next_position))
+                next_position += 1
+
+    async def decide_without_team(position, index, guideline_description):
+        # Rules and stored verdicts are answered straight away; True when one applied
+        start = time.perf_counter()
+        fast = await asyncio.to_thread(decided_result, guideline_description, reuse)
+        if fast is None:
+            return False
+        with collect_stats(fast.path, into=job_stats):
+            results[position] = (fast.timed(time.perf_counter() - start), index)
+        await flush()
+        return True
+
+    async def run(task, token, stats):
+        # Returns the team result, or None when the run was stopped by the user
+        tokens.add(token)
+        try:
+            team = build_team(max_turns=15, client=client)
+            result = await team.run(task=task, cancellation_token=token)
+            record_turns(result.messages)
+            return result
+        except asyncio.CancelledError:
+            if not jobs.stop_requested(task_id):
+                raise
+            stats.path = "stopped"
+            return None
+        finally:
+            tokens.discard(token)
+
+    async def evaluate(position, index, guideline_description):
+        async with semaphore, team_slot(slots, task_id):
+            if jobs.stop_requested(task_id):
+                stopped.add(position)
+                return
+            hits = prefetched.pop(position, [])
+            with collect_stats(into=job_stats) as stats:
+                try:
+                    with collect_evidence() as evidence:
+                        record_evidence(chunk for chunk, _score in hits)
+                        task = with_evidence(criterion_task(guideline_description), hits)
+                        result = await run(task, CancellationToken(), stats)
+                    if result is None:
+                        stopped.add(position)
+                    else:
+                        record = format_result(guideline_description, result, evidence, cascade).timed(stats.elapsed())
+                        results[position] = (record, index)
+                        await asyncio.to_thread(save_result, guideline_description, result, record, evidence)
+                except Exception as e:
+                    stats.path = "error"
+                    results[position] = (ResultRecord.error(guideline_description, f"Error evaluating criterion: {e}"), index)
+        await flush()
+
+    async def evaluate_group(group):
+        if len(group) == 1:
+            await evaluate(*group[0])
+            return
+        descriptions = [guideline_description for _, _, guideline_description in group]
+        unanswered = []
+        async with semaphore, team_slot(slots, task_id):
+            if jobs.stop_requested(task_id):
+                stopped.update(position for position, _, _ in group)
+                return
+            # Members handed back to run alone keep their own evidence
+            hits = merge_evidence([prefetched.get(position, []) for position, _, _ in group])
+            with collect_stats(path="batch", into=job_stats, count=len(group)) as stats:
+                try:
+                    with collect_evidence() as evidence:
+                        record_evidence(chunk for chunk, _score in hits)
+                        result = await run(with_evidence(batch_task(descriptions), hits), CancellationToken(), stats)
+                    if result is None:
+                        stopped.update(position for position, _, _ in group)
+                        return
+                    records = format_batch_result(descriptions, result, evidence, cascade)
+                    for (position, index, guideline_description), record in zip(group, records):
+                        if record is None:
+                            unanswered.append((position, index, guideline_description))
+                            continue
+                        prefetched.pop(position, None)
+                        results[position] = (record.timed(stats.elapsed()), index)
+                        # The group shares its evidence, so any of it changing re-opens every member
+                        await asyncio.to_thread(save_result, guideline_description, result, record, evidence)
+                    stats.count -= len(unanswered)
+                except Exception as e:
+                    stats.path = "error"
+                    for position, index, guideline_description in group:
+                        results[position] = (ResultRecord.error(guideline_description, f"Error evaluating criterion: {e}"), index)
+        await flush()
+        # Criteria the summary didn't give a verdict for are evaluated on their own
+        await asyncio.gather(*(evaluate(*item) for item in unanswered))
+
+    def prefetch_and_group(items):
+        # The whole window's evidence is scored in one batched pass before any team starts
+        hits = prefetch_evidence([guideline_description for _, _, guideline_description in items])
+        return hits, group_criteria(items, get_blueprint_index(get_blueprint_store()), BATCH_MAX_SIZE)
+
+    async def schedule_window():
+        items = list(window)
+        window.clear()
+        hits, groups = await asyncio.to_thread(prefetch_and_group, items)
+        prefetched.update(zip((position for position, _, _ in items), hits))
+        for group in groups:
+            evaluations.append(asyncio.create_task(evaluate_group(group)))
+
+    async def watch_stop():
+        # The stop button only sets the job's flag; cancel its in-flight runs when it does
+        while True:
+            if jobs.stop_requested(task_id):
+                for token in list(tokens):
+                    token.cancel()
+            await asyncio.sleep(0.5)
+
+    watcher = asyncio.create_task(watch_stop())
+    try:
+        # Criteria are scheduled as they are read, not once the whole workbook is parsed;
+        # those needing the team are grouped a window at a time, the windows growing from one
+        sizes = window_sizes()
+        window_size = next(sizes)
+        async for index, guideline_description in pending:
+            position = len(criteria)
+            criteria.append((index, guideline_description))
+            if jobs.stop_requested(task_id):
+                stopped.add(position)
+            elif not await decide_without_team(position, index, guideline_description):
+                window.append((position, index, guideline_description))
+                if len(window) >= window_size:
+                    await schedule_window()
+                    window_size = next(sizes)
+        await schedule_window()
+        await asyncio.gather(*evaluations)
+    finally:
+        watcher.cancel()
+    # Anything held back behind a stopped criterion: keep completed results, and
+    # report the first stopped criterion the same way the sequential runner does
+    reported_stop = False
+    for position in range(next_position, len(criteria)):
+        if position in results:
+            await asyncio.to_thread(append_result, task_id, *results.pop(position))
+        elif position in stopped and not reported_stop:
+            index, guideline_description = criteria[position]
+            await asyncio.to_thread(append_result, task_id, ResultRecord.stopped(guideline_description), index)
+            reported_stop = True
+
+# Jobs are queued and run by a bounded scheduler shared by every user of this worker
+scheduler = JobScheduler(run_team, jobs)
+
+
+def clean_report_files():
+    report_cache.cleanup()
+
+
+def warm_up():
+    # On a thread, so the worker answers requests (and health checks) in the meantime
+    def run():
+        try:
+            seconds = main.warm_up()
+        except Exception as e:
+            # e.g. no Azure settings yet: jobs report it when they first need the client
+            print(f"Warm-up failed: {e}")
+            return
+        REGISTRY.set("app_warmup_seconds", "Time taken to build the blueprint index, model clients and agents", seconds)
+        print(f"Warm-up done in {seconds:.2f}s")
+
+    if WARM_UP:
+        threading.Thread(target=run, name="warm-up", daemon=True).start()
+
+
+def reindex_blueprints(changed=(), removed=()):
+    """Bring the blueprint index and fact table up to date now rather than on the next search."""
+    start = time.perf_counter()
+    store = get_blueprint_store()
+    get_blueprint_index(store)
+    get_fact_table(store)
+    seconds = time.perf_counter() - start
+    REGISTRY.set("blueprint_reindex_seconds", "Time taken by the last blueprint re-index", seconds)
+    print(f"Blueprints at version {store.version}: {len(changed)} changed, {len(removed)} removed, re-indexed in {seconds:.2f}s")
+    return seconds
+
+
+def watch_blueprint_dir():
+    # Files copied into input_files/ (e.g. on a mounted volume) are picked up without a restart
+    watch_blueprints(reindex_blueprints)
+
+
+def resume_orphaned_jobs():
+    # Jobs whose worker died (no heartbeat for a while) are resumed by whichever worker claims them
+    if os.environ.get("RESUME_JOBS", "1") == "0":
+        return
+    for task_id in jobs.orphaned():
+        if jobs.claim(task_id):
+            print(f"Resuming job {task_id}")
+            try:
+                scheduler.submit(task_id)
+            except QueueFull:
+                # Left without a heartbeat, so it is orphaned again and picked up later
+                print(f"Queue full, not resuming job {task_id} yet")
+
+
+@router.post("/stop-tasks", response_class=JSONResponse)
+def stop_tasks(task_id: str = Form(None)):
+    # Only the given job is stopped; other users' jobs keep running
+    if not task_id:
+        return JSONResponse({"error": "task_id is required"}, status_code=400)
+    if not jobs.request_stop(task_id):
+        return JSONResponse({"error": "Job is not running"}, status_code=409)
+    if scheduler.remove(task_id):
+        # Never started, so there is nothing to wind down
+        jobs.finish(task_id, "Stopped by user.")
+    return {"status": "stopping background tasks", "task_id": task_id}
+
+
+@router.post("/resume/{task_id}", response_class=JSONResponse)
+def resume_task(task_id: str):
+    """Continue a stopped, failed or orphaned job from its last completed criterion."""
+    if jobs.get(task_id) is None:
+        return JSONResponse({"error": "Unknown task"}, status_code=404)
+    if scheduler.full():
+        return queue_full_response(QueueFull())
+    if not jobs.claim(task_id):
+        return JSONResponse({"error": "Job is complete or still running"}, status_code=409)
+    try:
+        scheduler.submit(task_id)
+    except QueueFull as e:
+        jobs.fail(task_id, str(e))
+        return queue_full_response(e)
+    return {"status": "resumed", "task_id": task_id, "queue_position": scheduler.position(task_id)}
+
+
+@router.get("/progress/{task_id}", response_class=JSONResponse)
+def get_progress(task_id: str, since: int = 0):
+    job = jobs.get(task_id)
+    if job is None:
+        return {"items": [], "next": 0, "done": False}
+    # Items are rendered once when appended; only the ones past the cursor are sent
+    html_items, next_cursor = jobs.items(task_id, since)
+    return {"items": html_items, "next": next_cursor, "done": job.done, "status": job.status, "summary": job.summary,
+            "queue_position": scheduler.position(task_id), "counts": jobs.counts(task_id)}
+
+
+# Largest page /results returns at once
+RESULTS_PAGE_LIMIT = 500
+
+
+@router.get("/results/{task_id}", response_class=JSONResponse)
+def query_results(task_id: str, verdict: str = "", offset: int = 0, limit: int = 50, html: bool = False):
+    """
+    A page of a job's result records, in spreadsheet order, with the verdict counts.
+    `verdict` takes a comma-separated list (GREEN, RED, UNKNOWN, ERROR, STOPPED);
+    limit=0 returns only the counts.
+    """
+    if jobs.get(task_id) is None:
+        return JSONResponse({"error": "Unknown task"}, status_code=404)
+    verdicts = [v.strip().upper() for v in verdict.split(",") if v.strip()]
+    unknown = [v for v in verdicts if v not in Verdict.__members__]
+    if unknown:
+        return JSONResponse({"error": f"Unknown verdict: {', '.join(unknown)}"}, status_code=400)
+    limit = max(0, min(limit, RESULTS_PAGE_LIMIT))
+    rows, total = jobs.query(task_id, verdicts, offset, limit)
+    items = []
+    for position, criterion_index, record, item_html in rows:
+        item = {"position": position, "criterion_index": criterion_index, **record.as_dict()}
+        if html:
+            item["html"] = item_html
+        items.append(item)
+    next_offset = offset + len(items) if items and offset + len(items) < total else None
+    return {"task_id": task_id, "counts": jobs.counts(task_id), "total": total, "offset": offset, "limit": limit,
+            "next_offset": next_offset, "items": items}
+
+
+@router.get("/blueprints", response_class=JSONResponse)
+def list_blueprints():
+    snapshot = get_blueprint_store().snapshot()
+    index = get_blueprint_index(snapshot)
+    blueprints = [
+        {"id": doc_id, "size": entry["size"], "encoding": entry["encoding"], "chunks": len(index.doc_chunks.get(doc_id, ()))}
+        for doc_id, entry in sorted(snapshot.entries.items())
+    ]
+    return {"version": snapshot.version, "blueprints": blueprints}
+
+
+@router.put("/blueprints/{doc_id:path}", response_class=JSONResponse)
+def upload_blueprint(doc_id: str, file: UploadFile = File(...)):
+    """
+    Add or replace one blueprint file, e.g. PUT /blueprints/intune-config-policies/new.txt.
+    Only that file is decoded, chunked and indexed again; running jobs keep the
+    version they started with.
+    """
+    raw = file.file.read(BLUEPRINT_MAX_BYTES + 1)
+    if len(raw) > BLUEPRINT_MAX_BYTES:
+        return JSONResponse({"error": f"Blueprints are limited to {BLUEPRINT_MAX_BYTES} bytes"}, status_code=413)
+    try:
+        doc_id = get_blueprint_store().put(doc_id, raw)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return blueprint_changed(doc_id, [doc_id], [])
+
+
+@router.delete("/blueprints/{doc_id:path}", response_class=JSONResponse)
+def delete_blueprint(doc_id: str):
+    try:
+        doc_id = get_blueprint_store().delete(doc_id)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except KeyError:
+        return JSONResponse({"error": "Unknown blueprint"}, status_code=404)
+    return blueprint_changed(doc_id, [], [doc_id])
+
+
+def blueprint_changed(doc_id, changed, removed):
+    seconds = reindex_blueprints(changed, removed)
+    snapshot = get_blueprint_store().snapshot()
+    chunks = len(get_blueprint_index(snapshot).doc_chunks.get(doc_id, ()))
+    return {"id": doc_id, "version": snapshot.version, "chunks": chunks, "seconds": round(seconds, 3)}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of this worker's model, agent, tool and criterion counters."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/events/{task_id}")
+async def stream_progress(task_id: str, request: Request, since: int = 0):
+    """Server-Sent Events: one `item` event per result, then a `complete` event."""
+    if jobs.get(task_id) is None:
+        return JSONResponse({"error": "Unknown task"}, status_code=404)
+    # EventSource resends the last id it saw when it reconnects
+    last_event_id = request.headers.get("last-event-id")
+    cursor = int(last_event_id) if last_event_id and last_event_id.isdigit() else since
+
+    async def events():
+        nonlocal cursor
+        position = None
+        while True:
+            job = jobs.get(task_id)
+            if scheduler.position(task_id) != position:
+                position = scheduler.position(task_id)
+                yield f"event: queue\ndata: {json.dumps({'position': position})}\n\n"
+            html_items, next_cursor = jobs.items(task_id, cursor)
+            for offset, html in enumerate(html_items):
+                index = cursor + offset
+                yield f"id: {index + 1}\nevent: item\ndata: {json.dumps({'index': index, 'html': html})}\n\n"
+            cursor = next_cursor
+            if job.done and cursor >= jobs.count(task_id):
+                yield f"event: complete\ndata: {json.dumps({'message': job.message, 'status': job.status, 'total': cursor, 'summary': job.summary})}\n\n"
+                return
+            if await request.is_disconnected():
+                return
+            # Queued jobs are checked more often, so position changes go out promptly
+            await jobs.wait(task_id, cursor, timeout=2.0 if position else 15.0)
+            if cursor == jobs.count(task_id) and not jobs.get(task_id).done:
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def create_app():
+    """
+    The web app. Building it is cheap: the blueprint index, model clients and agents
+    are built by the warm-up thread started on startup, or on first use.
+    """
+    app = FastAPI(on_startup=[clean_report_files, resume_orphaned_jobs, warm_up, watch_blueprint_dir, record_startup_time])
+    app.mount("/static", StaticFiles(directory="static"), name="static")
+    app.include_router(router)
+    return app
+
+
+def record_startup_time():
+    # From this module's import to taking requests; interpreter start-up isn't included
+    seconds = time.perf_counter() - _import_started
+    REGISTRY.set("app_startup_seconds", "Time from importing the web app to serving requests", seconds)
+    print(f"Started in {seconds:.2f}s")
+
+
+# For `uvicorn webserver_ajax:app`; `uvicorn --factory webserver_ajax:create_app` builds a fresh one
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn